@@ -8,7 +8,8 @@ import retrofit2.http.*
 interface LandmarkApi {
     @GET("api/landmarks/")
     suspend fun getLandmarks(
-        @Query("search") search: String? = null
+        @Query("search") search: String? = null,
+        @Query("paginate") paginate: Boolean = false
     ): List<Landmark>
 
     @GET("api/landmarks/{id}/")
@@ -0,0 +1,109 @@
+"""SQLite backend with a per-process connection pool and tuning pragmas.
+
+Use it as ``'ENGINE': 'backend.db.sqlite3'``. Extra keys in ``OPTIONS``:
+
+- ``pool_size``: idle connections kept per database file (0 disables pooling).
+- ``pragmas``: pragmas run on every new connection, merged over ``DEFAULT_PRAGMAS``.
+
+Django closes its connection at the end of each request (``CONN_MAX_AGE = 0``);
+with this backend the underlying sqlite3 connection goes back to the pool
+instead, so the next request skips opening the file and re-running the
+pragmas. In-memory databases are never pooled.
+"""
+import os
+import threading
+
+from django.db.backends.sqlite3 import base
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_PRAGMAS = {
+    # Readers no longer block on a writer, and a writer doesn't wait for readers.
+    'journal_mode': 'WAL',
+    # Durable at checkpoints; a power loss can only drop the last transactions.
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -32 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+class ConnectionPool:
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.idle = []
+
+    def acquire(self):
+        with self.lock:
+            return self.idle.pop() if self.idle else None
+
+    def release(self, conn):
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(conn)
+                return True
+        return False
+
+    def close_all(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name, size):
+    # sqlite3 connections must not cross a fork, so pools are per process.
+    key = (os.getpid(), str(name))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(size)
+        return _pools[key]
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = {**DEFAULT_PRAGMAS, **params.pop('pragmas', {})}
+        self.pool_size = params.pop('pool_size', DEFAULT_POOL_SIZE)
+        return params
+
+    @property
+    def pool(self):
+        if not getattr(self, 'pool_size', 0) or self.is_in_memory_db():
+            return None
+        return get_pool(self.settings_dict['NAME'], self.pool_size)
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        conn = pool.acquire() if pool else None
+        if conn is not None:
+            # Undo anything the previous user may have switched off.
+            conn.execute('PRAGMA foreign_keys = ON')
+            return conn
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _close(self):
+        pool = self.pool
+        # Closed inside atomic(): Django expects the transaction to be gone with
+        # the connection, so don't hand it to the next request.
+        if self.connection is not None and pool is not None and not self.in_atomic_block:
+            with self.wrap_database_errors:
+                if self.connection.in_transaction:
+                    self.connection.rollback()
+                if pool.release(self.connection):
+                    return
+        super()._close()
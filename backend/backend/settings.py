@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'landmarks.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -82,13 +83,64 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# backend.db.sqlite3 pools connections and enables WAL; see its module docstring
+# for the pool_size and pragmas options.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'backend.db.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {'pool_size': 8},
     }
 }
 
+# Read replicas as a comma separated list of SQLite files (kept in sync outside
+# Django, e.g. with Litestream). Landmark API reads are spread over them; see
+# landmarks.routers. Leave unset for the test suite: in-memory test databases
+# can't be mirrored.
+LANDMARK_READ_REPLICAS = []
+for index, path in enumerate(filter(None, os.environ.get('LANDMARK_REPLICA_DATABASES', '').split(','))):
+    alias = f'replica{index + 1}'
+    DATABASES[alias] = {
+        'ENGINE': 'backend.db.sqlite3',
+        'NAME': path,
+        'OPTIONS': {'pool_size': 8, 'pragmas': {'query_only': 'ON'}},
+        'TEST': {'MIRROR': 'default'},
+    }
+    LANDMARK_READ_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['landmarks.routers.ReplicaRouter']
+
+# After a write, the user's reads stay on the primary for this long so they see
+# their own changes while replicas catch up. The pins are kept in this cache
+# alias, which every worker process must share (see CACHES below).
+LANDMARK_REPLICA_PIN_SECONDS = 10
+LANDMARK_REPLICA_PIN_CACHE = 'replica-pins'
+
+
+# Caches
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Landmark read responses are keyed by a per-user collection version and never
+# expire; use FileBasedCache or a shared backend to share entries between workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'landmarks': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'landmark-responses',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    # Read-replica pins: files are shared by all worker processes on this host;
+    # use Redis or Memcached when workers run on several hosts.
+    'replica-pins': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('LANDMARK_REPLICA_PIN_CACHE_DIR') or str(BASE_DIR / 'cache' / 'replica-pins'),
+    },
+}
+
+LANDMARK_RESPONSE_CACHE = 'landmarks'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -135,19 +187,91 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Media is served by landmarks.media.serve_media to URLs the API signs for the
+# landmark's owner; they expire after this many seconds
+LANDMARK_MEDIA_URL_MAX_AGE = 3600
+
+# How serve_media sends files once access is checked: 'django' (FileResponse,
+# sendfile under most WSGI servers), 'x-accel' (nginx, internal location at
+# LANDMARK_MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT) or 'x-sendfile' (Apache, lighttpd)
+LANDMARK_MEDIA_DELIVERY = os.environ.get('LANDMARK_MEDIA_DELIVERY', 'django')
+LANDMARK_MEDIA_ACCEL_PREFIX = '/protected-media/'
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'landmarks.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     )
 }
 
+# Users loaded by CachedJWTAuthentication are kept per process for up to
+# LANDMARK_AUTH_CACHE_TTL seconds; a size of 0 loads the user on every request
+LANDMARK_AUTH_CACHE_SIZE = 10000
+LANDMARK_AUTH_CACHE_TTL = 60
+
+# Set to False to serve GET /api/landmarks/ as a bare array unless a client asks
+# for pages, for deployments where old app builds are still in use
+LANDMARK_LIST_PAGINATION = True
+
+# JSON list/detail reads build responses from values() rows instead of model
+# instances; output is identical, set to False to go through LandmarkSerializer
+LANDMARK_FAST_SERIALIZER = True
+
+# Cached reads are sent gzip- (or, with the brotli package, brotli-) compressed to
+# clients that accept it; compressed bodies are cached next to the plain ones
+LANDMARK_RESPONSE_COMPRESSION = True
+
+# Resumable cover image uploads (/api/uploads/, tus protocol). Partial files live in
+# LANDMARK_UPLOAD_DIR (default MEDIA_ROOT/partial-uploads; keep it on the same
+# filesystem so finished files are moved, not copied) until the upload finishes or
+# has been idle for LANDMARK_UPLOAD_EXPIRY_HOURS, when workers delete them
+LANDMARK_UPLOAD_DIR = None
+LANDMARK_UPLOAD_MAX_SIZE = 50 * 1024 * 1024
+LANDMARK_UPLOAD_EXPIRY_HOURS = 24
+
+# Cards of the server-rendered landmark list are cached as template fragments in
+# the LANDMARK_RESPONSE_CACHE cache; keys include updated_at, so edits show at once
+LANDMARK_FRAGMENT_CACHE_TIMEOUT = 86400  # seconds
+
+# The landmark admin caches the unfiltered row count and the country filter's
+# choices this long, and stops counting filtered lists at LANDMARK_ADMIN_COUNT_LIMIT
+LANDMARK_ADMIN_CACHE_TIMEOUT = 300  # seconds
+LANDMARK_ADMIN_COUNT_LIMIT = 10000
+
+# Deletion log kept for GET /api/landmarks/changes/; older sync tokens get 410 Gone
+LANDMARK_TOMBSTONE_RETENTION_DAYS = 90
+
+# Responses of POST /api/landmarks/batch/ sent with an Idempotency-Key are kept
+# this long so retries are answered without applying the batch twice
+LANDMARK_BATCH_RETENTION_DAYS = 7
+
+# Prometheus metrics at /metrics. With several worker processes, point this at a
+# directory shared by all of them so every scrape reports the combined totals.
+LANDMARK_METRICS_DIR = os.environ.get('LANDMARK_METRICS_DIR') or None
+LANDMARK_METRICS_FLUSH_SECONDS = 1.0
+# Scrapers send `Authorization: Bearer <token>`; without it only staff users can read /metrics
+LANDMARK_METRICS_TOKEN = os.environ.get('LANDMARK_METRICS_TOKEN') or None
+
+# Background jobs (image variants, ...) are queued in the database and run by
+# `manage.py run_workers`. Eager mode runs them in the web process instead, once
+# the request's transaction commits, for development without a worker.
+LANDMARK_JOBS_EAGER = os.environ.get('LANDMARK_JOBS_EAGER', '').lower() in ('1', 'true', 'yes')
+LANDMARK_JOB_WORKERS = 2
+LANDMARK_JOB_RETRY_DELAY = 10  # seconds before the first retry, doubled after each failure
+LANDMARK_JOB_TIMEOUT = 600  # running jobs older than this are assumed lost and retried
+LANDMARK_JOB_RETENTION_DAYS = 7
+
+# Typeahead indexes for GET /api/landmarks/suggest/ are kept in each process's
+# memory for the most recently active users, and rebuilt at least this often
+LANDMARK_SUGGEST_MAX_USERS = 1000
+LANDMARK_SUGGEST_MAX_AGE = 600  # seconds
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # For development only, configure properly for production
 
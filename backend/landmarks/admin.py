@@ -1,12 +1,91 @@
-from django.contrib import admin
-from .models import Landmark
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.helpers import ActionForm
+from django.core.paginator import Paginator
+from django.template.response import TemplateResponse
+from django.utils.functional import cached_property
+
+from . import bulk, search
+from .caching import get_response_cache
+from .models import Landmark, LandmarkFacetCount, User
+
+
+def cache_timeout():
+    return getattr(settings, 'LANDMARK_ADMIN_CACHE_TIMEOUT', 300)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that doesn't COUNT(*) a large table on every changelist load.
+
+    The unfiltered count is cached for ``LANDMARK_ADMIN_CACHE_TIMEOUT`` seconds;
+    filtered and searched lists stop counting at ``LANDMARK_ADMIN_COUNT_LIMIT``
+    rows (pages past that aren't linked) and set ``capped``, which the
+    changelist templates show as "10000+".
+    """
+    capped = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        if not queryset.query.where:
+            key = f'landmarks:admin:count:{queryset.model._meta.label_lower}'
+            return get_response_cache().get_or_set(key, queryset.count, cache_timeout())
+        limit = getattr(settings, 'LANDMARK_ADMIN_COUNT_LIMIT', 10000)
+        # One row past the limit tells a list of exactly ``limit`` rows from a longer one.
+        counted = queryset[:limit + 1].count()
+        self.capped = counted > limit
+        return min(counted, limit)
+
+
+class CategoryFilter(admin.SimpleListFilter):
+    title = 'category'
+    parameter_name = 'category'
+
+    def lookups(self, request, model_admin):
+        return Landmark.CATEGORY_CHOICES
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(category=self.value())
+        return queryset
+
+
+class CountryFilter(admin.SimpleListFilter):
+    """Countries from the per-user facet counts (cached), not SELECT DISTINCT over every landmark."""
+    title = 'country'
+    parameter_name = 'country'
+
+    def lookups(self, request, model_admin):
+        countries = get_response_cache().get_or_set('landmarks:admin:countries', lambda: list(
+            LandmarkFacetCount.objects.filter(facet='country', count__gt=0).exclude(value='')
+            .order_by('value').values_list('value', flat=True).distinct()
+        ), cache_timeout())
+        return [(country, country) for country in countries]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(country=self.value())
+        return queryset
+
+
+class LandmarkActionForm(ActionForm):
+    owner = forms.CharField(required=False, label='New owner (email)')
+    category = forms.ChoiceField(required=False, choices=[('', '---------'), *Landmark.CATEGORY_CHOICES])
+
 
 @admin.register(Landmark)
 class LandmarkAdmin(admin.ModelAdmin):
-    list_display = ('title', 'category', 'country', 'created_at', 'updated_at')
-    list_filter = ('category', 'country')
+    list_display = ('title', 'category', 'country', 'user', 'created_at', 'updated_at')
+    list_filter = (CategoryFilter, CountryFilter)
+    list_select_related = ('user',)
     search_fields = ('title', 'description', 'country')
     readonly_fields = ('created_at', 'updated_at')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    action_form = LandmarkActionForm
+    actions = ('reassign_owner', 'recategorize', 'delete_with_media')
     fieldsets = (
         (None, {
             'fields': ('title', 'category', 'description', 'country')
@@ -22,3 +101,49 @@ class LandmarkAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+    def get_actions(self, request):
+        # delete_selected lists every object on its confirmation page and deletes them one by one.
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def get_search_results(self, request, queryset, search_term):
+        if search_term and search.has_fts():
+            return search.filter_matches(queryset, search_term), False
+        return super().get_search_results(request, queryset, search_term)
+
+    @admin.action(description='Reassign selected landmarks to the owner given below', permissions=['change'])
+    def reassign_owner(self, request, queryset):
+        email = request.POST.get('owner', '').strip()
+        user = User.objects.filter(email__iexact=email).first() if email else None
+        if user is None:
+            self.message_user(request, f'No user with email "{email}"', messages.ERROR)
+            return
+        moved = bulk.reassign_owner(queryset, user)
+        self.message_user(request, f'Reassigned {moved} landmarks to {user.email}', messages.SUCCESS)
+
+    @admin.action(description='Change the category of selected landmarks to the one given below', permissions=['change'])
+    def recategorize(self, request, queryset):
+        category = request.POST.get('category', '')
+        if category not in dict(Landmark.CATEGORY_CHOICES):
+            self.message_user(request, 'Choose a category', messages.ERROR)
+            return
+        changed = bulk.recategorize(queryset, category)
+        self.message_user(request, f'Changed the category of {changed} landmarks', messages.SUCCESS)
+
+    @admin.action(description='Delete selected landmarks with their images', permissions=['delete'])
+    def delete_with_media(self, request, queryset):
+        if request.POST.get('post'):
+            deleted = bulk.delete_with_media(queryset)
+            self.message_user(request, f'Deleted {deleted} landmarks', messages.SUCCESS)
+            return None
+        return TemplateResponse(request, 'admin/landmarks/landmark/delete_with_media.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Are you sure?',
+            'opts': self.model._meta,
+            'count': queryset.count(),
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
@@ -0,0 +1,40 @@
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+
+def insert_rows(model, rows, batch_size=5000):
+    # bulk_create() materializes its input; feed it one batch at a time instead.
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        model.objects.bulk_create([model(**row) for row in batch])
+
+
+def apply_deltas(model, key_fields, value_fields, deltas, batch_size=200):
+    """Add ``{key: [delta, ...]}`` to the counter rows of ``model``.
+
+    ``key_fields`` must be covered by a unique constraint; the first value
+    field is the row count, and rows whose count drops to zero are deleted.
+    Each delta is applied as one ``INSERT ... ON CONFLICT DO UPDATE``, so
+    concurrent writers never lose increments.
+    """
+    rows = [(*key, *values) for key, values in deltas.items() if any(values)]
+    if not rows:
+        return
+    table = model._meta.db_table
+    columns = [model._meta.get_field(name).column for name in (*key_fields, *value_fields)]
+    keys = ', '.join(columns[:len(key_fields)])
+    updates = ', '.join(f'{column} = {column} + excluded.{column}' for column in columns[len(key_fields):])
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join(["%s"] * len(columns))}) '
+            f'ON CONFLICT ({keys}) DO UPDATE SET {updates}',
+            rows,
+        )
+        emptied = [key for key, values in deltas.items() if values[0] < 0]
+        for start in range(0, len(emptied), batch_size):
+            condition = Q()
+            for key in emptied[start:start + batch_size]:
+                condition |= Q(**dict(zip(key_fields, key)))
+            model.objects.filter(condition, **{f'{value_fields[0]}__lte': 0}).delete()
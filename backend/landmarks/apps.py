@@ -1,6 +1,29 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def ensure_sqlite_indexes(using, **kwargs):
+    # SQLite migrations that rebuild landmarks_landmark drop its triggers, so
+    # recreate them after every migrate run.
+    from django.db import connections
+    from django.db.migrations.recorder import MigrationRecorder
+    from . import search, spatial
+
+    connection = connections[using]
+    recorder = MigrationRecorder(connection)
+    if not recorder.has_table():
+        return
+    applied = set(recorder.migration_qs.filter(app='landmarks').values_list('name', flat=True))
+    if '0002_landmark_spatial_index' in applied:
+        spatial.install_rtree(connection)
+    if '0003_landmark_search_index' in applied:
+        search.install_fts(connection)
 
 
 class LandmarksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'landmarks'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(ensure_sqlite_indexes, sender=self)
@@ -0,0 +1,97 @@
+"""Async list, search and detail reads for ASGI deployments.
+
+Under ASGI every request to the sync LandmarkViewSet occupies a worker
+thread, and a list is rendered in full before the first byte goes out. These
+views await the ORM instead (``aiterator()``/``aget()``) and stream lists as a
+JSON array, one chunk of rows at a time as they arrive from the database.
+
+They reuse the viewset's queryset, filters, search and row serializer, so
+``/api/async/landmarks/`` returns the same bytes as
+``/api/landmarks/?paginate=false`` and ``/api/async/landmarks/<id>/`` the same
+as ``/api/landmarks/<id>/``. Responses aren't cached.
+"""
+from contextlib import nullcontext
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .models import Landmark
+from .renderers import FastJSONRenderer
+from .routers import is_pinned, read_replicas, replica_reads
+from .serializers import LandmarkRowSerializer
+from .views import LandmarkViewSet
+
+# Rows fetched from the database, and rendered into one body chunk, at a time.
+CHUNK_SIZE = 200
+CONTENT_TYPE = 'application/json'
+
+
+def error_response(exc, www_authenticate=None):
+    """The body and status DRF's exception handler would send for ``exc``."""
+    detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    response = JsonResponse(detail, status=exc.status_code, safe=False)
+    if www_authenticate and isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        response['WWW-Authenticate'] = www_authenticate
+    return response
+
+
+def prepare(request, action):
+    """Authenticate ``request`` and build its filtered values() queryset.
+
+    Runs in a thread: authentication, the replica pin check and some filters
+    (``nearest``) query the database.
+    """
+    authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    drf_request = Request(request, authenticators=authenticators)
+    try:
+        if not drf_request.user.is_authenticated:
+            raise exceptions.NotAuthenticated()
+        view = LandmarkViewSet(request=drf_request, action=action, args=(), kwargs={}, format_kwarg=None)
+        serializer = LandmarkRowSerializer(request)
+        use_replica = read_replicas() and not is_pinned(drf_request.user.pk)
+        with replica_reads() if use_replica else nullcontext():
+            queryset = serializer.values(view.filter_queryset(view.get_queryset()))
+            # Pin the database now: rows are read after this context has exited.
+            queryset = queryset.using(queryset.db)
+    except exceptions.APIException as exc:
+        return None, None, error_response(exc, authenticators[0].authenticate_header(drf_request))
+    return serializer, queryset, None
+
+
+async def stream_rows(serializer, queryset, renderer):
+    yield b'['
+    separator = b''
+    chunk = []
+    async for row in queryset.aiterator(chunk_size=CHUNK_SIZE):
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            yield separator + renderer.render(serializer.many(chunk))[1:-1]
+            separator, chunk = b',', []
+    if chunk:
+        yield separator + renderer.render(serializer.many(chunk))[1:-1]
+    yield b']'
+
+
+async def landmark_list(request):
+    if request.method not in ('GET', 'HEAD'):
+        return error_response(exceptions.MethodNotAllowed(request.method))
+    serializer, queryset, error = await sync_to_async(prepare)(request, 'list')
+    if error is not None:
+        return error
+    return StreamingHttpResponse(stream_rows(serializer, queryset, FastJSONRenderer()), content_type=CONTENT_TYPE)
+
+
+async def landmark_detail(request, pk):
+    if request.method not in ('GET', 'HEAD'):
+        return error_response(exceptions.MethodNotAllowed(request.method))
+    serializer, queryset, error = await sync_to_async(prepare)(request, 'retrieve')
+    if error is not None:
+        return error
+    try:
+        row = await queryset.aget(pk=pk)
+    except Landmark.DoesNotExist:
+        return error_response(exceptions.NotFound())
+    return HttpResponse(FastJSONRenderer().render(serializer.one(row)), content_type=CONTENT_TYPE)
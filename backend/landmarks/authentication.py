@@ -0,0 +1,108 @@
+"""JWT authentication that remembers the users it has loaded.
+
+simplejwt's JWTAuthentication validates the token (signature, expiry) without
+the database but then loads the User row on every request. CachedJWTAuthentication
+keeps those users in a per-process LRU cache keyed by user id and token id,
+with entries expiring after ``LANDMARK_AUTH_CACHE_TTL`` seconds. The token
+itself is still validated on every request.
+
+Saving or deleting a User and blacklisting one of its tokens drop the user's
+entries in this process (see landmarks.signals); other processes notice
+within the TTL. ``LANDMARK_AUTH_CACHE_SIZE = 0`` turns the cache off.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from .metrics import registry
+
+
+class UserCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.keys_by_user = defaultdict(set)
+        # Bumped by invalidate(), so a user loaded before an invalidation isn't cached after it.
+        self.generations = defaultdict(int)
+        self.hits = 0
+        self.misses = 0
+
+    def max_size(self):
+        return getattr(settings, 'LANDMARK_AUTH_CACHE_SIZE', 10000)
+
+    def ttl(self):
+        return getattr(settings, 'LANDMARK_AUTH_CACHE_TTL', 60)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                user = entry[1]
+            else:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                user = None
+        registry.inc('landmarks_auth_cache_total', {'result': 'miss' if user is None else 'hit'})
+        # Requests may change their user object (last_login, ...); never share one between them.
+        return copy.copy(user) if user is not None else None
+
+    def generation(self, user_id):
+        with self.lock:
+            return self.generations.get(user_id, 0)
+
+    def set(self, key, user, generation):
+        max_size = self.max_size()
+        with self.lock:
+            if max_size <= 0 or self.generations.get(key[0], 0) != generation:
+                return
+            self.entries[key] = (time.monotonic() + self.ttl(), copy.copy(user))
+            self.entries.move_to_end(key)
+            self.keys_by_user[key[0]].add(key)
+            while len(self.entries) > max_size:
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        del self.entries[key]
+        keys = self.keys_by_user[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self.keys_by_user[key[0]]
+
+    def invalidate(self, user_id):
+        user_id = str(user_id)
+        with self.lock:
+            self.generations[user_id] += 1
+            for key in self.keys_by_user.pop(user_id, ()):
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.keys_by_user.clear()
+            self.hits = self.misses = 0
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if user_cache.max_size() <= 0:
+            return super().get_user(validated_token)
+        user_id = str(validated_token.get(api_settings.USER_ID_CLAIM))
+        key = (user_id, validated_token.get(api_settings.JTI_CLAIM) or str(validated_token))
+        user = user_cache.get(key)
+        if user is None:
+            generation = user_cache.generation(user_id)
+            # Raises AuthenticationFailed for unknown and inactive users; those aren't cached.
+            user = super().get_user(validated_token)
+            user_cache.set(key, user, generation)
+        return user
@@ -0,0 +1,280 @@
+"""POST /api/landmarks/batch/: an ordered list of creates, updates and deletes applied in one transaction.
+
+Meant for clients flushing an offline edit queue in one round trip::
+
+    {"operations": [
+        {"op": "create", "ref": "local-1", "data": {"title": "Petra"}, "image": "photo1"},
+        {"op": "update", "ref": "local-1", "data": {"country": "Jordan"}},
+        {"op": "update", "id": 12, "data": {"title": "Acropolis"}},
+        {"op": "delete", "id": 13}
+    ]}
+
+``image`` names a multipart part holding the cover image (send the operations
+as the ``operations`` form field then). ``ref`` labels a created landmark so
+later operations can target it before its id is known. Every operation is
+validated by LandmarkSerializer; runs of consecutive creates are inserted with
+one ``bulk_create`` and runs of deletes with one queryset delete. If any
+operation fails, nothing is applied, and the images already written to
+storage are deleted again.
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import images, media
+from .models import Landmark, LandmarkBatch
+from .serializers import LandmarkSerializer
+from .signals import landmarks_bulk_changed
+
+logger = logging.getLogger(__name__)
+
+MAX_OPERATIONS = 500
+OPERATIONS = ('create', 'update', 'delete')
+
+
+class BatchError(Exception):
+    """The request as a whole is malformed."""
+
+
+class BatchFailed(Exception):
+    """An operation failed; raised inside the transaction to roll the batch back."""
+
+    def __init__(self, results):
+        super().__init__('Batch failed')
+        self.results = results
+
+
+class KeyReused(Exception):
+    pass
+
+
+def parse_operations(data):
+    operations = data.get('operations')
+    if isinstance(operations, str):
+        # Multipart requests send the operations as a JSON form field.
+        try:
+            operations = json.loads(operations)
+        except ValueError as e:
+            raise BatchError(f'operations is not valid JSON: {e}')
+    if not isinstance(operations, list) or not operations:
+        raise BatchError('operations must be a non-empty list')
+    if len(operations) > MAX_OPERATIONS:
+        raise BatchError(f'A batch holds at most {MAX_OPERATIONS} operations')
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+            raise BatchError(f'Operation {index}: op must be one of {", ".join(OPERATIONS)}')
+        if not isinstance(operation.get('data', {}), dict):
+            raise BatchError(f'Operation {index}: data must be an object')
+    return operations
+
+
+def fingerprint(operations, files):
+    digest = hashlib.sha256(json.dumps(operations, sort_keys=True, default=str).encode())
+    for name in sorted(files):
+        digest.update(f'\n{name}:{files[name].size}\n'.encode())
+        for chunk in files[name].chunks():
+            digest.update(chunk)
+        files[name].seek(0)
+    return digest.hexdigest()
+
+
+class Batch:
+    def __init__(self, operations, files, request):
+        self.operations = operations
+        self.files = files
+        self.request = request
+        self.user = request.user
+        self.context = {'request': request}
+        self.results = [None] * len(operations)
+        self.refs = {}
+        self.pending_creates = []  # (index, landmark, duplicate_images, ref)
+        self.pending_deletes = []  # (index, landmark_id)
+        self.saved_files = []  # images written to storage, deleted if the batch rolls back
+
+    def run(self):
+        """Apply the operations; call inside a transaction. Raises BatchFailed."""
+        for index, operation in enumerate(self.operations):
+            op = operation['op']
+            if op != 'create':
+                self.flush_creates()
+            if op != 'delete':
+                self.flush_deletes()
+            getattr(self, op)(index, operation)
+        self.flush_creates()
+        self.flush_deletes()
+        return self.results
+
+    def fail(self, index, status, errors):
+        self.results[index] = {'op': self.operations[index]['op'], 'status': status, 'errors': errors}
+        for position, result in enumerate(self.results):
+            if position != index:
+                # Not applied: rolled back or never run.
+                self.results[position] = {'op': self.operations[position]['op'], 'status': 424}
+        raise BatchFailed(self.results)
+
+    def data(self, index, operation):
+        data = dict(operation.get('data', {}))
+        data.pop('cover_image', None)
+        image = operation.get('image')
+        if image is not None:
+            if image not in self.files:
+                self.fail(index, 400, {'image': [f'No multipart part named {image}']})
+            data['cover_image'] = self.files[image]
+        return data
+
+    def target(self, index, operation):
+        if 'ref' in operation and 'id' not in operation:
+            landmark_id = self.refs.get(operation['ref'])
+            if landmark_id is None:
+                self.fail(index, 400, {'ref': [f"No earlier create with ref {operation['ref']}"]})
+            return landmark_id
+        try:
+            return int(operation.get('id'))
+        except (TypeError, ValueError):
+            self.fail(index, 400, {'id': ['A landmark id (or the ref of an earlier create) is required']})
+
+    def create(self, index, operation):
+        serializer = LandmarkSerializer(data=self.data(index, operation), context=self.context)
+        if not serializer.is_valid():
+            self.fail(index, 400, serializer.errors)
+        landmark = Landmark(user=self.user, **serializer.validated_data)
+        self.pending_creates.append((index, landmark, serializer.duplicate_images, operation.get('ref')))
+
+    def flush_creates(self):
+        if not self.pending_creates:
+            return
+        # bulk_create skips post_save; landmarks_bulk_changed does its bookkeeping.
+        created = Landmark.objects.bulk_create([landmark for _, landmark, _, _ in self.pending_creates])
+        self.saved_files += [landmark.cover_image.name for landmark in created if landmark.cover_image]
+        landmarks_bulk_changed.send(sender=Landmark, user_ids={self.user.pk}, created=created)
+        for index, landmark, duplicate_images, ref in self.pending_creates:
+            if landmark.cover_image:
+                images.schedule_variants(landmark.pk, landmark.cover_image.name, self.user.pk)
+            if ref is not None:
+                self.refs[ref] = landmark.pk
+            data = LandmarkSerializer(landmark, context=self.context).data
+            if duplicate_images:
+                data['duplicate_images'] = duplicate_images
+            self.results[index] = {'op': 'create', 'status': 201, 'id': landmark.pk, 'data': data}
+        self.pending_creates = []
+
+    def update(self, index, operation):
+        landmark_id = self.target(index, operation)
+        landmark = Landmark.objects.filter(user=self.user, pk=landmark_id).first()
+        if landmark is None:
+            self.fail(index, 404, {'id': [f'Landmark {landmark_id} not found']})
+        data = self.data(index, operation)
+        serializer = LandmarkSerializer(landmark, data=data, partial=True, context=self.context)
+        if not serializer.is_valid():
+            self.fail(index, 400, serializer.errors)
+        serializer.save()
+        if 'cover_image' in data:
+            self.saved_files.append(landmark.cover_image.name)
+        self.results[index] = {'op': 'update', 'status': 200, 'id': landmark.pk, 'data': serializer.data}
+
+    def delete(self, index, operation):
+        self.pending_deletes.append((index, self.target(index, operation)))
+
+    def flush_deletes(self):
+        if not self.pending_deletes:
+            return
+        ids = [landmark_id for _, landmark_id in self.pending_deletes]
+        queryset = Landmark.objects.filter(user=self.user, pk__in=ids)
+        found = set(queryset.values_list('pk', flat=True))
+        for index, landmark_id in self.pending_deletes:
+            if landmark_id not in found:
+                self.fail(index, 404, {'id': [f'Landmark {landmark_id} not found']})
+            # Deleting the same landmark twice in a row: only the first one finds it.
+            found.discard(landmark_id)
+        queryset.delete()
+        for index, landmark_id in self.pending_deletes:
+            self.results[index] = {'op': 'delete', 'status': 204, 'id': landmark_id}
+        self.pending_deletes = []
+
+    def discard_files(self):
+        """Delete the images written by a batch that was rolled back."""
+        for name in self.saved_files:
+            try:
+                default_storage.delete(name)
+            except OSError:
+                logger.warning(f"Could not delete media file {name}")
+        self.saved_files = []
+
+
+def apply(operations, files, request, idempotency_key=None):
+    """Run a batch; returns ``(status_code, body, replayed)``.
+
+    With ``idempotency_key`` the response of a committed batch is stored in the
+    same transaction, and a retry with that key gets it back instead of
+    applying the operations again. Raises KeyReused when the key belongs to a
+    different batch.
+    """
+    user = request.user
+    batch_fingerprint = fingerprint(operations, files)
+    if idempotency_key:
+        stored = replay(user, idempotency_key, batch_fingerprint)
+        if stored is not None:
+            return 200, refresh_media_urls(stored, user.pk), True
+    record = None
+    changes = Batch(operations, files, request)
+    try:
+        with transaction.atomic():
+            if idempotency_key:
+                try:
+                    with transaction.atomic():
+                        record = LandmarkBatch.objects.create(
+                            user=user, idempotency_key=idempotency_key, fingerprint=batch_fingerprint, response={},
+                        )
+                except IntegrityError:
+                    # A retry of this batch committed in the meantime.
+                    return 200, refresh_media_urls(replay(user, idempotency_key, batch_fingerprint), user.pk), True
+            body = {'applied': True, 'results': changes.run()}
+            if record is not None:
+                record.response = body
+                record.save(update_fields=['response'])
+    except BatchFailed as e:
+        changes.discard_files()
+        return 400, {'applied': False, 'results': e.results}, False
+    except Exception:
+        changes.discard_files()
+        raise
+    return 200, body, False
+
+
+def replay(user, idempotency_key, batch_fingerprint):
+    record = LandmarkBatch.objects.filter(user=user, idempotency_key=idempotency_key).first()
+    if record is None:
+        return None
+    if record.fingerprint != batch_fingerprint:
+        raise KeyReused()
+    return record.response
+
+
+def refresh_media_urls(body, owner_id):
+    """Re-sign the image URLs of a stored response: they expire long before the response does."""
+    for result in body.get('results', []):
+        data = result.get('data')
+        if not data:
+            continue
+        if data.get('cover_image'):
+            data['cover_image'] = media.resign_url(data['cover_image'], owner_id)
+        for formats in (data.get('cover_image_variants') or {}).values():
+            for key, url in formats.items():
+                formats[key] = media.resign_url(url, owner_id)
+    return body
+
+
+def retention():
+    return timedelta(days=getattr(settings, 'LANDMARK_BATCH_RETENTION_DAYS', 7))
+
+
+def prune_batches(now=None):
+    cutoff = (now or timezone.now()) - retention()
+    deleted, _ = LandmarkBatch.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,408 @@
+"""Latency, throughput and query-count benchmarks for the landmarks API.
+
+Every scenario goes through the real URLconf and middleware, with an
+authenticated APIClient or, for the concurrency suite, as ASGI requests from
+many concurrent clients. Suites are registered in ``SUITES`` and run by the
+``benchmark_landmarks`` management command.
+"""
+import asyncio
+import math
+import random
+import time
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import compression
+from .authentication import user_cache
+from .caching import get_response_cache
+from .models import Landmark
+from .pagination import encode_keyset_cursor
+from .renderers import COMPACT_RENDERERS
+from .synthetic import COUNTRIES, synthetic_landmark
+
+LIST_URL = '/api/landmarks/'
+ASYNC_LIST_URL = '/api/async/landmarks/'
+CONCURRENCY_LEVELS = (1, 50, 200)
+SEARCH_TERMS = ['castle', 'temple', 'falls', 'museum', 'cathedral', 'tower', 'lake', 'palace', 'mount', 'market']
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values``."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def distribution(seconds):
+    ms = [value * 1000 for value in seconds]
+    return {
+        'mean': round(sum(ms) / len(ms), 3),
+        'p50': round(percentile(ms, 50), 3),
+        'p95': round(percentile(ms, 95), 3),
+        'p99': round(percentile(ms, 99), 3),
+        'max': round(max(ms), 3),
+    }
+
+
+def summarize(latencies, queries, statuses, elapsed):
+    summary = {
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'latency_ms': distribution(latencies),
+    }
+    if queries is not None:
+        summary['queries'] = {
+            'mean': round(sum(queries) / len(queries), 2),
+            'max': max(queries),
+        }
+    summary['statuses'] = {str(code): statuses.count(code) for code in sorted(set(statuses))}
+    return summary
+
+
+def run_scenario(client, make_request, requests, warmup=5, cold=False, authenticate=None):
+    """Send ``requests`` requests built by ``make_request()`` and summarize them.
+
+    ``make_request`` returns ``(user, method, path, data)``. With ``cold`` the
+    response cache is cleared before each request so every read hits the database.
+    ``authenticate(client, user)`` sets up the client for each request (default:
+    ``force_authenticate``, which skips authentication).
+    """
+    cache = get_response_cache()
+    authenticate = authenticate or (lambda client, user: client.force_authenticate(user))
+    for _ in range(warmup):
+        user, method, path, data = make_request()
+        authenticate(client, user)
+        getattr(client, method)(path, data, format='multipart' if method == 'post' else None)
+
+    latencies, queries, statuses = [], [], []
+    started = time.perf_counter()
+    for _ in range(requests):
+        user, method, path, data = make_request()
+        authenticate(client, user)
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = getattr(client, method)(path, data, format='multipart' if method == 'post' else None)
+            latencies.append(time.perf_counter() - start)
+        queries.append(len(captured))
+        statuses.append(response.status_code)
+    return summarize(latencies, queries, statuses, time.perf_counter() - started)
+
+
+def api_scenarios(users, rng):
+    landmark_ids = {}
+    for user in users:
+        landmark_ids[user.pk] = list(Landmark.objects.filter(user=user).values_list('id', flat=True)[:1000])
+    readers = [user for user in users if landmark_ids[user.pk]] or users
+
+    def list_page():
+        return rng.choice(readers), 'get', LIST_URL, {}
+
+    def search():
+        return rng.choice(readers), 'get', LIST_URL, {'search': rng.choice(SEARCH_TERMS)}
+
+    def filter_category():
+        country = rng.choice(COUNTRIES)[0]
+        category = synthetic_landmark(rng, None).category
+        return rng.choice(readers), 'get', LIST_URL, {'category': category, 'country': country}
+
+    def bbox():
+        _, lat, lon, spread = rng.choice(COUNTRIES)
+        box = f'{lon - spread:.4f},{lat - spread:.4f},{lon + spread:.4f},{lat + spread:.4f}'
+        return rng.choice(readers), 'get', LIST_URL, {'bbox': box}
+
+    def map_clusters():
+        _, lat, lon, spread = rng.choice(COUNTRIES)
+        box = f'{lon - spread:.4f},{lat - spread:.4f},{lon + spread:.4f},{lat + spread:.4f}'
+        return rng.choice(readers), 'get', f'{LIST_URL}clusters/', {'bbox': box, 'zoom': rng.randint(3, 8)}
+
+    def facet_counts():
+        params = rng.choice([{}, {'category': synthetic_landmark(rng, None).category}, {'search': rng.choice(SEARCH_TERMS)}])
+        return rng.choice(readers), 'get', f'{LIST_URL}facets/', params
+
+    def typeahead():
+        # What a search box sends while typing, now and then with a letter missing.
+        term = rng.choice(SEARCH_TERMS)
+        typed = term[:rng.randint(2, len(term))]
+        if len(typed) > 3 and rng.random() < 0.3:
+            missing = rng.randrange(1, len(typed))
+            typed = typed[:missing] + typed[missing + 1:]
+        return rng.choice(readers), 'get', f'{LIST_URL}suggest/', {'q': typed}
+
+    def detail():
+        user = rng.choice(readers)
+        ids = landmark_ids[user.pk]
+        return user, 'get', f'{LIST_URL}{rng.choice(ids) if ids else 0}/', {}
+
+    sample_ids = [pk for ids in landmark_ids.values() for pk in ids[:10]]
+    cursors = [encode_keyset_cursor(landmark) for landmark in Landmark.objects.filter(pk__in=sample_ids).only('created_at')]
+
+    def web_page():
+        # The server-rendered list; half of the requests jump deep into it.
+        params = rng.choice([{}, {'category': synthetic_landmark(rng, None).category}, {'search': rng.choice(SEARCH_TERMS)}])
+        if cursors and rng.random() < 0.5:
+            return rng.choice(readers), 'get', '/landmark-rows/', {**params, 'after': rng.choice(cursors)}
+        return rng.choice(readers), 'get', '/', params
+
+    def create():
+        landmark = synthetic_landmark(rng, None)
+        return rng.choice(users), 'post', LIST_URL, {
+            'title': landmark.title, 'description': landmark.description, 'category': landmark.category,
+            'country': landmark.country, 'latitude': str(landmark.latitude), 'longitude': str(landmark.longitude),
+        }
+
+    return {
+        'list': list_page, 'search': search, 'filter': filter_category,
+        'bbox': bbox, 'clusters': map_clusters, 'facets': facet_counts, 'suggest': typeahead,
+        'web_list': web_page, 'detail': detail, 'create': create,
+    }
+
+
+def api_suite(users, requests, seed=0, cold=False):
+    rng = random.Random(seed)
+    client = APIClient()
+    return {
+        name: run_scenario(client, make_request, requests, cold=cold)
+        for name, make_request in api_scenarios(users, rng).items()
+    }
+
+
+def serializer_suite(users, requests, seed=0, cold=True):
+    """Full-page list and detail reads with LandmarkSerializer vs. the values() fast path."""
+    rng = random.Random(seed)
+    client = APIClient()
+    scenarios = api_scenarios(users, rng)
+    readers = [user for user in users if Landmark.objects.filter(user=user).exists()] or users
+
+    def large_page():
+        return rng.choice(readers), 'get', LIST_URL, {'page_size': 500}
+
+    results = {}
+    for mode, fast in (('serializer', False), ('fast', True)):
+        with override_settings(LANDMARK_FAST_SERIALIZER=fast):
+            for name, make_request in (('list_500', large_page), ('detail', scenarios['detail'])):
+                rng.seed(seed)
+                results[f'{name}_{mode}'] = run_scenario(client, make_request, requests, cold=True)
+    for name in ('list_500', 'detail'):
+        slow, fast = results[f'{name}_serializer'], results[f'{name}_fast']
+        results[f'{name}_speedup'] = {
+            'p50': round(slow['latency_ms']['p50'] / fast['latency_ms']['p50'], 2),
+            'p95': round(slow['latency_ms']['p95'] / fast['latency_ms']['p95'], 2),
+        }
+    return results
+
+
+async def asgi_get(application, headers, path, params):
+    """GET ``path`` from an ASGI app; returns (status, latency, time to first byte, body size)."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': urlencode(params).encode(),
+        'headers': [(b'host', b'testserver'), *headers], 'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    received = False
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Django 4.2 stops reading after the body; never report a disconnect.
+        await asyncio.Future()
+
+    response = {'status': None, 'first_byte': None, 'size': 0}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif message['type'] == 'http.response.body':
+            if response['first_byte'] is None:
+                response['first_byte'] = time.perf_counter() - start
+            response['size'] += len(message.get('body', b''))
+
+    start = time.perf_counter()
+    await application(scope, receive, send)
+    return response['status'], time.perf_counter() - start, response['first_byte'], response['size']
+
+
+async def run_concurrent(application, make_request, requests, clients):
+    """Send ``requests`` ASGI requests from ``clients`` concurrent clients and summarize them.
+
+    ``make_request`` returns ``(headers, path, params)``.
+    """
+    results = []
+    remaining = requests
+
+    async def client():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            results.append(await asgi_get(application, *make_request()))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    summary = summarize([latency for _, latency, _, _ in results], None, [status for status, _, _, _ in results], elapsed)
+    summary['time_to_first_byte_ms'] = distribution([first_byte for _, _, first_byte, _ in results])
+    summary['response_bytes_mean'] = round(sum(size for _, _, _, size in results) / len(results))
+    summary['clients'] = clients
+    return summary
+
+
+def concurrency_suite(users, requests, seed=0, cold=True, levels=CONCURRENCY_LEVELS):
+    """Full list, search and detail reads, sync LandmarkViewSet vs. the async views, over ASGI.
+
+    Each scenario runs at every concurrency level in ``levels`` with the same
+    request sequence for both implementations. The response cache is always
+    bypassed: the async views don't cache, so a cached sync read would only
+    measure the cache.
+    """
+    rng = random.Random(seed)
+    application = get_asgi_application()
+    headers = {user.pk: [(b'authorization', f'Bearer {AccessToken.for_user(user)}'.encode())] for user in users}
+    landmark_ids = {}
+    for user in users:
+        landmark_ids[user.pk] = list(Landmark.objects.filter(user=user).values_list('id', flat=True)[:1000])
+    readers = [user for user in users if landmark_ids[user.pk]] or users
+
+    def full_list():
+        return rng.choice(readers), '', {}
+
+    def search():
+        return rng.choice(readers), '', {'search': rng.choice(SEARCH_TERMS)}
+
+    def detail():
+        user = rng.choice(readers)
+        ids = landmark_ids[user.pk]
+        return user, f'{rng.choice(ids) if ids else 0}/', {}
+
+    def sync_request(make_request):
+        user, suffix, params = make_request()
+        return headers[user.pk], f'{LIST_URL}{suffix}', params if suffix else {**params, 'paginate': 'false'}
+
+    def async_request(make_request):
+        user, suffix, params = make_request()
+        return headers[user.pk], f'{ASYNC_LIST_URL}{suffix}', params
+
+    caches = {**settings.CACHES, getattr(settings, 'LANDMARK_RESPONSE_CACHE', 'default'): {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }}
+    results = {}
+    with override_settings(CACHES=caches):
+        for name, make_request in (('list', full_list), ('search', search), ('detail', detail)):
+            for clients in levels:
+                for mode, build in (('sync', sync_request), ('async', async_request)):
+                    rng.seed(seed)
+                    results[f'{name}_{mode}_c{clients}'] = async_to_sync(run_concurrent)(
+                        application, lambda: build(make_request), max(requests, clients), clients
+                    )
+                sync, fast = results[f'{name}_sync_c{clients}'], results[f'{name}_async_c{clients}']
+                results[f'{name}_c{clients}_speedup'] = {
+                    'throughput': round(fast['throughput_rps'] / sync['throughput_rps'], 2),
+                    'p95': round(sync['latency_ms']['p95'] / fast['latency_ms']['p95'], 2),
+                    'ttfb_p95': round(sync['time_to_first_byte_ms']['p95'] / fast['time_to_first_byte_ms']['p95'], 2),
+                }
+    return results
+
+
+def formats_suite(users, requests, seed=0, cold=False):
+    """Body size and server CPU time of 500-row list pages per format and content coding.
+
+    ``json_identity`` is the current default output; every other scenario also
+    reports its size relative to it. Requests are measured twice: ``cpu_ms``
+    with the response cache cleared first (serialize and compress), and
+    ``cached_cpu_ms`` served from the cache.
+    """
+    rng = random.Random(seed)
+    client = APIClient()
+    readers = [user for user in users if Landmark.objects.filter(user=user).exists()] or users
+    formats = {'json': 'application/json', **{renderer.format: renderer.media_type for renderer in COMPACT_RENDERERS}}
+    cache = get_response_cache()
+
+    def measure(headers, clear):
+        cpu, latencies, sizes, statuses = [], [], [], []
+        rng.seed(seed)
+        started = time.perf_counter()
+        for _ in range(requests):
+            client.force_authenticate(rng.choice(readers))
+            if clear:
+                cache.clear()
+            start, start_cpu = time.perf_counter(), time.process_time()
+            response = client.get(LIST_URL, {'page_size': 500}, **headers)
+            cpu.append(time.process_time() - start_cpu)
+            latencies.append(time.perf_counter() - start)
+            sizes.append(len(response.content))
+            statuses.append(response.status_code)
+        summary = summarize(latencies, None, statuses, time.perf_counter() - started)
+        summary['cpu_ms'] = distribution(cpu)
+        summary['response_bytes_mean'] = round(sum(sizes) / len(sizes))
+        return summary
+
+    results = {}
+    for name, media_type in formats.items():
+        for encoding in ('identity', *compression.available_encodings()):
+            headers = {'HTTP_ACCEPT': media_type, 'HTTP_ACCEPT_ENCODING': encoding}
+            summary = measure(headers, clear=True)
+            measure(headers, clear=False)  # fill the cache
+            summary['cached_cpu_ms'] = measure(headers, clear=False)['cpu_ms']
+            results[f'{name}_{encoding}'] = summary
+    baseline = results['json_identity']['response_bytes_mean']
+    for summary in results.values():
+        summary['size_vs_json'] = round(summary['response_bytes_mean'] / baseline, 3) if baseline else None
+    return results
+
+
+def auth_suite(users, requests, seed=0, cold=False):
+    """Reads authenticated with real JWTs, with and without the authenticated-user cache.
+
+    Responses come from the response cache (unless ``cold``), where loading
+    the user is a large share of the remaining work.
+    """
+    rng = random.Random(seed)
+    client = APIClient()
+    scenarios = api_scenarios(users, rng)
+    tokens = {user.pk: f'Bearer {AccessToken.for_user(user)}' for user in users}
+
+    def authenticate(client, user):
+        client.credentials(HTTP_AUTHORIZATION=tokens[user.pk])
+
+    results = {}
+    for name in ('list', 'detail'):
+        for mode, size in (('uncached', 0), ('cached', 10000)):
+            with override_settings(LANDMARK_AUTH_CACHE_SIZE=size):
+                # Same response cache contents for both modes: filled by an unmeasured pass.
+                get_response_cache().clear()
+                rng.seed(seed)
+                run_scenario(client, scenarios[name], requests, authenticate=authenticate)
+                user_cache.clear()
+                rng.seed(seed)
+                results[f'{name}_{mode}'] = run_scenario(
+                    client, scenarios[name], requests, cold=cold, authenticate=authenticate
+                )
+            lookups = user_cache.hits + user_cache.misses
+            if lookups:
+                results[f'{name}_{mode}']['auth_cache_hit_rate'] = round(user_cache.hits / lookups, 3)
+        uncached, cached = results[f'{name}_uncached'], results[f'{name}_cached']
+        results[f'{name}_savings'] = {
+            'queries_per_request': round(uncached['queries']['mean'] - cached['queries']['mean'], 2),
+            'p50_ms': round(uncached['latency_ms']['p50'] - cached['latency_ms']['p50'], 3),
+        }
+    user_cache.clear()
+    return results
+
+
+SUITES = {
+    'api': api_suite,
+    'serializer': serializer_suite,
+    'concurrency': concurrency_suite,
+    'formats': formats_suite,
+    'auth': auth_suite,
+}
@@ -0,0 +1,237 @@
+import csv
+import json
+import logging
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.utils import timezone
+
+from . import images
+from .models import Landmark, LandmarkTombstone
+from .serializers import LandmarkSerializer
+from .signals import landmarks_bulk_changed
+
+EXPORT_FIELDS = (
+    'id', 'title', 'description', 'category', 'country', 'cover_image',
+    'latitude', 'longitude', 'created_at', 'updated_at',
+)
+IMPORT_FIELDS = ('title', 'description', 'category', 'country', 'latitude', 'longitude')
+DEFAULT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+logger = logging.getLogger(__name__)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, chunk_size=2000):
+    return queryset.order_by('id').values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(['' if row[field] is None else row[field] for field in EXPORT_FIELDS])
+
+
+def _text_lines(stream):
+    for line in stream:
+        yield line.decode('utf-8') if isinstance(line, bytes) else line
+
+
+def parse_ndjson(stream):
+    """Yield ``(line_number, row, error)`` for each non-blank line of ``stream``."""
+    for number, line in enumerate(_text_lines(stream), start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, None, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(row, dict):
+            yield number, None, 'Expected a JSON object'
+            continue
+        yield number, row, None
+
+
+def parse_csv(stream):
+    reader = csv.DictReader(_text_lines(stream))
+    for row in reader:
+        yield reader.line_num, {key: (value if value != '' else None) for key, value in row.items()}, None
+
+
+def build_landmark(row, user):
+    serializer = LandmarkSerializer(data={field: row.get(field) for field in IMPORT_FIELDS if field in row})
+    if not serializer.is_valid():
+        return None, serializer.errors
+    landmark = Landmark(user=user, **serializer.validated_data)
+    # Exports reference images by storage name. Only the user's own cover images may be
+    # referenced: media URLs are signed for whoever owns a landmark using the file.
+    image_name = row.get('cover_image')
+    if image_name:
+        try:
+            usable = (Landmark.objects.filter(user=user, cover_image=image_name).exists()
+                      and default_storage.exists(image_name))
+        except SuspiciousFileOperation:
+            usable = False
+        if not usable:
+            return None, {'cover_image': [f'File {image_name} is not one of your cover images.']}
+        landmark.cover_image = image_name
+    return landmark, None
+
+
+def import_rows(rows, user, batch_size=DEFAULT_BATCH_SIZE):
+    """Validate parsed rows through LandmarkSerializer and insert them in batches.
+
+    Each batch is written with ``bulk_create`` inside its own transaction, so a
+    failure only loses that batch. Returns a report with per-row errors.
+    """
+    report = {'created': 0, 'failed': 0, 'errors': []}
+
+    def fail(number, errors):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': number, 'errors': errors})
+
+    def flush(batch):
+        with transaction.atomic():
+            created = Landmark.objects.bulk_create(batch)
+            landmarks_bulk_changed.send(sender=Landmark, user_ids={user.pk}, created=created)
+        report['created'] += len(created)
+
+    batch = []
+    for number, row, error in rows:
+        if error:
+            fail(number, {'non_field_errors': [error]})
+            continue
+        landmark, errors = build_landmark(row, user)
+        if errors:
+            fail(number, errors)
+            continue
+        batch.append(landmark)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    report['errors_truncated'] = report['failed'] > len(report['errors'])
+    return report
+
+
+def chunked_ids(queryset, chunk_size=DEFAULT_BATCH_SIZE):
+    """Primary keys of ``queryset`` in ascending chunks, paging by key so rows changed along the way don't shift pages."""
+    last = None
+    while True:
+        chunk = queryset.order_by('pk')
+        if last is not None:
+            chunk = chunk.filter(pk__gt=last)
+        ids = list(chunk.values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def _changed(user_ids):
+    # Once for the whole operation: rebuilding a user's aggregates after every chunk would cost more than the writes.
+    user_ids.discard(None)
+    if user_ids:
+        landmarks_bulk_changed.send(sender=Landmark, user_ids=user_ids)
+
+
+def reassign_owner(queryset, user, chunk_size=DEFAULT_BATCH_SIZE):
+    """Give the landmarks in ``queryset`` to ``user``, one UPDATE per chunk; returns how many moved."""
+    moved, user_ids = 0, {user.pk}
+    try:
+        for ids in chunked_ids(queryset.exclude(user=user), chunk_size):
+            with transaction.atomic():
+                owners = list(Landmark.objects.filter(pk__in=ids).exclude(user=user).values_list('pk', 'user_id'))
+                Landmark.objects.filter(pk__in=[pk for pk, _ in owners]).update(user=user, updated_at=timezone.now())
+                # The previous owners' clients drop them on their next delta sync.
+                LandmarkTombstone.objects.bulk_create(
+                    LandmarkTombstone(landmark_id=pk, user_id=owner) for pk, owner in owners if owner is not None
+                )
+            moved += len(owners)
+            user_ids.update(owner for _, owner in owners)
+    finally:
+        _changed(user_ids)
+    return moved
+
+
+def recategorize(queryset, category, chunk_size=DEFAULT_BATCH_SIZE):
+    """Set ``category`` on the landmarks in ``queryset``, one UPDATE per chunk; returns how many changed."""
+    changed, user_ids = 0, set()
+    try:
+        for ids in chunked_ids(queryset, chunk_size):
+            with transaction.atomic():
+                rows = Landmark.objects.filter(pk__in=ids)
+                user_ids.update(rows.values_list('user_id', flat=True).distinct())
+                changed += rows.update(category=category, updated_at=timezone.now())
+    finally:
+        _changed(user_ids)
+    return changed
+
+
+def delete_with_media(queryset, chunk_size=DEFAULT_BATCH_SIZE):
+    """Delete the landmarks in ``queryset`` with their cover images and variants; returns how many were deleted.
+
+    Each chunk is deleted with a few set-based queries instead of per-object
+    signals: related rows go first, then the landmarks, and files are removed
+    once the chunk's transaction commits.
+    """
+    deleted, user_ids = 0, set()
+    try:
+        for ids in chunked_ids(queryset, chunk_size):
+            with transaction.atomic():
+                rows = list(Landmark.objects.filter(pk__in=ids).values_list(
+                    'pk', 'user_id', 'cover_image', 'cover_image_variants'
+                ))
+                ids = [pk for pk, *_ in rows]
+                LandmarkTombstone.objects.bulk_create(
+                    LandmarkTombstone(landmark_id=pk, user_id=owner) for pk, owner, *_ in rows if owner is not None
+                )
+                for relation in Landmark._meta.related_objects:
+                    related = relation.related_model._base_manager.filter(**{f'{relation.field.name}__in': ids})
+                    if relation.on_delete is models.SET_NULL:
+                        related.update(**{relation.field.name: None})
+                    else:
+                        related.delete()
+                Landmark.objects.filter(pk__in=ids)._raw_delete(Landmark.objects.db)
+                media = [(image, variants) for *_, image, variants in rows]
+                transaction.on_commit(lambda media=media: _delete_media(media))
+            deleted += len(rows)
+            user_ids.update(owner for _, owner, *_ in rows)
+    finally:
+        _changed(user_ids)
+    return deleted
+
+
+def _delete_media(media):
+    # Imports can point several of a user's landmarks at one image: keep what a remaining landmark still uses.
+    shared = set(Landmark.objects.filter(
+        cover_image__in=[image for image, _ in media if image]
+    ).values_list('cover_image', flat=True))
+    _delete_files([
+        name for image, variants in media if image not in shared
+        for name in ([image] if image else []) + sorted(images.variant_names(variants))
+    ])
+
+
+def _delete_files(names):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except OSError:
+            logger.warning(f"Could not delete media file {name}")
@@ -0,0 +1,124 @@
+import hashlib
+from calendar import timegm
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from . import compression, media
+from .models import LandmarkCollectionVersion
+
+
+def get_response_cache():
+    return caches[getattr(settings, 'LANDMARK_RESPONSE_CACHE', 'default')]
+
+
+def get_collection_version(user_id):
+    row = LandmarkCollectionVersion.objects.filter(user_id=user_id).values_list('version', 'modified_at').first()
+    return row or (0, None)
+
+
+def bump_collection_version(user_id):
+    """Invalidate every cached read of ``user_id``'s landmarks."""
+    if user_id is None:
+        return
+    now = timezone.now()
+    updated = LandmarkCollectionVersion.objects.filter(user_id=user_id).update(
+        version=F('version') + 1, modified_at=now
+    )
+    if not updated:
+        _, created = LandmarkCollectionVersion.objects.get_or_create(
+            user_id=user_id, defaults={'version': 1, 'modified_at': now}
+        )
+        if not created:
+            bump_collection_version(user_id)
+            return
+    # The row stays locked until commit, so this is the version our write produced.
+    version = LandmarkCollectionVersion.objects.filter(user_id=user_id).values_list('version', flat=True).first()
+    from . import suggest
+    suggest.bumped(user_id, version)
+
+
+def normalized_query(request):
+    params = request.query_params
+    return '&'.join(f'{key}={value}' for key in sorted(params) for value in params.getlist(key))
+
+
+def response_cache_key(request, version):
+    renderer = getattr(request, 'accepted_renderer', None)
+    media_type = getattr(request, 'accepted_media_type', '') if renderer else ''
+    parts = [
+        request.user.pk, version, media.url_window_start(), request.scheme, request.get_host(), request.path,
+        normalized_query(request), media_type,
+    ]
+    digest = hashlib.sha256('\n'.join(map(str, parts)).encode()).hexdigest()
+    return f'landmarks:response:{request.user.pk}:{digest}'
+
+
+class CachedReadMixin:
+    """Conditional GET and response caching for per-user landmark reads.
+
+    Responses are keyed by the user's collection version, which a signal bumps
+    on every landmark save/delete, so a write simply makes every older key
+    unreachable. They embed signed media URLs, so the key (and the ETag and
+    Last-Modified) also move on whenever those are re-signed, and entries
+    expire with the URLs. Clients that accept gzip (or brotli) get compressed
+    bodies, cached alongside the plain ones.
+    """
+
+    def cached_response(self, request, build):
+        version, modified_at = get_collection_version(request.user.pk)
+        key = response_cache_key(request, version)
+        encoding = compression.negotiate(request)
+        etag = '"%s"' % key.rsplit(':', 1)[1][:32]
+        if encoding is not None:
+            # The body's bytes depend on the coding; weak comparison still matches either way.
+            etag = f'W/{etag}'
+        last_modified = max(timegm(modified_at.utctimetuple()), media.url_window_start()) if modified_at else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            cache = get_response_cache()
+            encoded_key = f'{key}:{encoding}'
+            cached = cache.get_many([key, encoded_key] if encoding else [key])
+            if encoded_key in cached:
+                content, content_type = cached[encoded_key]
+                response = HttpResponse(content_type=content_type)
+                compression.set_body(response, content, encoding)
+            elif key in cached:
+                content, content_type = cached[key]
+                response = HttpResponse(content, content_type=content_type)
+                self._compress_response(cache, key, encoding, response, store=True)
+            else:
+                response = build()
+                if response.status_code == 200:
+                    response.add_post_render_callback(
+                        lambda rendered: self._store_response(cache, key, version, encoding, rendered)
+                    )
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ('Accept', 'Accept-Encoding', 'Authorization'))
+        return response
+
+    def _store_response(self, cache, key, version, encoding, response):
+        # A write that landed while the body was being built means it may not
+        # match ``version`` any more; skip caching rather than pin stale data.
+        current = get_collection_version(self.request.user.pk)[0] == version
+        if current:
+            cache.set(key, (response.content, response['Content-Type']), media.url_max_age())
+        self._compress_response(cache, key, encoding, response, store=current)
+
+    def _compress_response(self, cache, key, encoding, response, store):
+        if encoding is None or not compression.compressible(response.content):
+            return
+        content = compression.compress(response.content, encoding)
+        if store:
+            cache.set(f'{key}:{encoding}', (content, response['Content-Type']), media.url_max_age())
+        compression.set_body(response, content, encoding)
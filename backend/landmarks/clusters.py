@@ -0,0 +1,178 @@
+"""Map clusters served from per-user grid aggregates.
+
+Every landmark with coordinates is counted in one Web Mercator grid cell per
+level (level ``L`` splits the world into ``2**L x 2**L`` cells), per category,
+together with the sums of its coordinates so cells can report a centroid.
+Signal handlers keep the rows up to date with upserts, so answering a
+clusters request only reads the cells in view, never the landmarks.
+"""
+import math
+from collections import defaultdict
+
+from django import forms
+from django.db import transaction
+from django.db.models import Q
+
+from . import aggregates
+from .models import Landmark, LandmarkGridCell
+from .spatial import CoordinateListField, lon_ranges
+
+MAX_LEVEL = 16
+# A 256px map tile holds 2**2 x 2**2 cells, i.e. one cluster per ~64px square.
+TILE_LEVEL_OFFSET = 2
+MAX_ZOOM = 22
+# Upper bound on the cells a single response may cover; wider views use a coarser level.
+MAX_CELLS = 4096
+MAX_MERCATOR_LATITUDE = 85.05112878
+
+
+def cell_for(latitude, longitude, level):
+    n = 1 << level
+    latitude = max(-MAX_MERCATOR_LATITUDE, min(MAX_MERCATOR_LATITUDE, latitude))
+    sin_lat = math.sin(math.radians(latitude))
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def grid_entry(user_id, latitude, longitude, category):
+    """The grid's view of a landmark, or None when it isn't on the map."""
+    if user_id is None or latitude is None or longitude is None:
+        return None
+    return user_id, float(latitude), float(longitude), category or ''
+
+
+def landmark_entry(landmark):
+    return grid_entry(landmark.user_id, landmark.latitude, landmark.longitude, landmark.category)
+
+
+def aggregate(entries, sign=1):
+    totals = defaultdict(lambda: [0, 0.0, 0.0])
+    for entry in entries:
+        if entry is None:
+            continue
+        user_id, latitude, longitude, category = entry
+        for level in range(MAX_LEVEL + 1):
+            x, y = cell_for(latitude, longitude, level)
+            total = totals[(user_id, level, x, y, category)]
+            total[0] += sign
+            total[1] += sign * latitude
+            total[2] += sign * longitude
+    return totals
+
+
+def apply_deltas(totals):
+    """Add ``{(user_id, level, x, y, category): [count, sum_lat, sum_lon]}`` to the grid."""
+    aggregates.apply_deltas(
+        LandmarkGridCell, ('user_id', 'level', 'x', 'y', 'category'), ('count', 'sum_latitude', 'sum_longitude'), totals
+    )
+
+
+def add(entries):
+    apply_deltas(aggregate(entries))
+
+
+def remove(entries):
+    apply_deltas(aggregate(entries, sign=-1))
+
+
+def move(old, new):
+    if old == new:
+        return
+    totals = aggregate([new])
+    for key, (count, sum_lat, sum_lon) in aggregate([old], sign=-1).items():
+        total = totals[key]
+        total[0] += count
+        total[1] += sum_lat
+        total[2] += sum_lon
+    apply_deltas(totals)
+
+
+def grid_rows(landmarks, batch_size=5000):
+    """Yield the grid cell fields for ``landmarks`` (a Landmark queryset), one owner at a time."""
+    for owner_id in landmarks.exclude(user=None).order_by().values_list('user_id', flat=True).distinct():
+        entries = landmarks.filter(user_id=owner_id).values_list(
+            'user_id', 'latitude', 'longitude', 'category'
+        ).iterator(chunk_size=batch_size)
+        for (user_id, level, x, y, category), (count, sum_lat, sum_lon) in aggregate(grid_entry(*row) for row in entries).items():
+            yield {
+                'user_id': user_id, 'level': level, 'x': x, 'y': y, 'category': category,
+                'count': count, 'sum_latitude': sum_lat, 'sum_longitude': sum_lon,
+            }
+
+
+def rebuild(user_ids=None, batch_size=5000):
+    """Recompute the grid from the landmarks table (all users, or just ``user_ids``)."""
+    cells = LandmarkGridCell.objects.all()
+    landmarks = Landmark.objects.all()
+    if user_ids is not None:
+        user_ids = [user_id for user_id in user_ids if user_id is not None]
+        cells = cells.filter(user_id__in=user_ids)
+        landmarks = landmarks.filter(user_id__in=user_ids)
+    with transaction.atomic():
+        cells.delete()
+        aggregates.insert_rows(LandmarkGridCell, grid_rows(landmarks, batch_size), batch_size)
+
+
+def cell_ranges(bbox, level):
+    min_lon, min_lat, max_lon, max_lat = bbox
+    # Mercator y grows southwards.
+    _, min_y = cell_for(max_lat, 0, level)
+    _, max_y = cell_for(min_lat, 0, level)
+    x_ranges = [(cell_for(0, west, level)[0], cell_for(0, east, level)[0]) for west, east in lon_ranges(min_lon, max_lon)]
+    return x_ranges, (min_y, max_y)
+
+
+def level_for(bbox, zoom):
+    level = min(zoom + TILE_LEVEL_OFFSET, MAX_LEVEL)
+    while level > 0:
+        x_ranges, (min_y, max_y) = cell_ranges(bbox, level)
+        cells = sum(east - west + 1 for west, east in x_ranges) * (max_y - min_y + 1)
+        if cells <= MAX_CELLS:
+            break
+        level -= 1
+    return level
+
+
+class ClusterQueryForm(forms.Form):
+    # bbox=min_lon,min_lat,max_lon,max_lat; the whole world when omitted
+    bbox = CoordinateListField(length=4, required=False)
+    zoom = forms.IntegerField(min_value=0, max_value=MAX_ZOOM)
+    category = forms.CharField(required=False)
+
+    def clean_bbox(self):
+        return self.cleaned_data['bbox'] or [-180.0, -90.0, 180.0, 90.0]
+
+
+def clusters(user, bbox, zoom, category=None):
+    """Cluster centroids, counts and per-category counts for the cells in ``bbox``."""
+    level = level_for(bbox, zoom)
+    x_ranges, (min_y, max_y) = cell_ranges(bbox, level)
+    x_filter = Q()
+    for west, east in x_ranges:
+        x_filter |= Q(x__gte=west, x__lte=east)
+    cells = LandmarkGridCell.objects.filter(x_filter, user=user, level=level, y__gte=min_y, y__lte=max_y)
+    if category is not None:
+        cells = cells.filter(category=category)
+
+    grouped = {}
+    for x, y, cell_category, count, sum_lat, sum_lon in cells.values_list(
+        'x', 'y', 'category', 'count', 'sum_latitude', 'sum_longitude'
+    ):
+        cluster = grouped.setdefault((x, y), {'count': 0, 'sum_lat': 0.0, 'sum_lon': 0.0, 'categories': {}})
+        cluster['count'] += count
+        cluster['sum_lat'] += sum_lat
+        cluster['sum_lon'] += sum_lon
+        cluster['categories'][cell_category] = count
+
+    results = [
+        {
+            'latitude': round(cluster['sum_lat'] / cluster['count'], 6),
+            'longitude': round(cluster['sum_lon'] / cluster['count'], 6),
+            'count': cluster['count'],
+            'categories': cluster['categories'],
+        }
+        for cluster in grouped.values()
+    ]
+    results.sort(key=lambda cluster: (-cluster['count'], cluster['latitude'], cluster['longitude']))
+    return {'level': level, 'total': sum(cluster['count'] for cluster in results), 'clusters': results}
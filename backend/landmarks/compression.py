@@ -0,0 +1,71 @@
+"""gzip/brotli bodies for cached landmark reads.
+
+A compressed body is cached next to the plain one (``<key>:<encoding>``), so a
+hot list is compressed once per collection version rather than on every
+request. Brotli is offered when the brotli package is installed.
+"""
+import gzip
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Smaller bodies gain too little to be worth the CPU (and often grow).
+MIN_SIZE = 512
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def available_encodings():
+    """Supported content codings, most preferred first."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def accepted_encodings(header):
+    """``{coding: q}`` from an Accept-Encoding header."""
+    accepted = {}
+    for part in header.split(','):
+        coding, *params = [item.strip() for item in part.split(';')]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.lower()] = q
+    return accepted
+
+
+def negotiate(request):
+    """The coding to send ``request``'s response in, or None for an uncompressed body."""
+    if not getattr(settings, 'LANDMARK_RESPONSE_COMPRESSION', True):
+        return None
+    accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    encodings = available_encodings()
+    weights = {encoding: accepted.get(encoding, accepted.get('*', 0)) for encoding in encodings}
+    best = max(encodings, key=lambda encoding: (weights[encoding], -encodings.index(encoding)))
+    return best if weights[best] > 0 else None
+
+
+def compressible(content):
+    return len(content) >= MIN_SIZE
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=BROTLI_QUALITY)
+    # mtime=0: the same body always compresses to the same bytes.
+    return gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def set_body(response, content, encoding):
+    response.content = content
+    response['Content-Encoding'] = encoding
+    response['Content-Length'] = str(len(content))
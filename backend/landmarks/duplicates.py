@@ -0,0 +1,127 @@
+"""Near-duplicate cover images, found by perceptual hash.
+
+Every cover image gets a 64-bit difference hash (dHash): re-encoded, resized
+or slightly edited copies of a photo hash to values a few bits apart. Hashes
+are stored split into four 16-bit bands (multi-index hashing). Two hashes
+within Hamming distance ``d`` agree on at least one band up to ``d // 4`` bits,
+so a lookup probes each band's index with the few values that close and only
+compares the full hash of the rows it finds.
+"""
+from itertools import combinations
+
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from .caching import bump_collection_version
+from .models import Landmark, LandmarkImageHash
+
+HASH_SIZE = 8
+BANDS = 4
+BAND_BITS = HASH_SIZE * HASH_SIZE // BANDS
+# Photos of the same picture are usually within a few bits of each other.
+DUPLICATE_DISTANCE = 6
+MAX_DISTANCE = 11
+
+
+def dhash(image):
+    """64-bit difference hash: is each pixel brighter than its right neighbour in a 9x8 thumbnail?"""
+    image.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+    image = ImageOps.exif_transpose(image).convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            offset = row * (HASH_SIZE + 1) + col
+            value = (value << 1) | (pixels[offset] > pixels[offset + 1])
+    return value
+
+
+def hash_file(file):
+    """Hash an open image file (an upload), leaving its position unchanged."""
+    position = file.tell()
+    try:
+        with Image.open(file) as image:
+            return dhash(image)
+    finally:
+        file.seek(position)
+
+
+def hash_stored(name, storage=default_storage):
+    with storage.open(name, 'rb') as source, Image.open(source) as image:
+        return dhash(image)
+
+
+def to_signed(value):
+    # BigIntegerField is signed 64-bit.
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def bands(value):
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (BAND_BITS * (BANDS - 1 - index))) & mask for index in range(BANDS)]
+
+
+def hamming(a, b):
+    return (to_unsigned(a) ^ to_unsigned(b)).bit_count()
+
+
+def band_neighbors(band, radius):
+    """Every BAND_BITS-bit value within ``radius`` bits of ``band``."""
+    values = [band]
+    for flips in range(1, radius + 1):
+        for bits in combinations(range(BAND_BITS), flips):
+            flipped = band
+            for bit in bits:
+                flipped ^= 1 << bit
+            values.append(flipped)
+    return values
+
+
+def hash_fields(value):
+    return {'hash': to_signed(value), **{f'band{index}': band for index, band in enumerate(bands(value))}}
+
+
+def store_hashes(hashes):
+    """Save ``[(landmark_id, image_name, hash)]``, skipping landmarks whose image has changed since.
+
+    Returns how many were saved.
+    """
+    current = dict(Landmark.objects.filter(pk__in=[landmark_id for landmark_id, _, _ in hashes]).values_list('pk', 'cover_image'))
+    rows = [
+        LandmarkImageHash(landmark_id=landmark_id, image_name=image_name, **hash_fields(value))
+        for landmark_id, image_name, value in hashes if image_name and current.get(landmark_id) == image_name
+    ]
+    LandmarkImageHash.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['landmark'],
+        update_fields=['image_name', 'hash', *(f'band{index}' for index in range(BANDS))],
+    )
+    # Cached similar-image responses of the owners are now stale.
+    for user_id in set(Landmark.objects.filter(pk__in=[row.landmark_id for row in rows]).values_list('user_id', flat=True)):
+        bump_collection_version(user_id)
+    return len(rows)
+
+
+def store_hash(landmark_id, image_name, value):
+    return store_hashes([(landmark_id, image_name, value)]) == 1
+
+
+def similar(user, value, max_distance=DUPLICATE_DISTANCE, exclude=None):
+    """``[(distance, landmark_id)]`` of ``user``'s cover images within ``max_distance`` bits, closest first."""
+    radius = max_distance // BANDS
+    probe = Q()
+    for index, band in enumerate(bands(value)):
+        probe |= Q(**{f'band{index}__in': band_neighbors(band, radius)})
+    candidates = LandmarkImageHash.objects.filter(probe, landmark__user=user)
+    if exclude is not None:
+        candidates = candidates.exclude(landmark_id=exclude)
+    matches = []
+    for landmark_id, stored in candidates.values_list('landmark_id', 'hash'):
+        distance = hamming(stored, value)
+        if distance <= max_distance:
+            matches.append((distance, landmark_id))
+    return sorted(matches)
@@ -0,0 +1,123 @@
+"""Counts per category, country and creation month for the filter screen.
+
+Filtered views are counted with one GROUP BY over the filtered queryset.
+Unfiltered views are read from LandmarkFacetCount, a per-user table that the
+signal handlers keep current, so they cost a single indexed lookup.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import aggregates
+from .models import Landmark, LandmarkFacetCount
+
+FACETS = ('category', 'country', 'created_month')
+
+
+def month_bucket(value):
+    return timezone.localtime(value).strftime('%Y-%m') if value else ''
+
+
+def facet_entry(user_id, category, country, created_at):
+    if user_id is None:
+        return None
+    return user_id, category or '', country or '', month_bucket(created_at)
+
+
+def landmark_entry(landmark):
+    return facet_entry(landmark.user_id, landmark.category, landmark.country, landmark.created_at)
+
+
+def aggregate(entries, sign=1):
+    totals = defaultdict(lambda: [0])
+    for entry in entries:
+        if entry is None:
+            continue
+        user_id, *values = entry
+        for facet, value in zip(FACETS, values):
+            totals[(user_id, facet, value)][0] += sign
+    return totals
+
+
+def apply_deltas(totals):
+    aggregates.apply_deltas(LandmarkFacetCount, ('user_id', 'facet', 'value'), ('count',), totals)
+
+
+def add(entries):
+    apply_deltas(aggregate(entries))
+
+
+def remove(entries):
+    apply_deltas(aggregate(entries, sign=-1))
+
+
+def move(old, new):
+    if old == new:
+        return
+    totals = aggregate([new])
+    for key, (count,) in aggregate([old], sign=-1).items():
+        totals[key][0] += count
+    apply_deltas(totals)
+
+
+def facet_rows(landmarks):
+    """Yield LandmarkFacetCount fields for ``landmarks`` (a Landmark queryset)."""
+    counts = landmarks.exclude(user=None).order_by().annotate(month=TruncMonth('created_at')).values(
+        'user_id', 'category', 'country', 'month'
+    ).annotate(count=Count('id'))
+    totals = defaultdict(int)
+    for row in counts.iterator():
+        user_id, *values = facet_entry(row['user_id'], row['category'], row['country'], row['month'])
+        for facet, value in zip(FACETS, values):
+            totals[(user_id, facet, value)] += row['count']
+    for (user_id, facet, value), count in totals.items():
+        yield {'user_id': user_id, 'facet': facet, 'value': value, 'count': count}
+
+
+def rebuild(user_ids=None):
+    """Recompute the facet table (all users, or just ``user_ids``)."""
+    stored = LandmarkFacetCount.objects.all()
+    landmarks = Landmark.objects.all()
+    if user_ids is not None:
+        user_ids = [user_id for user_id in user_ids if user_id is not None]
+        stored = stored.filter(user_id__in=user_ids)
+        landmarks = landmarks.filter(user_id__in=user_ids)
+    with transaction.atomic():
+        stored.delete()
+        aggregates.insert_rows(LandmarkFacetCount, facet_rows(landmarks))
+
+
+def format_facets(counts):
+    """``{facet: {value: count}}`` -> the response body."""
+    facets = {}
+    for facet in FACETS:
+        values = counts.get(facet, {})
+        if facet == 'created_month':
+            ordered = sorted(values.items(), reverse=True)
+        else:
+            ordered = sorted(values.items(), key=lambda item: (-item[1], item[0]))
+        facets[facet] = [{'value': value or None, 'count': count} for value, count in ordered]
+    return {'count': sum(counts.get('category', {}).values()), 'facets': facets}
+
+
+def stored_facets(user):
+    counts = defaultdict(dict)
+    for facet, value, count in LandmarkFacetCount.objects.filter(user=user).values_list('facet', 'value', 'count'):
+        counts[facet][value] = count
+    return format_facets(counts)
+
+
+def queryset_facets(queryset):
+    """Facet counts for any (filtered) landmark queryset in one aggregate query."""
+    rows = queryset.order_by().annotate(month=TruncMonth('created_at')).values(
+        'category', 'country', 'month'
+    ).annotate(count=Count('id'))
+    counts = defaultdict(lambda: defaultdict(int))
+    for row in rows:
+        _, *values = facet_entry(0, row['category'], row['country'], row['month'])
+        for facet, value in zip(FACETS, values):
+            counts[facet][value] += row['count']
+    return format_facets(counts)
@@ -0,0 +1,112 @@
+import hashlib
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from . import duplicates
+from .jobs import job
+
+logger = logging.getLogger(__name__)
+
+VARIANT_WIDTHS = (160, 480, 1080)
+VARIANT_FORMATS = {
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+}
+VARIANT_DIR = 'landmarks/variants'
+
+
+def source_digest(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def render_variants(name, storage=default_storage):
+    """Write resized JPEG/WebP copies of the image stored at ``name``.
+
+    Returns ``{width: {format: stored_name}}``. File names embed a hash of the
+    source bytes, so a given name always refers to the same content. Touches
+    only storage, never the database, so it is safe to run in worker processes.
+    """
+    with storage.open(name, 'rb') as source:
+        data = source.read()
+    digest = source_digest(data)
+    stem = os.path.splitext(os.path.basename(name))[0]
+
+    with Image.open(BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        variants = {}
+        for width in VARIANT_WIDTHS:
+            if width > image.width and variants:
+                break
+            resized = image.copy()
+            resized.thumbnail((width, width * 4), Image.LANCZOS)
+            variants[str(width)] = {}
+            for key, (pil_format, extension, options) in VARIANT_FORMATS.items():
+                target = f'{VARIANT_DIR}/{stem}.{digest}.{width}w.{extension}'
+                if not storage.exists(target):
+                    buffer = BytesIO()
+                    resized.save(buffer, pil_format, **options)
+                    target = storage.save(target, ContentFile(buffer.getvalue()))
+                variants[str(width)][key] = target
+    return variants
+
+
+def variant_names(variants):
+    return {name for formats in (variants or {}).values() for name in formats.values()}
+
+
+def image_in_use(name, exclude_pk=None):
+    """Whether another landmark has ``name`` as its cover image (and so shares its variants)."""
+    from .models import Landmark
+
+    return bool(name) and Landmark.objects.filter(cover_image=name).exclude(pk=exclude_pk).exists()
+
+
+def delete_variants(variants, keep=(), storage=default_storage):
+    for name in variant_names(variants) - set(keep):
+        try:
+            storage.delete(name)
+        except OSError:
+            logger.warning(f"Could not delete image variant {name}")
+
+
+def store_variants(landmark_id, image_name, variants):
+    """Attach ``variants`` if the landmark still has the image they were made from."""
+    from .caching import bump_collection_version
+    from .models import Landmark
+
+    row = Landmark.objects.filter(pk=landmark_id).values('user_id', 'cover_image', 'cover_image_variants').first()
+    if row is None or row['cover_image'] != image_name:
+        delete_variants(variants)
+        return False
+    # updated_at too: delta sync pages on it, so clients that already have the row pick up the variants.
+    Landmark.objects.filter(pk=landmark_id, cover_image=image_name).update(
+        cover_image_variants=variants, updated_at=timezone.now()
+    )
+    delete_variants(row['cover_image_variants'], keep=variant_names(variants))
+    bump_collection_version(row['user_id'])
+    return True
+
+
+@job(max_attempts=3)
+def process_cover_image(landmark_id, image_name):
+    variants = render_variants(image_name)
+    if not store_variants(landmark_id, image_name, variants):
+        return None
+    duplicates.store_hash(landmark_id, image_name, duplicates.hash_stored(image_name))
+    logger.info(f"Generated {len(variant_names(variants))} variants for landmark {landmark_id}")
+    return variants
+
+
+def schedule_variants(landmark_id, image_name, user_id=None):
+    """Queue variant generation; workers pick it up once the current transaction commits."""
+    return process_cover_image.enqueue(
+        (landmark_id, image_name), user_id=user_id, idempotency_key=f'variants:{landmark_id}:{image_name}'
+    )
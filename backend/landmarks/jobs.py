@@ -0,0 +1,216 @@
+"""Background jobs kept in the database and run by ``manage.py run_workers``.
+
+Decorate a function with ``@job`` and call ``func.delay(*args, **kwargs)`` to
+queue the call instead of making it. The Job row is written in the caller's
+transaction: a job queued by a write that rolls back never runs, and no worker
+sees a job before the rows it needs are committed.
+
+Workers claim jobs with a conditional UPDATE, so no broker or row locks are
+needed and it works on SQLite. A job that raises is retried with exponential
+backoff until it has run ``max_attempts`` times; a job whose worker died is
+retried once it has been running for ``LANDMARK_JOB_TIMEOUT`` seconds. With
+``LANDMARK_JOBS_EAGER`` jobs run once, in the calling process, as soon as the
+transaction commits.
+"""
+import functools
+import logging
+import os
+import random
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import uploads
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRY_DELAY = 3600
+# How often a worker requeues abandoned jobs and prunes finished ones (and expired uploads), in seconds.
+MAINTENANCE_INTERVAL = 60
+
+registry = {}
+
+
+def eager():
+    return getattr(settings, 'LANDMARK_JOBS_EAGER', False)
+
+
+def retry_delay(attempts, base=None):
+    """Seconds to wait before retrying a job that has failed ``attempts`` times."""
+    base = base if base is not None else getattr(settings, 'LANDMARK_JOB_RETRY_DELAY', 10)
+    return min(base * 2 ** (attempts - 1), MAX_RETRY_DELAY) * random.uniform(1, 1.25)
+
+
+class Task:
+    def __init__(self, func, name=None, max_attempts=3, retry_delay=None):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.name = name or f'{func.__module__}.{func.__qualname__}'
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        registry[self.name] = self
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        return self.enqueue(args, kwargs)
+
+    def enqueue(self, args=(), kwargs=None, user_id=None, idempotency_key=None, run_at=None):
+        """Queue a call and return its Job.
+
+        While a job with ``idempotency_key`` is queued, running or has
+        succeeded, enqueueing the same key again returns that job instead of
+        queueing another one. A job that failed for good is queued again with
+        fresh attempts.
+        """
+        fields = {
+            'name': self.name, 'args': list(args), 'kwargs': kwargs or {}, 'user_id': user_id,
+            'max_attempts': self.max_attempts, 'run_at': run_at or timezone.now(),
+        }
+        if idempotency_key is None:
+            job = Job.objects.create(**fields)
+        else:
+            job = Job.objects.filter(idempotency_key=idempotency_key).first()
+            if job is not None:
+                if job.status != Job.FAILED or not self.requeue(job, fields):
+                    return job
+                job.refresh_from_db()
+            else:
+                try:
+                    with transaction.atomic():
+                        job = Job.objects.create(idempotency_key=idempotency_key, **fields)
+                except IntegrityError:
+                    return Job.objects.get(idempotency_key=idempotency_key)
+        if eager():
+            transaction.on_commit(lambda: run_now(job.pk))
+        return job
+
+    def requeue(self, job, fields):
+        # Conditional, so concurrent enqueues of the same key requeue it once.
+        return Job.objects.filter(pk=job.pk, status=Job.FAILED).update(
+            status=Job.QUEUED, attempts=0, locked_by='', locked_at=None, result=None, error='', finished_at=None,
+            **fields,
+        )
+
+
+def job(func=None, *, name=None, max_attempts=3, retry_delay=None):
+    """Make ``func`` queueable: ``func.delay(...)`` runs it in a worker."""
+    if func is None:
+        return functools.partial(job, name=name, max_attempts=max_attempts, retry_delay=retry_delay)
+    return Task(func, name=name, max_attempts=max_attempts, retry_delay=retry_delay)
+
+
+def get_task(name):
+    if name not in registry:
+        # Importing the function's module registers it.
+        import_string(name)
+    return registry[name]
+
+
+def claim(worker_id, candidates=10):
+    """Mark the next due job as running for ``worker_id`` and return it (None when idle)."""
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('run_at', 'id')
+    for job_id in due.values_list('id', flat=True)[:candidates]:
+        # Another worker may have claimed it (and even failed and requeued it for
+        # later) since; only one UPDATE wins.
+        if Job.objects.filter(pk=job_id, status=Job.QUEUED, run_at__lte=now).update(
+            status=Job.RUNNING, locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1
+        ):
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome; returns whether it succeeded."""
+    try:
+        result = get_task(job.name).func(*job.args, **job.kwargs)
+    except Exception:
+        logger.exception(f'Job {job} failed (attempt {job.attempts} of {job.max_attempts})')
+        retry_or_fail(job, traceback.format_exc())
+        return False
+    Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by).update(
+        status=Job.SUCCEEDED, result=result, error='', locked_at=None, finished_at=timezone.now()
+    )
+    return True
+
+
+def retry_or_fail(job, error):
+    now = timezone.now()
+    running = Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by)
+    if job.attempts < job.max_attempts:
+        task = registry.get(job.name)
+        delay = retry_delay(job.attempts, task.retry_delay if task is not None else None)
+        running.update(status=Job.QUEUED, error=error, locked_by='', locked_at=None, run_at=now + timedelta(seconds=delay))
+    else:
+        running.update(status=Job.FAILED, error=error, locked_at=None, finished_at=now)
+
+
+def run_now(job_id):
+    """Run a queued job in this process (eager mode)."""
+    if Job.objects.filter(pk=job_id, status=Job.QUEUED).update(
+        status=Job.RUNNING, locked_by=f'eager:{os.getpid()}', locked_at=timezone.now(), attempts=F('attempts') + 1
+    ):
+        run_job(Job.objects.get(pk=job_id))
+
+
+def requeue_stale(timeout=None):
+    """Retry (or fail) jobs whose worker has held them longer than ``timeout`` seconds."""
+    timeout = timeout if timeout is not None else getattr(settings, 'LANDMARK_JOB_TIMEOUT', 600)
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=timezone.now() - timedelta(seconds=timeout))
+    for job in stale:
+        retry_or_fail(job, f'Worker {job.locked_by} did not finish the job within {timeout} seconds')
+    return len(stale)
+
+
+def prune_finished(days=None):
+    days = days if days is not None else getattr(settings, 'LANDMARK_JOB_RETENTION_DAYS', 7)
+    deleted, _ = Job.objects.filter(
+        status__in=(Job.SUCCEEDED, Job.FAILED), finished_at__lt=timezone.now() - timedelta(days=days)
+    ).delete()
+    return deleted
+
+
+def close_stale_connections():
+    # Between jobs, like between requests; never inside a caller's transaction.
+    for connection in connections.all(initialized_only=True):
+        if not connection.in_atomic_block:
+            connection.close_if_unusable_or_obsolete()
+
+
+def work(worker_id=None, burst=False, poll_interval=1.0, stop=None):
+    """Claim and run jobs until ``stop`` (a threading.Event) is set.
+
+    With ``burst`` return as soon as no job is due. Returns the number of jobs run.
+    """
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+    processed = 0
+    last_maintenance = None
+    while stop is None or not stop.is_set():
+        if last_maintenance is None or time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL:
+            requeue_stale()
+            prune_finished()
+            uploads.prune_uploads()
+            last_maintenance = time.monotonic()
+        job = claim(worker_id)
+        if job is None:
+            if burst:
+                break
+            if stop is not None:
+                stop.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+            continue
+        run_job(job)
+        processed += 1
+        close_stale_connections()
+    return processed
@@ -1,5 +1,7 @@
 from django.core.management.base import BaseCommand
+from django.utils import timezone
 from landmarks.models import Landmark, User
+from landmarks.signals import landmarks_bulk_changed
 
 class Command(BaseCommand):
     help = 'Assigns all unassigned landmarks to a specified user email'
@@ -18,7 +20,8 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.WARNING('No unassigned landmarks found'))
                 return
                 
-            unassigned_landmarks.update(user=user)
+            unassigned_landmarks.update(user=user, updated_at=timezone.now())
+            landmarks_bulk_changed.send(sender=Landmark, user_ids={user.pk})
             self.stdout.write(
                 self.style.SUCCESS(f'Successfully assigned {count} landmarks to user {email}')
             )
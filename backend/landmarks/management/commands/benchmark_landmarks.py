@@ -0,0 +1,111 @@
+import json
+import platform
+import sqlite3
+import subprocess
+import time
+
+import django
+import rest_framework
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from landmarks import benchmarks, synthetic
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the landmarks API against a throwaway database filled with synthetic data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=10000, help='Synthetic landmarks to generate')
+        parser.add_argument('--users', type=int, default=100, help='Users the landmarks are spread over')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for data and requests')
+        parser.add_argument('--suite', action='append', choices=sorted(benchmarks.SUITES),
+                            help='Suite to run; repeat for several (default: all)')
+        parser.add_argument('--cold', action='store_true', help='Clear the response cache before every request')
+        parser.add_argument('--output', default='benchmark-results.json', help='Where to write the JSON results')
+        parser.add_argument('--db-file', default=None,
+                            help='SQLite file for the benchmark database (default: in memory)')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the benchmark database and reuse its data on the next run')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['keepdb'] and not kwargs['db_file']:
+            raise CommandError('--keepdb needs --db-file')
+        if kwargs['db_file']:
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = kwargs['db_file']
+
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=kwargs['keepdb'])
+        try:
+            results = self.run(kwargs)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=kwargs['keepdb'])
+            teardown_test_environment()
+
+        with open(kwargs['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote results to {kwargs['output']}"))
+
+    def run(self, kwargs):
+        users = synthetic.create_users(kwargs['users'])
+        existing = synthetic.Landmark.objects.count()
+        start = time.perf_counter()
+        if existing < kwargs['size']:
+            self.stdout.write(f"Generating {kwargs['size'] - existing} landmarks...")
+            synthetic.generate_landmarks(kwargs['size'] - existing, users, seed=kwargs['seed'] + existing)
+        generation_seconds = time.perf_counter() - start
+
+        suites = {}
+        for name in kwargs['suite'] or list(benchmarks.SUITES):
+            self.stdout.write(f'Running {name} suite...')
+            suites[name] = benchmarks.SUITES[name](users, kwargs['requests'], seed=kwargs['seed'], cold=kwargs['cold'])
+            for scenario, stats in suites[name].items():
+                if 'latency_ms' not in stats:
+                    self.stdout.write(f"  {scenario:<20} " + '  '.join(f'{key} {value}' for key, value in stats.items()))
+                    continue
+                latency = stats['latency_ms']
+                line = (
+                    f"  {scenario:<20} p50 {latency['p50']:>8.2f}ms  p95 {latency['p95']:>8.2f}ms  "
+                    f"p99 {latency['p99']:>8.2f}ms  {stats['throughput_rps']:>8.1f} req/s"
+                )
+                if 'queries' in stats:
+                    line += f"  {stats['queries']['mean']:>5.1f} queries"
+                if 'time_to_first_byte_ms' in stats:
+                    line += f"  ttfb p95 {stats['time_to_first_byte_ms']['p95']:>8.2f}ms"
+                if 'cpu_ms' in stats:
+                    line += f"  cpu p50 {stats['cpu_ms']['p50']:>8.2f}ms  {stats['response_bytes_mean']:>9} bytes"
+                self.stdout.write(line)
+
+        return {
+            'commit': git_commit(),
+            'timestamp': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'djangorestframework': rest_framework.VERSION,
+                'sqlite': sqlite3.sqlite_version,
+                'platform': platform.platform(),
+            },
+            'dataset': {
+                'landmarks': synthetic.Landmark.objects.count(),
+                'users': len(users),
+                'seed': kwargs['seed'],
+                'generation_seconds': round(generation_seconds, 2),
+            },
+            'options': {'requests': kwargs['requests'], 'cold': kwargs['cold']},
+            'suites': suites,
+        }
@@ -0,0 +1,50 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from landmarks import images
+from landmarks.models import Landmark
+
+
+def render(landmark_id, image_name):
+    try:
+        return landmark_id, image_name, images.render_variants(image_name), None
+    except Exception as e:
+        return landmark_id, image_name, None, str(e)
+
+
+class Command(BaseCommand):
+    help = 'Generates resized JPEG/WebP variants for existing cover images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+        parser.add_argument('--force', action='store_true', help='Regenerate variants that already exist')
+        parser.add_argument('--batch-size', type=int, default=500, help='Landmarks submitted per batch')
+
+    def handle(self, *args, **kwargs):
+        landmarks = Landmark.objects.exclude(cover_image='').exclude(cover_image__isnull=True)
+        if not kwargs['force']:
+            landmarks = landmarks.filter(cover_image_variants__isnull=True)
+        pending = list(landmarks.order_by('pk').values_list('pk', 'cover_image'))
+        if not pending:
+            self.stdout.write(self.style.WARNING('No cover images need variants'))
+            return
+
+        # Workers only touch storage; don't let them inherit open database connections.
+        connections.close_all()
+        done = failed = 0
+        batch_size = kwargs['batch_size']
+        with ProcessPoolExecutor(max_workers=kwargs['workers']) as pool:
+            for start in range(0, len(pending), batch_size):
+                futures = [pool.submit(render, pk, name) for pk, name in pending[start:start + batch_size]]
+                for future in as_completed(futures):
+                    landmark_id, image_name, variants, error = future.result()
+                    if error:
+                        failed += 1
+                        self.stdout.write(self.style.WARNING(f'Landmark {landmark_id} ({image_name}): {error}'))
+                    elif images.store_variants(landmark_id, image_name, variants):
+                        done += 1
+                self.stdout.write(f'Processed {min(start + batch_size, len(pending))}/{len(pending)}')
+
+        self.stdout.write(self.style.SUCCESS(f'Generated variants for {done} landmarks ({failed} failed)'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from landmarks import synthetic
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with synthetic landmarks for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000, help='Landmarks to create')
+        parser.add_argument('--users', type=int, default=100, help='Users the landmarks are spread over')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same data')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows inserted per transaction')
+
+    def handle(self, *args, **kwargs):
+        users = synthetic.create_users(kwargs['users'])
+        created = synthetic.generate_landmarks(
+            kwargs['count'], users, seed=kwargs['seed'], batch_size=kwargs['batch_size'],
+            progress=lambda done: self.stdout.write(f"Created {done}/{kwargs['count']}"),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Created {created} landmarks for {len(users)} users'))
@@ -0,0 +1,52 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from landmarks import duplicates
+from landmarks.models import Landmark
+
+
+def compute(landmark_id, image_name):
+    try:
+        return landmark_id, image_name, duplicates.hash_stored(image_name), None
+    except Exception as e:
+        return landmark_id, image_name, None, str(e)
+
+
+class Command(BaseCommand):
+    help = 'Computes perceptual hashes of existing cover images for near-duplicate detection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+        parser.add_argument('--force', action='store_true', help='Rehash images that already have a hash')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Images submitted per batch')
+
+    def handle(self, *args, **kwargs):
+        landmarks = Landmark.objects.exclude(cover_image='').exclude(cover_image__isnull=True)
+        if not kwargs['force']:
+            landmarks = landmarks.filter(image_hash__isnull=True)
+        pending = list(landmarks.order_by('pk').values_list('pk', 'cover_image'))
+        if not pending:
+            self.stdout.write(self.style.WARNING('No cover images need hashing'))
+            return
+
+        # Workers only read storage; don't let them inherit open database connections.
+        connections.close_all()
+        done = failed = 0
+        batch_size = kwargs['batch_size']
+        with ProcessPoolExecutor(max_workers=kwargs['workers']) as pool:
+            for start in range(0, len(pending), batch_size):
+                futures = [pool.submit(compute, pk, name) for pk, name in pending[start:start + batch_size]]
+                hashes = []
+                for future in as_completed(futures):
+                    landmark_id, image_name, value, error = future.result()
+                    if error:
+                        failed += 1
+                        self.stdout.write(self.style.WARNING(f'Landmark {landmark_id} ({image_name}): {error}'))
+                    else:
+                        hashes.append((landmark_id, image_name, value))
+                done += duplicates.store_hashes(hashes)
+                self.stdout.write(f'Processed {min(start + batch_size, len(pending))}/{len(pending)}')
+
+        self.stdout.write(self.style.SUCCESS(f'Hashed {done} cover images ({failed} failed)'))
@@ -0,0 +1,33 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from landmarks import bulk
+from landmarks.models import User
+
+
+class Command(BaseCommand):
+    help = 'Imports landmarks for a user from an NDJSON or CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='File to import')
+        parser.add_argument('email', type=str, help='The email of the user who will own the landmarks')
+        parser.add_argument('--format', choices=['ndjson', 'csv'], default=None,
+                            help='File format (default: guessed from the extension)')
+        parser.add_argument('--batch-size', type=int, default=bulk.DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **kwargs):
+        try:
+            user = User.objects.get(email=kwargs['email'])
+        except User.DoesNotExist:
+            raise CommandError(f"User with email {kwargs['email']} does not exist")
+
+        file_format = kwargs['format'] or ('csv' if kwargs['path'].endswith('.csv') else 'ndjson')
+        parse = bulk.parse_csv if file_format == 'csv' else bulk.parse_ndjson
+        with open(kwargs['path'], 'rb') as stream:
+            report = bulk.import_rows(parse(stream), user, batch_size=kwargs['batch_size'])
+
+        for error in report['errors']:
+            self.stdout.write(self.style.WARNING(f"Line {error['line']}: {json.dumps(error['errors'])}"))
+        style = self.style.SUCCESS if not report['failed'] else self.style.WARNING
+        self.stdout.write(style(f"Imported {report['created']} landmarks, {report['failed']} rows failed"))
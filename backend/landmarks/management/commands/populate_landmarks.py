@@ -1,144 +1,188 @@
+import hashlib
+import json
 import os
-import requests
-from django.core.files import File
-from django.core.files.temp import NamedTemporaryFile
-from django.core.management.base import BaseCommand
-from landmarks.models import Landmark
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from requests.adapters import HTTPAdapter
+
+from landmarks import bulk, images
+from landmarks.models import Landmark, User
+from landmarks.signals import landmarks_bulk_changed
+
+SAMPLE_DATA = os.path.join(os.path.dirname(bulk.__file__), 'data', 'sample_landmarks.jsonl')
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
 
 class Command(BaseCommand):
-    help = "Populates the database with real landmarks"
+    help = "Populates the database with landmarks from a JSONL or CSV file, downloading cover images"
 
-    def download_image(self, url, retries=3):
-        for attempt in range(retries):
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=SAMPLE_DATA,
+                            help='JSONL or CSV file with one landmark per row (default: bundled sample)')
+        parser.add_argument('--format', choices=['jsonl', 'csv'], default=None,
+                            help='File format (default: guessed from the extension)')
+        parser.add_argument('--user', default=None, help='Email of the user who will own the landmarks')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent image downloads')
+        parser.add_argument('--batch-size', type=int, default=100, help='Rows inserted per transaction')
+        parser.add_argument('--retries', type=int, default=4, help='Download attempts per image')
+        parser.add_argument('--backoff', type=float, default=0.5, help='Initial retry delay in seconds')
+        parser.add_argument('--timeout', type=float, default=10, help='Per-request timeout in seconds')
+        parser.add_argument('--checkpoint', default=None,
+                            help='Progress file used to resume (default: <path>.checkpoint next to the input)')
+        parser.add_argument('--clear', action='store_true', help='Delete all existing landmarks first')
+
+    def create_session(self, pool_size):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def download_image(self, url):
+        """Fetch ``url`` with exponential backoff; returns the body or None."""
+        for attempt in range(self.retries):
             try:
-                response = requests.get(url, timeout=10)
+                response = self.session.get(url, timeout=self.timeout)
                 if response.status_code == 200:
-                    img_temp = NamedTemporaryFile(delete=True)
-                    img_temp.write(response.content)
-                    img_temp.flush()
-                    return img_temp
-                else:
+                    return response.content
+                if response.status_code not in RETRY_STATUSES:
                     self.stdout.write(self.style.WARNING(f'Failed to download image (status {response.status_code}): {url}'))
-            except Exception as e:
-                self.stdout.write(self.style.WARNING(f'Attempt {attempt + 1}/{retries} failed for {url}: {str(e)}'))
-                if attempt < retries - 1:
-                    time.sleep(1)  # Wait before retrying
+                    return None
+                reason = f'status {response.status_code}'
+            except requests.RequestException as e:
+                reason = str(e)
+            self.stdout.write(self.style.WARNING(f'Attempt {attempt + 1}/{self.retries} failed for {url}: {reason}'))
+            if attempt < self.retries - 1:
+                self.sleep(self.backoff * 2 ** attempt * (1 + random.random() / 2))
         return None
 
+    def fetch_cover_image(self, row):
+        url = row.get('image_url')
+        if not url:
+            return None
+        content = self.download_image(url)
+        if content is None:
+            return None
+        file_name = f"landmarks/{(row.get('title') or 'landmark').lower().replace(' ', '_')}.jpg"
+        return default_storage.save(file_name, ContentFile(content))
+
+    def row_key(self, row):
+        if row.get('external_id'):
+            return str(row['external_id'])
+        identity = json.dumps([row.get('title'), str(row.get('latitude')), str(row.get('longitude'))])
+        return hashlib.sha1(identity.encode()).hexdigest()
+
+    def load_checkpoint(self, path):
+        if not os.path.exists(path):
+            return set()
+        with open(path) as f:
+            return {line.strip() for line in f if line.strip()}
+
+    def save_checkpoint(self, path, keys):
+        with open(path, 'a') as f:
+            f.writelines(f'{key}\n' for key in keys)
+            f.flush()
+            os.fsync(f.fileno())
+
     def handle(self, *args, **kwargs):
-        # Clear existing landmarks
-        Landmark.objects.all().delete()
-        
-        landmarks = [
-            {
-                "title": "Eiffel Tower",
-                "category": "HISTORICAL",
-                "description": "The Eiffel Tower is a wrought-iron lattice tower located on the Champ de Mars in Paris. Built in 1889, it has become both a global cultural icon of France and one of the most recognizable structures in the world.",
-                "latitude": 48.8584,
-                "longitude": 2.2945,
-                "country": "France",
-                "image_url": "https://images.pexels.com/photos/2082103/pexels-photo-2082103.jpeg"
-            },
-            {
-                "title": "Taj Mahal",
-                "category": "HISTORICAL",
-                "description": "The Taj Mahal is an ivory-white marble mausoleum on the right bank of the river Yamuna in Agra, India. It was commissioned in 1632 by the Mughal emperor Shah Jahan to house the tomb of his favorite wife, Mumtaz Mahal.",
-                "latitude": 27.1751,
-                "longitude": 78.0421,
-                "country": "India",
-                "image_url": "https://images.pexels.com/photos/1603650/pexels-photo-1603650.jpeg"
-            },
-            {
-                "title": "Great Wall of China",
-                "category": "HISTORICAL",
-                "description": "The Great Wall of China is a series of fortifications that were built across the historical northern borders of ancient Chinese states and Imperial China as protection against nomadic incursions.",
-                "latitude": 40.4319,
-                "longitude": 116.5704,
-                "country": "China",
-                "image_url": "https://images.pexels.com/photos/2412603/pexels-photo-2412603.jpeg"
-            },
-            {
-                "title": "Machu Picchu",
-                "category": "HISTORICAL",
-                "description": "Machu Picchu is an Incan citadel set high in the Andes Mountains in Peru. Built in the 15th century and later abandoned, it is renowned for its sophisticated dry-stone walls that fuse huge blocks without the use of mortar.",
-                "latitude": -13.1631,
-                "longitude": -72.5450,
-                "country": "Peru",
-                "image_url": "https://images.pexels.com/photos/2356045/pexels-photo-2356045.jpeg"
-            },
-            {
-                "title": "Grand Canyon",
-                "category": "NATURAL",
-                "description": "The Grand Canyon is a steep-sided canyon carved by the Colorado River in Arizona. The canyon is 277 miles long, up to 18 miles wide and attains a depth of over a mile.",
-                "latitude": 36.0544,
-                "longitude": -112.1401,
-                "country": "United States",
-                "image_url": "https://images.pexels.com/photos/33041/antelope-canyon-lower-canyon-arizona.jpg"
-            },
-            {
-                "title": "Petra",
-                "category": "HISTORICAL",
-                "description": "Petra is a famous archaeological site in Jordans southwestern desert. Dating to around 300 B.C., it was the capital of the Nabataean Kingdom. It is accessed via a narrow canyon called Al Siq.",
-                "latitude": 30.3285,
-                "longitude": 35.4444,
-                "country": "Jordan",
-                "image_url": "https://images.pexels.com/photos/1631665/pexels-photo-1631665.jpeg"
-            },
-            {
-                "title": "Christ the Redeemer",
-                "category": "RELIGIOUS",
-                "description": "Christ the Redeemer is an Art Deco statue of Jesus Christ in Rio de Janeiro, Brazil. Created by French sculptor Paul Landowski, it is 98 feet tall, not including its 26-foot pedestal, and its arms stretch 92 feet wide.",
-                "latitude": -22.9519,
-                "longitude": -43.2105,
-                "country": "Brazil",
-                "image_url": "https://images.pexels.com/photos/2868242/pexels-photo-2868242.jpeg"
-            },
-            {
-                "title": "Colosseum",
-                "category": "HISTORICAL",
-                "description": "The Colosseum is an oval amphitheatre in the centre of Rome, Italy. Built of travertine limestone, tuff, and brick-faced concrete, it is the largest amphitheatre ever built and was used for gladiatorial contests and public spectacles.",
-                "latitude": 41.8902,
-                "longitude": 12.4922,
-                "country": "Italy",
-                "image_url": "https://images.pexels.com/photos/1797161/pexels-photo-1797161.jpeg"
-            },
-            {
-                "title": "Northern Lights",
-                "category": "NATURAL",
-                "description": "The Aurora Borealis (Northern Lights) is a natural light display in the Earths sky, predominantly seen in high-latitude regions. Tromso, Norway is one of the best places to view this phenomenon.",
-                "latitude": 69.6492,
-                "longitude": 18.9553,
-                "country": "Norway",
-                "image_url": "https://images.pexels.com/photos/1933239/pexels-photo-1933239.jpeg"
-            },
-            {
-                "title": "Angkor Wat",
-                "category": "RELIGIOUS",
-                "description": "Angkor Wat is a temple complex in Cambodia and is the largest religious monument in the world. Originally constructed as a Hindu temple dedicated to the god Vishnu for the Khmer Empire, it was gradually transformed into a Buddhist temple.",
-                "latitude": 13.4125,
-                "longitude": 103.8670,
-                "country": "Cambodia",
-                "image_url": "https://images.pexels.com/photos/3290071/pexels-photo-3290071.jpeg"
-            }
-        ]
-
-        for landmark_data in landmarks:
-            # Extract the image URL and remove it from the data dict
-            image_url = landmark_data.pop('image_url')
-            
-            # Create the landmark without the image first
-            landmark = Landmark.objects.create(**landmark_data)
-            
-            # Download and attach the image
-            if image_url:
-                img_temp = self.download_image(image_url)
-                if img_temp:
-                    file_name = f"{landmark.title.lower().replace(' ', '_')}.jpg"
-                    landmark.cover_image.save(file_name, File(img_temp), save=True)
-                    img_temp.close()
-                    self.stdout.write(self.style.SUCCESS(f'Successfully created landmark "{landmark.title}" with image'))
-                else:
-                    self.stdout.write(self.style.WARNING(f'Created landmark "{landmark.title}" but failed to download image'))
+        path = kwargs['path']
+        if not os.path.exists(path):
+            raise CommandError(f'File {path} does not exist')
+        user = None
+        if kwargs['user']:
+            try:
+                user = User.objects.get(email=kwargs['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User with email {kwargs['user']} does not exist")
+
+        self.retries = max(1, kwargs['retries'])
+        self.backoff = kwargs['backoff']
+        self.timeout = kwargs['timeout']
+        self.session = self.create_session(kwargs['workers'])
+        checkpoint = kwargs['checkpoint'] or f'{path}.checkpoint'
+
+        if kwargs['clear']:
+            Landmark.objects.all().delete()
+            if os.path.exists(checkpoint):
+                os.remove(checkpoint)
+        done = self.load_checkpoint(checkpoint)
+        if done:
+            self.stdout.write(f'Resuming: {len(done)} rows already imported')
+
+        file_format = kwargs['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        parse = bulk.parse_csv if file_format == 'csv' else bulk.parse_ndjson
+        self.created = self.skipped = self.failed = 0
+
+        with open(path, 'rb') as stream, ThreadPoolExecutor(max_workers=kwargs['workers']) as pool:
+            batch = []
+            for number, row, error in parse(stream):
+                if error:
+                    self.failed += 1
+                    self.stdout.write(self.style.WARNING(f'Line {number}: {error}'))
+                    continue
+                key = self.row_key(row)
+                if key in done:
+                    self.skipped += 1
+                    continue
+                batch.append((number, key, row))
+                if len(batch) >= kwargs['batch_size']:
+                    self.import_batch(batch, user, pool, checkpoint)
+                    batch = []
+            if batch:
+                self.import_batch(batch, user, pool, checkpoint)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {self.created} landmarks ({self.skipped} already imported, {self.failed} failed)'
+        ))
+
+    def import_batch(self, batch, user, pool, checkpoint):
+        landmarks, keys = [], []
+        built = []
+        for number, key, row in batch:
+            landmark, errors = bulk.build_landmark(row, user)
+            if errors:
+                self.failed += 1
+                self.stdout.write(self.style.WARNING(f'Line {number}: {json.dumps(errors)}'))
+                continue
+            built.append((key, row, landmark))
+
+        # Rows from an interrupted run may already be in the table without a checkpoint entry.
+        existing = set(Landmark.objects.filter(
+            user=user, title__in=[landmark.title for _, _, landmark in built]
+        ).values_list('title', 'latitude', 'longitude'))
+
+        pending = []
+        for key, row, landmark in built:
+            if (landmark.title, landmark.latitude, landmark.longitude) in existing:
+                self.skipped += 1
+                keys.append(key)
             else:
-                self.stdout.write(self.style.SUCCESS(f'Successfully created landmark "{landmark.title}" without image')) 
\ No newline at end of file
+                pending.append((key, row, landmark))
+
+        for (key, row, landmark), image_name in zip(pending, pool.map(lambda item: self.fetch_cover_image(item[1]), pending)):
+            if image_name:
+                landmark.cover_image = image_name
+            elif row.get('image_url'):
+                self.stdout.write(self.style.WARNING(f'Created landmark "{landmark.title}" but failed to download image'))
+            landmarks.append(landmark)
+            keys.append(key)
+
+        with transaction.atomic():
+            created = Landmark.objects.bulk_create(landmarks)
+            landmarks_bulk_changed.send(sender=Landmark, user_ids={user.pk if user else None}, created=created)
+            for landmark in created:
+                if landmark.cover_image:
+                    images.schedule_variants(landmark.pk, landmark.cover_image.name, landmark.user_id)
+        self.save_checkpoint(checkpoint, keys)
+        self.created += len(created)
+        self.stdout.write(f'Imported batch of {len(created)} landmarks')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from landmarks import batch
+
+
+class Command(BaseCommand):
+    help = 'Deletes stored batch responses older than LANDMARK_BATCH_RETENTION_DAYS'
+
+    def handle(self, *args, **kwargs):
+        deleted = batch.prune_batches()
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} batch records'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from landmarks import sync
+
+
+class Command(BaseCommand):
+    help = 'Deletes landmark deletion records older than LANDMARK_TOMBSTONE_RETENTION_DAYS'
+
+    def handle(self, *args, **kwargs):
+        deleted = sync.prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} tombstones'))
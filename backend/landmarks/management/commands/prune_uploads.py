@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from landmarks import uploads
+
+
+class Command(BaseCommand):
+    help = 'Deletes resumable uploads idle for longer than LANDMARK_UPLOAD_EXPIRY_HOURS and their partial files'
+
+    def handle(self, *args, **kwargs):
+        deleted = uploads.prune_uploads()
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} uploads'))
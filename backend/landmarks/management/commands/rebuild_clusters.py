@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from landmarks import clusters
+from landmarks.models import LandmarkGridCell
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the map cluster grid from the landmarks table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Only rebuild this user id; repeat for several (default: everyone)')
+
+    def handle(self, *args, **kwargs):
+        clusters.rebuild(kwargs['user_ids'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {LandmarkGridCell.objects.count()} grid cells'))
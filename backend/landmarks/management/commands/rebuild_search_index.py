@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from landmarks import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index from the landmarks table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to rebuild')
+
+    def handle(self, *args, **kwargs):
+        connection = connections[kwargs['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError('The full-text index is only available on SQLite')
+        search.install_fts(connection, rebuild=True)
+        self.stdout.write(self.style.SUCCESS('Successfully rebuilt the search index'))
@@ -0,0 +1,70 @@
+import multiprocessing
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from landmarks import jobs
+
+
+def run_worker(burst, poll_interval):
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        # Finish the current job, then exit.
+        signal.signal(signum, lambda *args: stop.set())
+    try:
+        return jobs.work(burst=burst, poll_interval=poll_interval, stop=stop)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs (image variants, ...) in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Worker processes (default: LANDMARK_JOB_WORKERS)')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due instead of waiting for more')
+
+    def handle(self, *args, **kwargs):
+        processes = kwargs['processes'] or getattr(settings, 'LANDMARK_JOB_WORKERS', 2)
+        burst, poll_interval = kwargs['burst'], kwargs['poll_interval']
+        if processes == 1:
+            processed = run_worker(burst, poll_interval)
+            self.stdout.write(self.style.SUCCESS(f'Ran {processed} jobs'))
+            return
+
+        # Children open their own connections.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=run_worker, args=(burst, poll_interval), daemon=True) for _ in range(processes)]
+        stopping = threading.Event()
+
+        def shutdown(*args):
+            stopping.set()
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, shutdown)
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f'Started {processes} workers')
+
+        while not stopping.is_set():
+            for index, worker in enumerate(workers):
+                if worker.is_alive() or burst or stopping.is_set():
+                    continue
+                self.stdout.write(self.style.WARNING(f'Worker {worker.pid} exited with {worker.exitcode}; restarting'))
+                workers[index] = context.Process(target=run_worker, args=(burst, poll_interval), daemon=True)
+                workers[index].start()
+            if burst and not any(worker.is_alive() for worker in workers):
+                break
+            stopping.wait(1.0)
+        for worker in workers:
+            worker.join()
+        self.stdout.write(self.style.SUCCESS('Workers stopped'))
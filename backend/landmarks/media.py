@@ -0,0 +1,219 @@
+"""Serving uploaded media (cover images and their variants).
+
+Landmarks are private to their owner, but image loaders don't send the API's
+Authorization header, so access is granted by the URL itself: the API hands
+the landmark's owner URLs signed with a timestamp for the file name and the
+owner (``?u=<owner>&sig=<timestamp:signature>``, see signed_url). They expire
+after ``LANDMARK_MEDIA_URL_MAX_AGE`` seconds, and serve_media also checks that
+the file still belongs to a landmark of that owner and that the owner is still
+active, so reassigning a landmark or deactivating a user revokes them. The
+timestamp is rounded down to half the lifetime, so a URL stays the same (and
+browser caches keep working) for a while. Clients that keep rows longer (delta
+sync, replayed batches) get fresh URLs from the ``media-urls`` action;
+replayed batch responses are re-signed before they are sent.
+
+Files are sent with ETag/Last-Modified and single-range support. By default
+Django streams them (``FileResponse``, which WSGI servers deliver with
+sendfile); ``LANDMARK_MEDIA_DELIVERY = 'x-accel'`` or ``'x-sendfile'``
+leaves the transfer to nginx or Apache/lighttpd once access is checked.
+"""
+import mimetypes
+import os
+import re
+import time
+from datetime import datetime, timezone as dt_timezone
+from urllib.parse import quote, unquote, urlencode, urlsplit, urlunsplit
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotAllowed
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.utils._os import safe_join
+
+SALT = 'landmarks.media'
+# Variant names embed a hash of the source image (see landmarks.images), so their content never changes.
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.\d+w\.\w+$')
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def url_max_age():
+    return getattr(settings, 'LANDMARK_MEDIA_URL_MAX_AGE', 3600)
+
+
+def url_window_start():
+    """When the URLs handed out now were signed; they change every half lifetime."""
+    step = max(url_max_age() // 2, 1)
+    return int(time.time()) // step * step
+
+
+def urls_expire_at():
+    """When the URLs handed out now stop working; clients refresh them before (see the media_urls action)."""
+    return datetime.fromtimestamp(url_window_start() + url_max_age(), tz=dt_timezone.utc)
+
+
+class MediaSigner(signing.TimestampSigner):
+    def timestamp(self):
+        return signing.b62_encode(url_window_start())
+
+
+def signing_value(name, owner_id):
+    return f'{owner_id}/{name}'
+
+
+def sign(name, owner_id):
+    """``timestamp:signature`` for the ``sig`` parameter."""
+    value = signing_value(name, owner_id)
+    return MediaSigner(salt=SALT).sign(value)[len(value) + 1:]
+
+
+def signed_url(name, owner_id):
+    return f"{default_storage.url(name)}?{urlencode({'u': owner_id, 'sig': sign(name, owner_id)})}"
+
+
+def resign_url(url, owner_id):
+    """A media URL handed out earlier (relative or absolute), signed afresh for ``owner_id``."""
+    parts = urlsplit(url)
+    if not parts.path.startswith(settings.MEDIA_URL):
+        return url
+    name = unquote(parts.path[len(settings.MEDIA_URL):])
+    return urlunsplit(parts._replace(query=urlencode({'u': owner_id, 'sig': sign(name, owner_id)})))
+
+
+def has_access(name, owner_id, signature):
+    if not owner_id or not signature:
+        return False
+    try:
+        MediaSigner(salt=SALT).unsign(f'{signing_value(name, owner_id)}:{signature}', max_age=url_max_age())
+    except signing.BadSignature:
+        return False
+    from .images import variant_names
+    from .models import Landmark
+
+    landmarks = Landmark.objects.filter(user_id=owner_id, user__is_active=True)
+    hashed = HASHED_NAME.search(name)
+    if hashed is None:
+        return landmarks.filter(cover_image=name).exists()
+    # Narrow down by the ASCII hash suffix (the stored JSON may escape the rest), then compare exactly.
+    candidates = landmarks.filter(cover_image_variants__icontains=hashed.group()).values_list('cover_image_variants', flat=True)
+    return any(name in variant_names(variants) for variants in candidates)
+
+
+def delivery():
+    return getattr(settings, 'LANDMARK_MEDIA_DELIVERY', 'django')
+
+
+def cache_headers(response, name):
+    if HASHED_NAME.search(name):
+        patch_cache_control(response, private=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        # Originals can be replaced under the same name; revalidate with the ETag.
+        patch_cache_control(response, private=True, no_cache=True)
+
+
+def byte_range(header, size):
+    """``(start, end)`` (inclusive) for a single-range Range header; None to send the whole file.
+
+    Raises ValueError when the range can't be satisfied.
+    """
+    match = RANGE.match(header.replace(' ', ''))
+    if not match:
+        # Malformed or multiple ranges: ignored, as RFC 9110 allows.
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        return None
+    if start >= size:
+        raise ValueError
+    return start, end
+
+
+class RangeReader:
+    """The ``length`` bytes of ``file`` from its current position, for FileResponse."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def serve_media(request, name):
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    if not has_access(name, request.GET.get('u'), request.GET.get('sig')):
+        raise Http404
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+        stat = os.stat(path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404
+    if not os.path.isfile(path):
+        raise Http404
+
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        response['ETag'] = etag
+        cache_headers(response, name)
+        return response
+
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    mode = delivery()
+    if mode in ('x-accel', 'x-sendfile'):
+        response = HttpResponse(content_type=content_type)
+        if mode == 'x-accel':
+            prefix = getattr(settings, 'LANDMARK_MEDIA_ACCEL_PREFIX', '/protected-media/')
+            response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(name)
+        else:
+            response['X-Sendfile'] = path
+    else:
+        response = file_response(request, path, stat.st_size, content_type, etag, last_modified)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    cache_headers(response, name)
+    return response
+
+
+def file_response(request, path, size, content_type, etag, last_modified):
+    requested = request.META.get('HTTP_RANGE', '')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+        # The client's partial copy is out of date: send everything.
+        requested = ''
+    try:
+        selected = byte_range(requested, size) if requested else None
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = open(path, 'rb')
+    if selected is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = selected
+        file.seek(start)
+        response = FileResponse(RangeReader(file, end - start + 1), content_type=content_type, status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    return response
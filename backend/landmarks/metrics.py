@@ -0,0 +1,348 @@
+"""Request, database and serializer metrics in Prometheus text format.
+
+Each process aggregates its own samples in memory. When
+``LANDMARK_METRICS_DIR`` is set, processes also snapshot their samples to
+``<dir>/metrics-<pid>.json`` (at most once per ``LANDMARK_METRICS_FLUSH_SECONDS``
+and on every scrape) and ``/metrics`` sums every snapshot, so the numbers
+cover all worker processes no matter which one answers the scrape. Snapshots
+of processes that have exited are folded into ``<dir>/aggregate.json`` and
+removed, so counters survive restarts and a reused pid can't overwrite them.
+
+``/metrics`` answers staff users and requests carrying
+``Authorization: Bearer <LANDMARK_METRICS_TOKEN>``.
+"""
+import contextvars
+import fcntl
+import glob
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+BYTES_BUCKETS = (256, 1024, 10240, 102400, 1048576, 10485760)
+
+METRICS = {
+    'landmarks_http_requests_total': ('counter', 'HTTP requests by view and status.', None),
+    'landmarks_http_request_duration_seconds': ('histogram', 'Time spent handling requests.', LATENCY_BUCKETS),
+    'landmarks_db_queries_per_request': ('histogram', 'Database queries executed per request.', QUERY_COUNT_BUCKETS),
+    'landmarks_db_duration_seconds': ('histogram', 'Time spent in database queries per request.', LATENCY_BUCKETS),
+    'landmarks_serializer_duration_seconds': ('histogram', 'Time spent serializing landmarks per request.', LATENCY_BUCKETS),
+    'landmarks_http_response_bytes': ('histogram', 'Size of non-streaming response bodies.', BYTES_BUCKETS),
+    'landmarks_auth_cache_total': ('counter', 'JWT user lookups answered from the auth cache (hit) or the database (miss).', None),
+}
+
+_request_stats = contextvars.ContextVar('landmark_request_stats', default=None)
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.last_flush = 0.0
+        # Tells this process's snapshot apart from one left by an earlier process with the same pid.
+        self.instance = uuid.uuid4().hex
+        self.claimed_pid = None
+
+    def inc(self, name, labels, amount=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            sample = self.samples.get(key)
+            if sample is None:
+                sample = self.samples[key] = {'buckets': [0] * (len(buckets) + 1), 'sum': 0.0, 'count': 0}
+            sample['buckets'][bisect_left(buckets, value)] += 1
+            sample['sum'] += value
+            sample['count'] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return [
+                [name, list(labels), sample if not isinstance(sample, dict) else {
+                    'buckets': list(sample['buckets']), 'sum': sample['sum'], 'count': sample['count'],
+                }]
+                for (name, labels), sample in self.samples.items()
+            ]
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+
+    def flush(self, force=False):
+        directory = metrics_dir()
+        now = time.monotonic()
+        if not directory or (not force and now - self.last_flush < flush_interval()):
+            return
+        self.last_flush = now
+        os.makedirs(directory, exist_ok=True)
+        pid = os.getpid()
+        if self.claimed_pid != pid:
+            # First flush of this process (or of a fork): a snapshot already at our
+            # path was left by a dead process whose pid we inherited.
+            mark_process_dead(pid, keep_instance=self.instance)
+            self.claimed_pid = pid
+        path = snapshot_path(directory, pid)
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'instance': self.instance, 'samples': self.snapshot()}, f)
+        os.replace(temp_path, path)
+
+    def forked(self):
+        # A forked worker starts from zero under its own identity; the parent keeps reporting its samples.
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.instance = uuid.uuid4().hex
+        self.claimed_pid = None
+
+
+registry = Registry()
+os.register_at_fork(after_in_child=registry.forked)
+
+
+def metrics_dir():
+    return getattr(settings, 'LANDMARK_METRICS_DIR', None)
+
+
+def flush_interval():
+    return getattr(settings, 'LANDMARK_METRICS_FLUSH_SECONDS', 1.0)
+
+
+def metrics_token():
+    return getattr(settings, 'LANDMARK_METRICS_TOKEN', None)
+
+
+def snapshot_path(directory, pid):
+    return os.path.join(directory, f'metrics-{pid}.json')
+
+
+def aggregate_path(directory):
+    return os.path.join(directory, 'aggregate.json')
+
+
+@contextmanager
+def directory_lock(directory):
+    """Serializes folding snapshots into the aggregate across processes."""
+    with open(os.path.join(directory, 'aggregate.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _fold(directory, pid, keep_instance=None):
+    """Move a dead process's samples into the aggregate; call with the directory lock held."""
+    path = snapshot_path(directory, pid)
+    data = _read(path)
+    if data is None or data.get('instance') == keep_instance:
+        return
+    aggregate = _read(aggregate_path(directory)) or []
+    merged = _merge([aggregate, data.get('samples', [])])
+    temp_path = f'{aggregate_path(directory)}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump([[name, list(labels), sample] for (name, labels), sample in merged.items()], f)
+    os.replace(temp_path, aggregate_path(directory))
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def mark_process_dead(pid, keep_instance=None):
+    """Fold the snapshot of an exited worker into the aggregate, e.g. from gunicorn's ``child_exit`` hook.
+
+    Scrapes also do this for every snapshot whose process is gone.
+    """
+    directory = metrics_dir()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    with directory_lock(directory):
+        _fold(directory, pid, keep_instance)
+
+
+def collect():
+    """Merge every process snapshot (or just this process's samples)."""
+    registry.flush(force=True)
+    directory = metrics_dir()
+    if not directory:
+        return _merge([registry.snapshot()])
+    snapshots = []
+    with directory_lock(directory):
+        for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+            try:
+                pid = int(os.path.basename(path)[len('metrics-'):-len('.json')])
+            except ValueError:
+                continue
+            if not _pid_alive(pid):
+                _fold(directory, pid)
+                continue
+            data = _read(path)
+            if data is not None:
+                snapshots.append(data['samples'])
+        snapshots.append(_read(aggregate_path(directory)) or [])
+    return _merge(snapshots)
+
+
+def _merge(snapshots):
+    merged = {}
+    for snapshot in snapshots:
+        for name, labels, sample in snapshot:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            if not isinstance(sample, dict):
+                merged[key] = merged.get(key, 0) + sample
+                continue
+            total = merged.setdefault(key, {'buckets': [0] * len(sample['buckets']), 'sum': 0.0, 'count': 0})
+            total['buckets'] = [a + b for a, b in zip(total['buckets'], sample['buckets'])]
+            total['sum'] += sample['sum']
+            total['count'] += sample['count']
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def render_prometheus(merged):
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        series = sorted(
+            ((labels, sample) for (metric, labels), sample in merged.items() if metric == name),
+            key=lambda item: item[0],
+        )
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, sample in series:
+            if kind == 'counter':
+                lines.append(f'{name}{_format_labels(labels)} {sample}')
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], sample['buckets']):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {sample["sum"]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {sample["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    token = metrics_token()
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    authorized = bool(token) and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+    if not authorized and not request.user.is_staff:
+        return HttpResponseForbidden('Metrics require a staff login or the metrics token')
+    return HttpResponse(render_prometheus(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class serializer_timer:
+    """Adds the time spent in the block to the current request's serializer total."""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        stats = _request_stats.get()
+        if stats is not None:
+            stats['serializer'] += time.perf_counter() - self.start
+
+
+class MetricsMiddleware:
+    # Async-capable so ASGI requests to async views never switch to a thread here.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with self.tracking() as stats:
+            response = self.get_response(request)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with self.tracking() as stats:
+            response = await self.get_response(request)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    @contextmanager
+    def tracking(self):
+        stats = {'queries': 0, 'db': 0.0, 'serializer': 0.0}
+        token = _request_stats.set(stats)
+
+        def track_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats['queries'] += 1
+                stats['db'] += time.perf_counter() - start
+
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(track_query))
+                yield stats
+        finally:
+            _request_stats.reset(token)
+
+    def record(self, request, response, stats, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match.route) if match else 'unmatched'
+        labels = {'view': view}
+        registry.inc('landmarks_http_requests_total', {'view': view, 'method': request.method, 'status': response.status_code})
+        registry.observe('landmarks_http_request_duration_seconds', labels, elapsed)
+        registry.observe('landmarks_db_queries_per_request', labels, stats['queries'])
+        registry.observe('landmarks_db_duration_seconds', labels, stats['db'])
+        if stats['serializer']:
+            registry.observe('landmarks_serializer_duration_seconds', labels, stats['serializer'])
+        if not response.streaming:
+            registry.observe('landmarks_http_response_bytes', labels, len(response.content))
+        registry.flush()
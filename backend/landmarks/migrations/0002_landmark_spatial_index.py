@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from landmarks import spatial
+
+
+def create_rtree(apps, schema_editor):
+    spatial.install_rtree(schema_editor.connection, rebuild=True)
+
+
+def drop_rtree(apps, schema_editor):
+    spatial.uninstall_rtree(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landmarks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_rtree, drop_rtree),
+    ]
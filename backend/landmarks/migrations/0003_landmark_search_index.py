@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from landmarks import search
+
+
+def create_fts(apps, schema_editor):
+    search.install_fts(schema_editor.connection, rebuild=True)
+
+
+def drop_fts(apps, schema_editor):
+    search.uninstall_fts(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landmarks', '0002_landmark_spatial_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
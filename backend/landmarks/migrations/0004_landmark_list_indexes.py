@@ -0,0 +1,25 @@
+# Generated by Django 4.2.1 on 2026-10-18 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landmarks', '0003_landmark_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='landmark',
+            options={'ordering': ['-created_at', '-id']},
+        ),
+        migrations.AddIndex(
+            model_name='landmark',
+            index=models.Index(fields=['user', 'created_at'], name='landmark_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='landmark',
+            index=models.Index(fields=['user', 'category'], name='landmark_user_category_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 11:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landmarks', '0005_landmarkcollectionversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='landmark',
+            name='cover_image_variants',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
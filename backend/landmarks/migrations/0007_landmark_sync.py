@@ -0,0 +1,40 @@
+# Generated by Django 4.2.1 on 2026-10-18 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landmarks', '0006_landmark_cover_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LandmarkTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('landmark_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='landmark',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='landmark_user_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='landmarktombstone',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='landmark_tombstones', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='landmarktombstone',
+            index=models.Index(fields=['user', 'id'], name='tombstone_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='landmarktombstone',
+            index=models.Index(fields=['deleted_at'], name='tombstone_deleted_at_idx'),
+        ),
+    ]
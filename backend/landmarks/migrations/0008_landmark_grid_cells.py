@@ -0,0 +1,74 @@
+# Generated by Django 4.2.1 on 2026-10-18 12:12
+
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Frozen copy of the grid math in landmarks.clusters, so this migration doesn't depend on app code.
+MAX_LEVEL = 16
+MAX_MERCATOR_LATITUDE = 85.05112878
+
+
+def cell_for(latitude, longitude, level):
+    n = 1 << level
+    latitude = max(-MAX_MERCATOR_LATITUDE, min(MAX_MERCATOR_LATITUDE, latitude))
+    sin_lat = math.sin(math.radians(latitude))
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def build_grid(apps, schema_editor):
+    Landmark = apps.get_model('landmarks', 'Landmark')
+    LandmarkGridCell = apps.get_model('landmarks', 'LandmarkGridCell')
+    located = Landmark.objects.exclude(user=None).exclude(latitude=None).exclude(longitude=None).order_by()
+    for owner_id in located.values_list('user_id', flat=True).distinct():
+        totals = defaultdict(lambda: [0, 0.0, 0.0])
+        rows = located.filter(user_id=owner_id).values_list('latitude', 'longitude', 'category')
+        for latitude, longitude, category in rows.iterator(chunk_size=5000):
+            latitude, longitude = float(latitude), float(longitude)
+            for level in range(MAX_LEVEL + 1):
+                x, y = cell_for(latitude, longitude, level)
+                total = totals[(level, x, y, category or '')]
+                total[0] += 1
+                total[1] += latitude
+                total[2] += longitude
+        LandmarkGridCell.objects.bulk_create([
+            LandmarkGridCell(
+                user_id=owner_id, level=level, x=x, y=y, category=category,
+                count=count, sum_latitude=sum_lat, sum_longitude=sum_lon,
+            )
+            for (level, x, y, category), (count, sum_lat, sum_lon) in totals.items()
+        ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landmarks', '0007_landmark_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LandmarkGridCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.PositiveSmallIntegerField()),
+                ('x', models.PositiveIntegerField()),
+                ('y', models.PositiveIntegerField()),
+                ('category', models.CharField(blank=True, default='', max_length=100)),
+                ('count', models.IntegerField(default=0)),
+                ('sum_latitude', models.FloatField(default=0)),
+                ('sum_longitude', models.FloatField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='landmark_grid_cells', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='landmarkgridcell',
+            constraint=models.UniqueConstraint(fields=('user', 'level', 'x', 'y', 'category'), name='grid_cell_unique'),
+        ),
+        migrations.RunPython(build_grid, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.1 on 2026-10-18 12:14
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def build_facets(apps, schema_editor):
+    # Same counts as landmarks.facets.facet_rows, written out so this migration doesn't depend on app code.
+    Landmark = apps.get_model('landmarks', 'Landmark')
+    LandmarkFacetCount = apps.get_model('landmarks', 'LandmarkFacetCount')
+    counts = Landmark.objects.exclude(user=None).order_by().annotate(month=TruncMonth('created_at')).values(
+        'user_id', 'category', 'country', 'month'
+    ).annotate(count=Count('id'))
+    totals = defaultdict(int)
+    for row in counts.iterator():
+        month = timezone.localtime(row['month']).strftime('%Y-%m') if row['month'] else ''
+        for facet, value in (('category', row['category']), ('country', row['country']), ('created_month', month)):
+            totals[(row['user_id'], facet, value or '')] += row['count']
+    LandmarkFacetCount.objects.bulk_create([
+        LandmarkFacetCount(user_id=user_id, facet=facet, value=value, count=count)
+        for (user_id, facet, value), count in totals.items()
+    ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landmarks', '0008_landmark_grid_cells'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LandmarkFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=20)),
+                ('value', models.CharField(blank=True, max_length=100)),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='landmark_facet_counts', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='landmarkfacetcount',
+            constraint=models.UniqueConstraint(fields=('user', 'facet', 'value'), name='facet_count_unique'),
+        ),
+        migrations.RunPython(build_facets, migrations.RunPython.noop),
+    ]
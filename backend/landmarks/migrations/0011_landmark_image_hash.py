@@ -0,0 +1,29 @@
+# Generated by Django 4.2.1 on 2026-10-18 12:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landmarks', '0010_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LandmarkImageHash',
+            fields=[
+                ('landmark', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='image_hash', serialize=False, to='landmarks.landmark')),
+                ('image_name', models.CharField(max_length=100)),
+                ('hash', models.BigIntegerField()),
+                ('band0', models.PositiveIntegerField()),
+                ('band1', models.PositiveIntegerField()),
+                ('band2', models.PositiveIntegerField()),
+                ('band3', models.PositiveIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['band0'], name='image_hash_band0_idx'), models.Index(fields=['band1'], name='image_hash_band1_idx'), models.Index(fields=['band2'], name='image_hash_band2_idx'), models.Index(fields=['band3'], name='image_hash_band3_idx')],
+            },
+        ),
+    ]
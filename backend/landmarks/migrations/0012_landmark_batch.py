@@ -0,0 +1,34 @@
+# Generated by Django 4.2.1 on 2026-10-18 12:43
+
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landmarks', '0011_landmark_image_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LandmarkBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(max_length=200)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('response', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='landmark_batches', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='landmark_batch_created_at_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='landmarkbatch',
+            constraint=models.UniqueConstraint(fields=('user', 'idempotency_key'), name='landmark_batch_user_key_unique'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.1 on 2026-10-18 12:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landmarks', '0013_upload_session'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='landmark',
+            index=models.Index(fields=['created_at', 'id'], name='landmark_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='landmark',
+            index=models.Index(fields=['category', 'created_at', 'id'], name='landmark_category_created_idx'),
+        ),
+    ]
@@ -1,5 +1,9 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -53,6 +57,8 @@ class Landmark(models.Model):
     category = models.CharField(max_length=100, null=True, blank=True)
     description = models.TextField(null=True, blank=True)
     cover_image = models.ImageField(upload_to='landmarks/', null=True, blank=True)
+    # {width: {format: storage name}}, filled in by landmarks.images after upload
+    cover_image_variants = models.JSONField(null=True, blank=True, editable=False)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     country = models.CharField(max_length=100, null=True, blank=True)
@@ -63,6 +69,13 @@ class Landmark(models.Model):
     def __str__(self):
         return self.title or 'Untitled Landmark'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values so signal handlers can tell what a save changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def save(self, *args, **kwargs):
         # Ensure coordinates are None if they are empty strings or "0.0"
         if self.latitude in ['', '0.0', 0.0]:
@@ -70,6 +83,168 @@ class Landmark(models.Model):
         if self.longitude in ['', '0.0', 0.0]:
             self.longitude = None
         super().save(*args, **kwargs)
+        self._loaded_values = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields}
 
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='landmark_user_created_idx'),
+            models.Index(fields=['user', 'category'], name='landmark_user_category_idx'),
+            models.Index(fields=['user', 'updated_at', 'id'], name='landmark_user_updated_idx'),
+            # Keyset pages of the server-rendered list (all users, optionally one category)
+            models.Index(fields=['created_at', 'id'], name='landmark_created_id_idx'),
+            models.Index(fields=['category', 'created_at', 'id'], name='landmark_category_created_idx'),
+        ]
+
+
+class LandmarkCollectionVersion(models.Model):
+    """Per-user counter bumped whenever one of the user's landmarks changes."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='landmark_collection_version')
+    version = models.PositiveBigIntegerField(default=0)
+    modified_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.user_id}@{self.version}'
+
+
+class LandmarkTombstone(models.Model):
+    """Deletion log read by the delta-sync endpoint."""
+    landmark_id = models.BigIntegerField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='landmark_tombstones')
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='tombstone_user_id_idx'),
+            models.Index(fields=['deleted_at'], name='tombstone_deleted_at_idx'),
+        ]
+
+    def __str__(self):
+        return f'Landmark {self.landmark_id} deleted at {self.deleted_at}'
+
+
+class LandmarkBatch(models.Model):
+    """A committed POST /api/landmarks/batch/, kept so a retry with its Idempotency-Key is answered, not re-applied."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='landmark_batches')
+    idempotency_key = models.CharField(max_length=200)
+    # Hash of the operations and image parts, to refuse a key reused for a different batch.
+    fingerprint = models.CharField(max_length=64)
+    response = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='landmark_batch_user_key_unique'),
+        ]
+        indexes = [models.Index(fields=['created_at'], name='landmark_batch_created_at_idx')]
+
+    def __str__(self):
+        return f'Batch {self.idempotency_key} of user {self.user_id}'
+
+
+class UploadSession(models.Model):
+    """A resumable cover image upload in progress; see landmarks.uploads."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    landmark = models.ForeignKey(Landmark, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    length = models.PositiveBigIntegerField()
+    # Bytes received and synced to disk.
+    offset = models.PositiveBigIntegerField(default=0)
+    # Set while a PATCH is writing, so two requests never append at once.
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['expires_at'], name='upload_session_expires_at_idx')]
+
+    def __str__(self):
+        return f'Upload {self.pk} of {self.filename} ({self.offset}/{self.length})'
+
+
+class LandmarkGridCell(models.Model):
+    """Landmarks of one user and category in one Web Mercator grid cell; see landmarks.clusters."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='landmark_grid_cells')
+    level = models.PositiveSmallIntegerField()
+    x = models.PositiveIntegerField()
+    y = models.PositiveIntegerField()
+    category = models.CharField(max_length=100, blank=True, default='')
+    count = models.IntegerField(default=0)
+    sum_latitude = models.FloatField(default=0)
+    sum_longitude = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'level', 'x', 'y', 'category'], name='grid_cell_unique'),
+        ]
+
+
+class LandmarkFacetCount(models.Model):
+    """Number of a user's landmarks per category, country or creation month; see landmarks.facets."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='landmark_facet_counts')
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=100, blank=True)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'facet', 'value'], name='facet_count_unique'),
+        ]
+
+
+class Job(models.Model):
+    """A queued call to a ``@job`` function, run by ``manage.py run_workers``; see landmarks.jobs."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    kwargs = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='jobs', null=True, blank=True)
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+            models.Index(fields=['user', 'created_at'], name='job_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
+
+
+class LandmarkImageHash(models.Model):
+    """Perceptual hash of a landmark's cover image, split into indexed bands; see landmarks.duplicates."""
+    landmark = models.OneToOneField(Landmark, on_delete=models.CASCADE, primary_key=True, related_name='image_hash')
+    image_name = models.CharField(max_length=100)
+    hash = models.BigIntegerField()
+    band0 = models.PositiveIntegerField()
+    band1 = models.PositiveIntegerField()
+    band2 = models.PositiveIntegerField()
+    band3 = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=[f'band{index}'], name=f'image_hash_band{index}_idx') for index in range(4)]
+
+    def __str__(self):
+        return f'{self.landmark_id}: {self.hash & (2 ** 64 - 1):016x}'
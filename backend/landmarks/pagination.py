@@ -0,0 +1,67 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.pagination import CursorPagination
+
+
+class LandmarkCursorPagination(CursorPagination):
+    """Keyset pagination over ``(created_at, id)``, newest first.
+
+    Old app builds expect a bare JSON array; they keep getting one with
+    ``?paginate=false`` or when ``LANDMARK_LIST_PAGINATION`` is disabled.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    paginate_query_param = 'paginate'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_paginated_request(request):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+    def is_paginated_request(self, request):
+        flag = request.query_params.get(self.paginate_query_param)
+        if flag is not None:
+            return flag.lower() not in ('0', 'false', 'no', 'off')
+        return getattr(settings, 'LANDMARK_LIST_PAGINATION', True)
+
+    def get_ordering(self, request, queryset, view):
+        # Filters that rank rows (near=, search=) order the queryset themselves;
+        # page through that ranking rather than discarding it.
+        if queryset.query.order_by:
+            return tuple(queryset.query.order_by)
+        return self.ordering
+
+
+def encode_keyset_cursor(landmark):
+    """Opaque position after ``landmark`` in ``(-created_at, -id)`` order."""
+    return base64.urlsafe_b64encode(f'{landmark.created_at.isoformat()}|{landmark.pk}'.encode()).decode().rstrip('=')
+
+
+def decode_keyset_cursor(token):
+    """``(created_at, id)`` from encode_keyset_cursor; raises ValueError when malformed."""
+    try:
+        created_at, _, pk = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode().partition('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError(str(e))
+
+
+def keyset_page(queryset, after=None, size=24):
+    """One page of ``queryset`` newest first, without COUNT or OFFSET.
+
+    Returns ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    queryset = queryset.order_by('-created_at', '-id')
+    if after:
+        created_at, pk = decode_keyset_cursor(after)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    rows = list(queryset[:size + 1])
+    if len(rows) > size:
+        return rows[:size], encode_keyset_cursor(rows[size - 1])
+    return rows, None
@@ -0,0 +1,95 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer that encodes with orjson when it is installed.
+
+    The output is byte-for-byte what JSONRenderer produces: orjson handles the
+    compact, UTF-8 case and anything it can't encode the same way (indented
+    output, ASCII-only settings, big integers, non-string keys) falls back to
+    the stock renderer.
+    """
+    if orjson is not None:
+        options = orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or not self.compact or self.ensure_ascii or not self.strict
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same JavaScript-safe escaping as JSONRenderer.
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class ColumnarJSONRenderer(FastJSONRenderer):
+    """Lists of rows as one array per field instead of one object per row.
+
+    ``[{"id": 1, "user": {"id": 7}}, {"id": 2, "user": {"id": 7}}]`` becomes
+    ``{"count": 2, "columns": {"id": [1, 2], "user.id": [7, 7]}}``: key names
+    appear once, and nested objects are flattened into dotted columns (``null``
+    where a row has no such object). In paginated responses ``results`` is
+    converted the same way; any other response renders as plain JSON.
+    """
+    media_type = 'application/vnd.landmarks.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, list):
+            data = to_columns(data)
+        elif isinstance(data, dict) and isinstance(data.get('results'), list):
+            data = {**data, 'results': to_columns(data['results'])}
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+def to_columns(rows):
+    if not all(isinstance(row, dict) for row in rows):
+        return rows
+    nested = {key for row in rows for key, value in row.items() if isinstance(value, dict)}
+    # Column name -> (key, key within the nested object), in order of first appearance.
+    columns = {}
+    for row in rows:
+        for key, value in row.items():
+            if key not in nested:
+                columns.setdefault(key, (key, None))
+            elif isinstance(value, dict):
+                for subkey in value:
+                    columns.setdefault(f'{key}.{subkey}', (key, subkey))
+    return {'count': len(rows), 'columns': {
+        name: [row.get(key) if subkey is None else (row.get(key) or {}).get(subkey) for row in rows]
+        for name, (key, subkey) in columns.items()
+    }}
+
+
+class MessagePackRenderer(BaseRenderer):
+    """MessagePack, for clients that send ``Accept: application/msgpack`` (needs the msgpack package).
+
+    Same structure as the JSON output; values msgpack has no type for (dates,
+    decimals, ...) are converted the way JSONRenderer converts them.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=JSONEncoder().default, use_bin_type=True)
+
+
+# Renderers offered next to JSON for clients that want smaller bodies.
+COMPACT_RENDERERS = (ColumnarJSONRenderer,) + ((MessagePackRenderer,) if msgpack is not None else ())
@@ -0,0 +1,96 @@
+"""Send landmark API reads to read replicas and everything else to the primary.
+
+Only requests handled by a view using ``ReplicaReadMixin`` read from a
+replica, and only while the user hasn't written anything for
+``LANDMARK_REPLICA_PIN_SECONDS``: after a successful write the user's reads
+stay on the primary long enough for the replicas to catch up, so they always
+see their own changes. Pins live in the ``LANDMARK_REPLICA_PIN_CACHE`` cache,
+which must be shared by every worker process; otherwise the next request may
+land on a process that never saw the write.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+
+_replica_reads = contextvars.ContextVar('landmark_replica_reads', default=False)
+
+
+def read_replicas():
+    return getattr(settings, 'LANDMARK_READ_REPLICAS', ())
+
+
+def reading_from_replica():
+    return _replica_reads.get()
+
+
+@contextmanager
+def replica_reads():
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def pin_cache():
+    return caches[getattr(settings, 'LANDMARK_REPLICA_PIN_CACHE', 'default')]
+
+
+def pin_key(user_id):
+    return f'landmarks:primary-pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    pin_cache().set(pin_key(user_id), True, getattr(settings, 'LANDMARK_REPLICA_PIN_SECONDS', 10))
+
+
+def is_pinned(user_id):
+    return pin_cache().get(pin_key(user_id)) is not None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = read_replicas()
+        if replicas and _replica_reads.get():
+            return random.choice(replicas)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in read_replicas():
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    """Serve the view's safe requests from a replica unless the user wrote recently."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if read_replicas() and request.method in SAFE_METHODS and not is_pinned(request.user.pk):
+            self._replica_token = _replica_reads.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (read_replicas() and request.method not in SAFE_METHODS and response.status_code < 400
+                and request.user.is_authenticated):
+            pin_to_primary(request.user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def dispatch(self, request, *args, **kwargs):
+        self._replica_token = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # Also on unhandled exceptions: worker threads serve other requests next.
+            if self._replica_token is not None:
+                _replica_reads.reset(self._replica_token)
@@ -0,0 +1,129 @@
+import re
+from html import escape
+
+from django.db import connection
+from django.db.models import FloatField, TextField
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+FTS_TABLE = 'landmarks_landmark_fts'
+FTS_COLUMNS = ('title', 'description', 'category', 'country')
+# bm25 column weights, in FTS_COLUMNS order: a title hit outranks a description hit.
+FTS_WEIGHTS = (10.0, 1.0, 2.0, 2.0)
+
+# snippet() wraps hits in control characters which are swapped for <mark> tags
+# after the surrounding text has been HTML-escaped.
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+SNIPPET_TOKENS = 12
+
+_columns = ', '.join(FTS_COLUMNS)
+_new_values = ', '.join(f'new.{column}' for column in FTS_COLUMNS)
+_old_values = ', '.join(f'old.{column}' for column in FTS_COLUMNS)
+
+# External-content FTS5 index over landmarks_landmark, kept in sync by triggers.
+SQLITE_FTS_DDL = [
+    f'''CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        {_columns},
+        content='landmarks_landmark', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )''',
+    f'''CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON landmarks_landmark
+        BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values});
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON landmarks_landmark
+        BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values});
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {_columns} ON landmarks_landmark
+        BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values});
+            INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values});
+        END''',
+]
+
+_token_re = re.compile(r'\w+')
+
+
+def has_fts():
+    return connection.vendor == 'sqlite'
+
+
+def install_fts(conn, rebuild=False):
+    """Create the FTS5 table and its triggers (idempotent)."""
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        for statement in SQLITE_FTS_DDL:
+            cursor.execute(statement)
+        if rebuild:
+            rebuild_fts(conn)
+
+
+def rebuild_fts(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+
+
+def uninstall_fts(conn):
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        for suffix in ('ai', 'ad', 'au'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query where every word is a quoted prefix term."""
+    tokens = _token_re.findall(text or '')
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def apply_search(queryset, text):
+    """Filter ``queryset`` to full-text matches, best first.
+
+    Rows are annotated with ``search_rank`` (bm25, lower is better) and a raw
+    ``search_snippet``; pass the latter through :func:`highlight` for display.
+    """
+    if not build_match_query(text):
+        return queryset
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    return filter_matches(queryset, text).annotate(
+        search_rank=RawSQL(f'bm25({FTS_TABLE}, {weights})', (), output_field=FloatField()),
+        search_snippet=RawSQL(
+            f"snippet({FTS_TABLE}, -1, %s, %s, '…', {SNIPPET_TOKENS})",
+            (HIGHLIGHT_START, HIGHLIGHT_END),
+            output_field=TextField(),
+        ),
+    ).order_by('search_rank', 'pk')
+
+
+def filter_matches(queryset, text):
+    """Filter ``queryset`` to full-text matches, without ranking or snippets."""
+    match = build_match_query(text)
+    if not match:
+        return queryset
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = {table}.id', f'{FTS_TABLE} MATCH %s'],
+        params=[match],
+    )
+
+
+def highlight(snippet):
+    if snippet is None:
+        return None
+    return escape(snippet).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+
+
+class FullTextSearchFilter(SearchFilter):
+    """SearchFilter that answers ``?search=`` from the FTS5 index on SQLite."""
+
+    def filter_queryset(self, request, queryset, view):
+        if not has_fts():
+            return super().filter_queryset(request, queryset, view)
+        return apply_search(queryset, request.query_params.get(self.search_param, ''))
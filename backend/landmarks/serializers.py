@@ -1,5 +1,14 @@
+import datetime
+import decimal
+
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Landmark, User
+from .models import Job, Landmark, User
+from .metrics import serializer_timer
+from .search import highlight
+from . import duplicates, media
+from PIL import Image
 import logging
 
 logger = logging.getLogger(__name__)
@@ -30,32 +39,78 @@ class UserSerializer(serializers.ModelSerializer):
         )
         return user
 
+def variant_urls(variants, owner_id, request):
+    if not variants:
+        return None
+    build_url = request.build_absolute_uri if request is not None else (lambda url: url)
+    return {
+        width: {fmt: build_url(media.signed_url(name, owner_id)) for fmt, name in formats.items()}
+        for width, formats in variants.items()
+    }
+
+class SignedImageField(serializers.ImageField):
+    """Represents the image by a URL signed for the landmark's owner (see landmarks.media)."""
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        url = media.signed_url(value.name, value.instance.user_id)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ['id', 'name', 'status', 'attempts', 'max_attempts', 'run_at', 'result', 'error', 'created_at', 'finished_at']
+        read_only_fields = fields
+
+class TimedListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        with serializer_timer():
+            return super().to_representation(data)
+
 class LandmarkSerializer(serializers.ModelSerializer):
-    cover_image = serializers.ImageField(required=False, allow_null=True, allow_empty_file=True)
+    cover_image = SignedImageField(required=False, allow_null=True, allow_empty_file=True)
     latitude = NullableDecimalField(max_digits=9, decimal_places=6, required=False, allow_null=True)
     longitude = NullableDecimalField(max_digits=9, decimal_places=6, required=False, allow_null=True)
     country = serializers.CharField(required=False, allow_null=True, allow_blank=True)
     user = UserSerializer(read_only=True)
+    cover_image_variants = serializers.SerializerMethodField()
+
+    def get_cover_image_variants(self, obj):
+        return variant_urls(obj.cover_image_variants, obj.user_id, self.context.get('request'))
 
     def get_cover_image_url(self, obj):
         if obj.cover_image:
             request = self.context.get('request')
             if request is not None:
-                return request.build_absolute_uri(obj.cover_image.url)
+                return request.build_absolute_uri(media.signed_url(obj.cover_image.name, obj.user_id))
         return None
 
+    def to_representation(self, instance):
+        if self.parent is None:
+            with serializer_timer():
+                return self._to_representation(instance)
+        return self._to_representation(instance)
+
+    def _to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Present when the queryset was filtered with near=lat,lon
+        distance = getattr(instance, 'distance', None)
+        if distance is not None:
+            data['distance_km'] = round(distance, 3)
+        # Present when the queryset was filtered with search=
+        snippet = getattr(instance, 'search_snippet', None)
+        if snippet is not None:
+            data['search_snippet'] = highlight(snippet)
+        # Present after a write whose cover image resembles existing ones
+        if getattr(self, 'duplicate_images', None):
+            data['duplicate_images'] = self.duplicate_images
+        return data
+
     def validate(self, data):
-        # Log the incoming data for debugging
-        logger.info(f"Validating data in serializer: {data}")
-        
-        # Log image data if present
-        if 'cover_image' in data:
-            logger.info(f"Cover image in validation: {data['cover_image']}")
-            if hasattr(data['cover_image'], 'content_type'):
-                logger.info(f"Image content type: {data['cover_image'].content_type}")
-        else:
-            logger.info("No cover image in data during validation")
-            
+        self.check_duplicate_image(data.get('cover_image'))
+
         # Handle empty or "0.0" coordinate values
         if 'latitude' in data:
             if data['latitude'] in ['', None, '0.0', 0.0]:
@@ -66,24 +121,31 @@ class LandmarkSerializer(serializers.ModelSerializer):
             
         return data
 
-    def create(self, validated_data):
-        # Log the validated data before creation
-        logger.info(f"Creating landmark with data: {validated_data}")
-        if 'cover_image' in validated_data:
-            logger.info(f"Image present in validated_data: {validated_data['cover_image']}")
-        
-        instance = super().create(validated_data)
-        
-        # Log the created instance
-        logger.info(f"Created landmark instance: {instance.id}")
-        if instance.cover_image:
-            logger.info(f"Image saved at: {instance.cover_image.path}")
-        
-        return instance
+    def check_duplicate_image(self, image):
+        """Warn about (or with reject_duplicates=true, refuse) a near-copy of one of the user's images."""
+        self.duplicate_images = []
+        request = self.context.get('request')
+        if not hasattr(image, 'read') or request is None or not request.user.is_authenticated:
+            return
+        try:
+            value = duplicates.hash_file(image)
+        except (OSError, Image.DecompressionBombError):
+            return
+        exclude = self.instance.pk if self.instance is not None else None
+        matches = duplicates.similar(request.user, value, exclude=exclude)
+        if not matches:
+            return
+        titles = dict(Landmark.objects.filter(pk__in=[pk for _, pk in matches]).values_list('pk', 'title'))
+        self.duplicate_images = [{'id': pk, 'title': titles.get(pk), 'distance': distance} for distance, pk in matches]
+        if str(self.initial_data.get('reject_duplicates', '')).lower() in ('1', 'true', 'yes'):
+            raise serializers.ValidationError({
+                'cover_image': [f"Looks like the cover image of landmark {self.duplicate_images[0]['id']}"],
+            })
 
     class Meta:
         model = Landmark
-        fields = ['id', 'title', 'description', 'category', 'country', 'cover_image', 'latitude', 'longitude', 'created_at', 'updated_at', 'user']
+        list_serializer_class = TimedListSerializer
+        fields = ['id', 'title', 'description', 'category', 'country', 'cover_image', 'cover_image_variants', 'latitude', 'longitude', 'created_at', 'updated_at', 'user']
         read_only_fields = ['created_at', 'updated_at', 'user']
         extra_kwargs = {
             'title': {'required': False},
@@ -97,4 +159,84 @@ class LandmarkSerializer(serializers.ModelSerializer):
             'latitude': {'required': False},
             'longitude': {'required': False},
             'country': {'required': False}
-        } 
\ No newline at end of file
+        } 
+
+class LandmarkRowSerializer:
+    """Read-only equivalent of LandmarkSerializer for ``values()`` rows.
+
+    Builds the same representation (tests compare the rendered bytes) without
+    model instances or per-row DRF field objects, and fetches the owner in
+    the same query.
+    """
+    fields = (
+        'id', 'title', 'description', 'category', 'country', 'cover_image', 'cover_image_variants',
+        'latitude', 'longitude', 'created_at', 'updated_at', 'user_id', 'user__email', 'user__username',
+    )
+
+    def __init__(self, request=None):
+        self.request = request
+        self.timezone = timezone.get_current_timezone() if settings.USE_TZ else None
+        self.quantum = decimal.Decimal('.1') ** 6
+        self.decimal_context = decimal.getcontext().copy()
+        self.decimal_context.prec = 9
+
+    def values(self, queryset):
+        # Annotations (distance, search rank/snippet) are kept: pagination
+        # cursors and the representation both read them.
+        return queryset.values(*self.fields, *queryset.query.annotations)
+
+    def decimal(self, value):
+        if value is None:
+            return None
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return '{:f}'.format(value.quantize(self.quantum, context=self.decimal_context))
+
+    def datetime(self, value):
+        if not value:
+            return None
+        if self.timezone is not None:
+            value = value.astimezone(self.timezone) if timezone.is_aware(value) else timezone.make_aware(value, self.timezone)
+        elif timezone.is_aware(value):
+            value = timezone.make_naive(value, datetime.timezone.utc)
+        value = value.isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+    def file_url(self, name, owner_id):
+        if not name:
+            return None
+        url = media.signed_url(name, owner_id)
+        return self.request.build_absolute_uri(url) if self.request is not None else url
+
+    def to_representation(self, row):
+        data = {
+            'id': row['id'],
+            'title': row['title'],
+            'description': row['description'],
+            'category': row['category'],
+            'country': row['country'],
+            'cover_image': self.file_url(row['cover_image'], row['user_id']),
+            'cover_image_variants': variant_urls(row['cover_image_variants'], row['user_id'], self.request),
+            'latitude': self.decimal(row['latitude']),
+            'longitude': self.decimal(row['longitude']),
+            'created_at': self.datetime(row['created_at']),
+            'updated_at': self.datetime(row['updated_at']),
+            'user': None if row['user_id'] is None else {
+                'id': row['user_id'], 'email': row['user__email'], 'username': row['user__username'],
+            },
+        }
+        distance = row.get('distance')
+        if distance is not None:
+            data['distance_km'] = round(distance, 3)
+        snippet = row.get('search_snippet')
+        if snippet is not None:
+            data['search_snippet'] = highlight(snippet)
+        return data
+
+    def many(self, rows):
+        with serializer_timer():
+            return [self.to_representation(row) for row in rows]
+
+    def one(self, row):
+        with serializer_timer():
+            return self.to_representation(row)
@@ -0,0 +1,124 @@
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from . import clusters, facets, images, suggest
+from .authentication import user_cache
+from .caching import bump_collection_version
+from .models import Landmark, LandmarkImageHash, LandmarkTombstone, User
+
+
+# Sent after bulk writes that bypass post_save/post_delete (bulk_create,
+# queryset.update(), ...) with ``user_ids``: the owners whose landmarks changed.
+# Senders that only inserted rows also pass them as ``created``.
+landmarks_bulk_changed = Signal()
+
+
+def previous_value(instance, attname):
+    return getattr(instance, '_loaded_values', {}).get(attname)
+
+
+def deleting_owner(origin):
+    # Per-user bookkeeping is pointless (and would dangle) when the owner itself is being deleted.
+    return isinstance(origin, User) or getattr(origin, 'model', None) is User
+
+
+def cover_image_changed(instance):
+    image = instance.cover_image
+    return not image._committed or (image.name or None) != (previous_value(instance, 'cover_image') or None)
+
+
+@receiver(pre_save, sender=Landmark)
+def landmark_saving(sender, instance, raw=False, **kwargs):
+    if not raw and cover_image_changed(instance):
+        stale = previous_value(instance, 'cover_image_variants')
+        if stale and not images.image_in_use(previous_value(instance, 'cover_image'), instance.pk):
+            transaction.on_commit(lambda: images.delete_variants(stale))
+        instance.cover_image_variants = None
+
+
+@receiver(post_save, sender=Landmark)
+def landmark_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    bump_collection_version(instance.user_id)
+    previous_user_id = previous_value(instance, 'user_id')
+    if not created and previous_user_id not in (None, instance.user_id):
+        bump_collection_version(previous_user_id)
+        LandmarkTombstone.objects.create(landmark_id=instance.pk, user_id=previous_user_id)
+    if not created and cover_image_changed(instance):
+        LandmarkImageHash.objects.filter(landmark_id=instance.pk).delete()
+    if instance.cover_image and cover_image_changed(instance):
+        images.schedule_variants(instance.pk, instance.cover_image.name, instance.user_id)
+    update_aggregates(instance, created)
+
+
+def update_aggregates(instance, created):
+    if created:
+        clusters.add([clusters.landmark_entry(instance)])
+        facets.add([facets.landmark_entry(instance)])
+        suggest.add([suggest.landmark_entry(instance)])
+    elif hasattr(instance, '_loaded_values'):
+        clusters.move(clusters.grid_entry(*(
+            previous_value(instance, attname) for attname in ('user_id', 'latitude', 'longitude', 'category')
+        )), clusters.landmark_entry(instance))
+        facets.move(facets.facet_entry(*(
+            previous_value(instance, attname) for attname in ('user_id', 'category', 'country', 'created_at')
+        )), facets.landmark_entry(instance))
+        suggest.move(suggest.suggest_entry(*(
+            previous_value(instance, attname) for attname in ('user_id', 'title', 'country')
+        )), suggest.landmark_entry(instance))
+    else:
+        # Saved without being loaded first: the stored values are unknown.
+        clusters.rebuild([instance.user_id])
+        facets.rebuild([instance.user_id])
+        suggest.rebuild([instance.user_id])
+
+
+@receiver(post_delete, sender=Landmark)
+def landmark_deleted(sender, instance, origin=None, **kwargs):
+    if instance.user_id is not None and not deleting_owner(origin):
+        bump_collection_version(instance.user_id)
+        LandmarkTombstone.objects.create(landmark_id=instance.pk, user_id=instance.user_id)
+        clusters.remove([clusters.landmark_entry(instance)])
+        facets.remove([facets.landmark_entry(instance)])
+        suggest.remove([suggest.landmark_entry(instance)])
+    if instance.cover_image_variants and not images.image_in_use(instance.cover_image.name, instance.pk):
+        transaction.on_commit(lambda: images.delete_variants(instance.cover_image_variants))
+
+
+@receiver(landmarks_bulk_changed)
+def landmarks_bulk_changed_handler(sender, user_ids, created=None, **kwargs):
+    for user_id in user_ids:
+        bump_collection_version(user_id)
+    # Pure inserts can be added to the grid; anything else is recounted.
+    if created is not None:
+        clusters.add(clusters.landmark_entry(landmark) for landmark in created)
+        facets.add(facets.landmark_entry(landmark) for landmark in created)
+        suggest.add(suggest.landmark_entry(landmark) for landmark in created)
+    else:
+        clusters.rebuild(user_ids)
+        facets.rebuild(user_ids)
+        suggest.rebuild(user_ids)
+
+
+def forget_user(user_id):
+    # Now, and again once committed, in case a request reloads the old row in between.
+    user_cache.invalidate(user_id)
+    transaction.on_commit(lambda: user_cache.invalidate(user_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+
+if apps.is_installed('rest_framework_simplejwt.token_blacklist'):
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+    @receiver(post_save, sender=BlacklistedToken)
+    def token_blacklisted(sender, instance, **kwargs):
+        if instance.token.user_id is not None:
+            forget_user(instance.token.user_id)
@@ -0,0 +1,180 @@
+import math
+
+from django import forms
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import ASin, Cast, Cos, Least, Power, Radians, Sin, Sqrt
+from django_filters import rest_framework as filters
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+RTREE_TABLE = 'landmarks_landmark_rtree'
+
+# The R*Tree mirrors landmarks_landmark through triggers so that every write path
+# (save(), bulk_create(), queryset.update(), raw SQL) keeps it in sync.
+SQLITE_RTREE_DDL = [
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE_TABLE} USING rtree(id, min_lat, max_lat, min_lon, max_lon)',
+    f'''CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_ai AFTER INSERT ON landmarks_landmark
+        WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL
+        BEGIN
+            INSERT INTO {RTREE_TABLE} VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_au AFTER UPDATE OF latitude, longitude ON landmarks_landmark
+        BEGIN
+            DELETE FROM {RTREE_TABLE} WHERE id = old.id;
+            INSERT INTO {RTREE_TABLE}
+                SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude
+                WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_ad AFTER DELETE ON landmarks_landmark
+        BEGIN
+            DELETE FROM {RTREE_TABLE} WHERE id = old.id;
+        END''',
+]
+
+
+def has_rtree():
+    return connection.vendor == 'sqlite'
+
+
+def install_rtree(conn, rebuild=False):
+    """Create the R*Tree side table and its triggers (idempotent)."""
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        for statement in SQLITE_RTREE_DDL:
+            cursor.execute(statement)
+        if rebuild:
+            cursor.execute(f'DELETE FROM {RTREE_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {RTREE_TABLE} '
+                'SELECT id, latitude, latitude, longitude, longitude FROM landmarks_landmark '
+                'WHERE latitude IS NOT NULL AND longitude IS NOT NULL'
+            )
+
+
+def uninstall_rtree(conn):
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        for suffix in ('ai', 'au', 'ad'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {RTREE_TABLE}_{suffix}')
+        cursor.execute(f'DROP TABLE IF EXISTS {RTREE_TABLE}')
+
+
+def lon_ranges(min_lon, max_lon):
+    # A box whose west edge is east of its east edge crosses the antimeridian.
+    if min_lon <= max_lon:
+        return [(min_lon, max_lon)]
+    return [(min_lon, 180.0), (-180.0, max_lon)]
+
+
+def radius_bbox(lat, lon, radius_km):
+    """Return (min_lon, min_lat, max_lon, max_lat) enclosing the circle."""
+    dlat = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = lat - dlat, lat + dlat
+    if min_lat <= -90 or max_lat >= 90 or radius_km >= EARTH_RADIUS_KM * math.pi / 2:
+        return -180.0, max(min_lat, -90.0), 180.0, min(max_lat, 90.0)
+    dlon = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat)))))
+    min_lon, max_lon = lon - dlon, lon + dlon
+    if min_lon < -180:
+        min_lon += 360
+    if max_lon > 180:
+        max_lon -= 360
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def filter_bbox(queryset, min_lon, min_lat, max_lon, max_lat):
+    """Restrict ``queryset`` to landmarks inside the box, using the R*Tree when available."""
+    boxes = lon_ranges(min_lon, max_lon)
+    if has_rtree():
+        where = ' OR '.join(['(min_lon <= %s AND max_lon >= %s)'] * len(boxes))
+        params = [max_lat, min_lat]
+        for west, east in boxes:
+            params.extend([east, west])
+        queryset = queryset.filter(pk__in=RawSQL(
+            f'SELECT id FROM {RTREE_TABLE} WHERE min_lat <= %s AND max_lat >= %s AND ({where})',
+            params,
+        ))
+    # The R*Tree stores 32-bit floats rounded outwards, so refine on the exact columns.
+    queryset = queryset.filter(latitude__gte=min_lat, latitude__lte=max_lat)
+    lon_filter = Q()
+    for west, east in boxes:
+        lon_filter |= Q(longitude__gte=west, longitude__lte=east)
+    return queryset.filter(lon_filter)
+
+
+def distance_expression(lat, lon):
+    """Great-circle distance in km from (lat, lon) to each row, as a database expression."""
+    row_lat = Radians(Cast('latitude', FloatField()))
+    row_lon = Radians(Cast('longitude', FloatField()))
+    origin_lat = math.radians(lat)
+    origin_lon = math.radians(lon)
+    half_chord = (
+        Power(Sin((row_lat - Value(origin_lat)) / Value(2.0)), Value(2.0))
+        + Value(math.cos(origin_lat)) * Cos(row_lat)
+        * Power(Sin((row_lon - Value(origin_lon)) / Value(2.0)), Value(2.0))
+    )
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Least(Sqrt(half_chord), Value(1.0)))
+
+
+def annotate_distance(queryset, lat, lon):
+    return queryset.exclude(latitude__isnull=True).exclude(longitude__isnull=True).annotate(
+        distance=distance_expression(lat, lon)
+    )
+
+
+def within_radius(queryset, lat, lon, radius_km):
+    queryset = filter_bbox(queryset, *radius_bbox(lat, lon, radius_km))
+    return annotate_distance(queryset, lat, lon).filter(distance__lte=radius_km)
+
+
+def nearest(queryset, lat, lon, count, radius_km=None, start_km=1.0):
+    """Return the ``count`` landmarks closest to (lat, lon), nearest first.
+
+    The search radius doubles until it holds enough rows, so each probe stays an
+    index range scan instead of sorting the whole table by distance.
+    """
+    limit = radius_km if radius_km is not None else math.pi * EARTH_RADIUS_KM
+    search_km = min(start_km, limit)
+    while True:
+        candidates = within_radius(queryset, lat, lon, search_km)
+        if search_km >= limit or candidates.count() >= count:
+            break
+        search_km = min(search_km * 2, limit)
+    ids = list(candidates.order_by('distance', 'pk').values_list('pk', flat=True)[:count])
+    return annotate_distance(queryset.filter(pk__in=ids), lat, lon).order_by('distance', 'pk')
+
+
+class CoordinateListField(forms.Field):
+    def __init__(self, *args, length, **kwargs):
+        self.length = length
+        super().__init__(*args, **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            numbers = [float(part) for part in str(value).split(',')]
+        except ValueError:
+            raise forms.ValidationError('Expected comma separated numbers.')
+        if len(numbers) != self.length or not all(map(math.isfinite, numbers)):
+            raise forms.ValidationError(f'Expected {self.length} comma separated numbers.')
+        return numbers
+
+    def validate(self, value):
+        super().validate(value)
+        if value is None:
+            return
+        lats = value[1::2] if self.length == 4 else value[0::2]
+        lons = value[0::2] if self.length == 4 else value[1::2]
+        if any(abs(lat) > 90 for lat in lats) or any(abs(lon) > 180 for lon in lons):
+            raise forms.ValidationError('Coordinates out of range.')
+        if self.length == 4 and value[1] > value[3]:
+            raise forms.ValidationError('South edge must not be north of the north edge.')
+
+
+class CoordinateListFilter(filters.Filter):
+    field_class = CoordinateListField
@@ -0,0 +1,239 @@
+"""Typeahead suggestions from an in-process trigram index of each user's titles and countries.
+
+Every distinct title and country of a user's landmarks is a term, indexed by
+the trigrams of its words (padded at the start, so prefixes match).
+A query matches terms sharing enough of its trigrams, which also tolerates
+typos, and terms are ranked by that overlap, by whether they start with the
+query and by how many landmarks use them.
+
+Indexes are built on a user's first request and kept in memory (LRU, up to
+``LANDMARK_SUGGEST_MAX_USERS``). Signal handlers apply this process's writes
+to them once they commit, and each index follows the collection versions
+this process's commits produced. A version it didn't produce means another
+process wrote, and that index is rebuilt.
+"""
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .caching import get_collection_version
+from .models import Landmark
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 20
+# Share of the query's trigrams a term needs to match, unless it starts with the query.
+MIN_SIMILARITY = 0.4
+POPULARITY_WEIGHT = 0.1
+
+_word_re = re.compile(r'\w+')
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def normalize(text):
+    """Lowercase words without accents: 'São Paulo!' -> 'sao paulo'."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char)).lower()
+    return ' '.join(_word_re.findall(text))
+
+
+def trigrams(text, prefix=False):
+    """Trigrams of every word; with ``prefix`` the last word may be unfinished."""
+    words = text.split()
+    grams = set()
+    for position, word in enumerate(words):
+        padded = f'$${word}' if prefix and position == len(words) - 1 else f'$${word}$'
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class Term:
+    __slots__ = ('field', 'text', 'normalized', 'grams', 'count')
+
+    def __init__(self, field, text, normalized):
+        self.field = field
+        self.text = text
+        self.normalized = normalized
+        self.grams = trigrams(normalized)
+        self.count = 0
+
+
+class SuggestIndex:
+    def __init__(self, version):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.terms = {}
+        self.postings = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def update(self, field, text, delta):
+        normalized = normalize(text)
+        if not normalized:
+            return
+        key = (field, normalized)
+        term = self.terms.get(key)
+        if term is None:
+            if delta < 0:
+                return
+            term = self.terms[key] = Term(field, text.strip(), normalized)
+            for gram in term.grams:
+                self.postings[gram].add(key)
+        term.count += delta
+        if term.count <= 0:
+            del self.terms[key]
+            for gram in term.grams:
+                self.postings[gram].discard(key)
+                if not self.postings[gram]:
+                    del self.postings[gram]
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        normalized = normalize(query)
+        grams = trigrams(normalized, prefix=True)
+        if not grams:
+            return []
+        last_word = normalized.split()[-1]
+        with self.lock:
+            shared = Counter(key for gram in grams for key in self.postings.get(gram, ()))
+            scored = []
+            for key, overlap in shared.items():
+                term = self.terms[key]
+                score = overlap / len(grams)
+                if term.normalized.startswith(normalized):
+                    score += 1.0
+                elif any(word.startswith(last_word) for word in term.normalized.split()):
+                    score += 0.5
+                elif score < MIN_SIMILARITY:
+                    continue
+                score += POPULARITY_WEIGHT * math.log1p(term.count)
+                scored.append((-score, term.text, term))
+        scored.sort(key=lambda item: item[:2])
+        return [{'text': term.text, 'field': term.field, 'count': term.count} for _, _, term in scored[:limit]]
+
+
+def build_index(user_id, version):
+    index = SuggestIndex(version)
+    for title, country in Landmark.objects.filter(user_id=user_id).values_list('title', 'country').iterator():
+        index.update('title', title, 1)
+        index.update('country', country, 1)
+    return index
+
+
+def max_users():
+    return getattr(settings, 'LANDMARK_SUGGEST_MAX_USERS', 1000)
+
+
+def get_index(user_id):
+    version, _ = get_collection_version(user_id)
+    max_age = getattr(settings, 'LANDMARK_SUGGEST_MAX_AGE', 600)
+    with _lock:
+        index = _indexes.get(user_id)
+        if index is not None and index.version == version and time.monotonic() - index.built_at < max_age:
+            _indexes.move_to_end(user_id)
+            return index
+    index = build_index(user_id, version)
+    with _lock:
+        _indexes[user_id] = index
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > max_users():
+            _indexes.popitem(last=False)
+    return index
+
+
+def suggest(user_id, query, limit=DEFAULT_LIMIT):
+    if not normalize(query):
+        return []
+    return get_index(user_id).search(query, limit)
+
+
+def clear():
+    with _lock:
+        _indexes.clear()
+
+
+# Signal handler hooks. Changes reach the indexes once the transaction commits.
+
+def suggest_entry(user_id, title, country):
+    if user_id is None:
+        return None
+    return user_id, title or '', country or ''
+
+
+def landmark_entry(landmark):
+    return suggest_entry(landmark.user_id, landmark.title, landmark.country)
+
+
+def _drop(user_id, index):
+    with _lock:
+        if _indexes.get(user_id) is index:
+            del _indexes[user_id]
+
+
+def bumped(user_id, version):
+    """Called by bump_collection_version with the version this transaction wrote."""
+    transaction.on_commit(lambda: _follow(user_id, version))
+
+
+def _follow(user_id, version):
+    with _lock:
+        index = _indexes.get(user_id)
+    if index is None:
+        return
+    with index.lock:
+        if version <= index.version:
+            # Already counted: the index was built after this commit.
+            return
+        if version == index.version + 1:
+            index.version = version
+            return
+    # Versions in between were written by another process.
+    _drop(user_id, index)
+
+
+def _apply(changes):
+    by_user = defaultdict(list)
+    for entry, delta in changes:
+        if entry is not None:
+            by_user[entry[0]].append((entry, delta))
+    for user_id, user_changes in by_user.items():
+        with _lock:
+            index = _indexes.get(user_id)
+        if index is None:
+            continue
+        # The version was moved on (or the index dropped) by _follow.
+        with index.lock:
+            for (_, title, country), delta in user_changes:
+                index.update('title', title, delta)
+                index.update('country', country, delta)
+
+
+def add(entries):
+    changes = [(entry, 1) for entry in entries]
+    transaction.on_commit(lambda: _apply(changes))
+
+
+def remove(entries):
+    changes = [(entry, -1) for entry in entries]
+    transaction.on_commit(lambda: _apply(changes))
+
+
+def move(old, new):
+    if old == new:
+        return
+    transaction.on_commit(lambda: _apply([(old, -1), (new, 1)]))
+
+
+def rebuild(user_ids):
+    # Dropped indexes are built again on their owner's next request.
+    user_ids = list(user_ids)
+
+    def drop():
+        with _lock:
+            for user_id in user_ids:
+                _indexes.pop(user_id, None)
+    transaction.on_commit(drop)
@@ -0,0 +1,92 @@
+import base64
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Landmark, LandmarkTombstone
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class ExpiredToken(Exception):
+    pass
+
+
+def retention():
+    return timedelta(days=getattr(settings, 'LANDMARK_TOMBSTONE_RETENTION_DAYS', 90))
+
+
+def encode_token(position):
+    data = json.dumps(position, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_token(token):
+    """Return the sync position for ``token``; an empty token starts from scratch."""
+    if not token:
+        return {'t': None, 'i': 0, 'd': 0, 's': None}
+    try:
+        position = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        updated_at = parse_datetime(position['t']) if position['t'] else None
+        issued_at = parse_datetime(position['s'])
+        position = {'t': updated_at, 'i': int(position['i']), 'd': int(position['d']), 's': issued_at}
+    except (ValueError, KeyError, TypeError):
+        raise InvalidToken('Malformed sync token.')
+    if issued_at is None or issued_at < timezone.now() - retention():
+        raise ExpiredToken('Sync token is older than the deletion log; a full resync is required.')
+    return position
+
+
+def collect_changes(user, token, limit=DEFAULT_LIMIT):
+    """Landmarks updated and deleted since ``token``, oldest first, at most ``limit`` of each.
+
+    Returns ``(landmarks, deleted_ids, next_token, has_more)``. Upserts are
+    walked in ``(updated_at, id)`` order and deletions in log order, so a
+    client that keeps following ``next_token`` sees every change exactly once.
+    """
+    position = decode_token(token)
+    issued_at = timezone.now()
+
+    landmarks = Landmark.objects.filter(user=user).select_related('user')
+    if position['t'] is not None:
+        landmarks = landmarks.filter(
+            Q(updated_at__gt=position['t']) | Q(updated_at=position['t'], id__gt=position['i'])
+        )
+    landmarks = list(landmarks.order_by('updated_at', 'id')[:limit + 1])
+
+    # A landmark that moved away and back again is live, not deleted.
+    tombstones = list(
+        LandmarkTombstone.objects.filter(user=user, id__gt=position['d'])
+        .exclude(landmark_id__in=Landmark.objects.filter(user=user).values('id'))
+        .order_by('id').values_list('id', 'landmark_id')[:limit + 1]
+    )
+
+    has_more = len(landmarks) > limit or len(tombstones) > limit
+    landmarks, tombstones = landmarks[:limit], tombstones[:limit]
+    if landmarks:
+        position['t'], position['i'] = landmarks[-1].updated_at, landmarks[-1].id
+    if tombstones:
+        position['d'] = tombstones[-1][0]
+
+    next_token = encode_token({
+        't': position['t'].isoformat() if position['t'] else None,
+        'i': position['i'],
+        'd': position['d'],
+        's': issued_at.isoformat(),
+    })
+    return landmarks, [landmark_id for _, landmark_id in tombstones], next_token, has_more
+
+
+def prune_tombstones(now=None):
+    cutoff = (now or timezone.now()) - retention()
+    deleted, _ = LandmarkTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,97 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from .models import Landmark, User
+from .signals import landmarks_bulk_changed
+
+# (country, latitude, longitude, spread in degrees)
+COUNTRIES = [
+    ('France', 46.6, 2.4, 4.0), ('Italy', 42.8, 12.6, 3.5), ('Spain', 40.2, -3.6, 4.0),
+    ('Greece', 39.1, 22.0, 2.5), ('Germany', 51.1, 10.4, 3.5), ('United Kingdom', 53.0, -1.9, 3.0),
+    ('United States', 39.8, -98.6, 12.0), ('Canada', 56.1, -106.3, 10.0), ('Mexico', 23.6, -102.5, 6.0),
+    ('Brazil', -14.2, -51.9, 10.0), ('Peru', -9.2, -75.0, 5.0), ('Argentina', -38.4, -63.6, 8.0),
+    ('Egypt', 26.8, 30.8, 4.0), ('Morocco', 31.8, -7.1, 3.0), ('Kenya', -0.0, 37.9, 3.0),
+    ('India', 20.6, 79.0, 8.0), ('China', 35.9, 104.2, 12.0), ('Japan', 36.2, 138.3, 4.0),
+    ('Cambodia', 12.6, 104.9, 2.0), ('Thailand', 15.9, 101.0, 4.0), ('Australia', -25.3, 133.8, 12.0),
+    ('New Zealand', -40.9, 174.9, 4.0), ('Norway', 60.5, 8.5, 5.0), ('Turkey', 39.0, 35.2, 4.0),
+    ('Jordan', 30.6, 36.2, 1.5), ('Fiji', -17.7, 178.1, 1.0),
+]
+CATEGORIES = [code for code, _ in Landmark.CATEGORY_CHOICES]
+
+TITLE_PATTERNS = {
+    'RELIGIOUS': ['{adj} Cathedral of {saint}', 'Temple of the {noun}', 'Monastery of {saint}', '{place} {adj} Mosque'],
+    'HISTORICAL': ['{place} Castle', 'Ruins of {place}', '{adj} Fortress', 'Old Town of {place}', '{place} Palace'],
+    'NATURAL': ['{place} Falls', '{adj} Canyon', 'Mount {place}', '{place} National Park', 'Lake {place}'],
+    'CULTURAL': ['{place} Museum of {noun}', '{adj} Opera House', '{place} Market', 'Gallery of {noun}'],
+    'OTHER': ['{place} Tower', '{adj} Bridge', '{place} Lighthouse', '{place} Square'],
+}
+ADJECTIVES = ['Great', 'Old', 'Royal', 'Ancient', 'Golden', 'Sacred', 'Grand', 'Hidden', 'Northern', 'Crystal']
+SAINTS = ['St. Mary', 'St. John', 'St. George', 'St. Nicholas', 'St. Peter', 'St. Sophia', 'St. Catherine']
+NOUNS = ['Heaven', 'Dawn', 'Winds', 'Modern Art', 'History', 'Light', 'the Sea', 'the Moon', 'Kings']
+SYLLABLES = ['ka', 'ro', 'mi', 'sa', 'to', 'la', 've', 'na', 'dor', 'bel', 'mon', 'tia', 'quel', 'zar', 'pe']
+SENTENCES = [
+    'Built in the {century} century, it draws visitors from around the world.',
+    'The site is known for its {adj_l} architecture and panoramic views.',
+    'Local guides offer tours every morning during the summer season.',
+    'It was restored after a major earthquake damaged the original structure.',
+    'Archaeologists have uncovered artifacts dating back thousands of years.',
+    'The surrounding area is home to rare birds and {adj_l} gardens.',
+    'Festivals held here each spring attract musicians and pilgrims alike.',
+    'A short hike from the main road leads to the best viewpoint.',
+]
+CENTURIES = ['third', 'ninth', 'twelfth', 'fifteenth', 'seventeenth', 'nineteenth']
+
+
+def place_name(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+
+
+def synthetic_landmark(rng, user):
+    category = rng.choice(CATEGORIES)
+    country, lat, lon, spread = rng.choice(COUNTRIES)
+    title = rng.choice(TITLE_PATTERNS[category]).format(
+        adj=rng.choice(ADJECTIVES), saint=rng.choice(SAINTS), noun=rng.choice(NOUNS), place=place_name(rng)
+    )
+    description = ' '.join(
+        rng.choice(SENTENCES).format(century=rng.choice(CENTURIES), adj_l=rng.choice(ADJECTIVES).lower())
+        for _ in range(rng.randint(2, 5))
+    )
+    latitude = max(-89.9, min(89.9, rng.gauss(lat, spread / 2)))
+    longitude = (rng.gauss(lon, spread / 2) + 180) % 360 - 180
+    return Landmark(
+        title=title, category=category, description=description, country=country,
+        latitude=round(latitude, 6), longitude=round(longitude, 6), user=user,
+    )
+
+
+def create_users(count, prefix='bench'):
+    password = make_password(None)
+    existing = set(User.objects.filter(username__startswith=f'{prefix}-').values_list('username', flat=True))
+    User.objects.bulk_create([
+        User(username=f'{prefix}-{i}', email=f'{prefix}-{i}@example.com', password=password)
+        for i in range(count) if f'{prefix}-{i}' not in existing
+    ])
+    return list(User.objects.filter(username__in=[f'{prefix}-{i}' for i in range(count)]).order_by('id'))
+
+
+def generate_landmarks(count, users, seed=0, batch_size=5000, progress=None):
+    """Bulk-insert ``count`` synthetic landmarks spread over ``users``.
+
+    The generator is seeded, so the same arguments always produce the same data.
+    """
+    rng = random.Random(seed)
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        batch = [synthetic_landmark(rng, rng.choice(users)) for _ in range(size)]
+        with transaction.atomic():
+            Landmark.objects.bulk_create(batch)
+            landmarks_bulk_changed.send(
+                sender=Landmark, user_ids={landmark.user_id for landmark in batch}, created=batch
+            )
+        created += size
+        if progress:
+            progress(created)
+    return created
@@ -0,0 +1,25 @@
+from django import template
+
+from landmarks import media
+
+register = template.Library()
+
+CARD_IMAGE_WIDTH = 480
+
+
+@register.filter
+def card_image_url(landmark, user):
+    """Signed URL of the smallest cover image variant that fills a list card, or of the original.
+
+    Cover images are private, so only the landmark's owner gets one.
+    """
+    if not landmark.cover_image or landmark.user_id != user.pk:
+        return ''
+    variants = landmark.cover_image_variants
+    if variants:
+        widths = sorted(int(width) for width in variants)
+        width = next((width for width in widths if width >= CARD_IMAGE_WIDTH), widths[-1])
+        name = variants[str(width)].get('jpeg')
+        if name:
+            return media.signed_url(name, landmark.user_id)
+    return media.signed_url(landmark.cover_image.name, landmark.user_id)
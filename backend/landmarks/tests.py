@@ -1,3 +1,1985 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import hashlib
+import html
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+import os
+import random
+import re
+import shutil
+import sqlite3
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import requests
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.signals import request_finished
+from django.db import close_old_connections, connection
+from django.db.models import F, Sum
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import async_views, batch, benchmarks, bulk, clusters, compression, duplicates, facets, images, jobs, media, metrics, routers, suggest, synthetic, uploads
+from .authentication import user_cache
+from .caching import get_response_cache
+from .management.commands.populate_landmarks import Command as PopulateCommand
+from .models import (
+    Job, Landmark, LandmarkBatch, LandmarkCollectionVersion, LandmarkFacetCount, LandmarkGridCell, LandmarkImageHash,
+    LandmarkTombstone, UploadSession, User,
+)
+from .renderers import ColumnarJSONRenderer, FastJSONRenderer, MessagePackRenderer, msgpack, to_columns
+
+
+class LandmarkAPITestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='owner@example.com', username='owner', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        get_response_cache().clear()
+        suggest.clear()
+
+    def create_landmark(self, title, latitude=None, longitude=None, **extra):
+        return Landmark.objects.create(
+            title=title, latitude=latitude, longitude=longitude, user=extra.pop('user', self.user), **extra
+        )
+
+    def rows(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        return data['results'] if isinstance(data, dict) else data
+
+    def titles(self, response):
+        return [row['title'] for row in self.rows(response)]
+
+
+def make_image(name='photo.jpg', size=(1200, 800), color=(200, 120, 40)):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+def make_photo(seed, size=(1200, 800), quality=90, name='photo.jpg'):
+    """A JPEG with random texture, so perceptual hashes of different seeds differ."""
+    rng = random.Random(seed)
+    tiles = Image.new('L', (16, 12))
+    tiles.putdata([rng.randrange(256) for _ in range(16 * 12)])
+    image = Image.merge('RGB', [tiles.resize(size, Image.BILINEAR)] * 3)
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=quality)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class MediaTestMixin:
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.media_settings = override_settings(MEDIA_ROOT=self.media_root, LANDMARK_JOBS_EAGER=True)
+        self.media_settings.enable()
+
+    def tearDown(self):
+        self.media_settings.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        super().tearDown()
+
+
+class SpatialFilterTests(LandmarkAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_landmark('Eiffel Tower', 48.8584, 2.2945)
+        self.create_landmark('Louvre', 48.8606, 2.3376)
+        self.create_landmark('Colosseum', 41.8902, 12.4922)
+        self.create_landmark('Fiji', -17.7134, 178.0650)
+        self.create_landmark('Samoa', -13.7590, -172.1046)
+        self.create_landmark('Nowhere')
+
+    def test_bbox(self):
+        response = self.client.get('/api/landmarks/', {'bbox': '2,48,3,49'})
+        self.assertCountEqual(self.titles(response), ['Eiffel Tower', 'Louvre'])
+
+    def test_bbox_across_antimeridian(self):
+        response = self.client.get('/api/landmarks/', {'bbox': '170,-20,-170,-10'})
+        self.assertCountEqual(self.titles(response), ['Fiji', 'Samoa'])
+
+    def test_rtree_follows_updates(self):
+        colosseum = Landmark.objects.get(title='Colosseum')
+        colosseum.latitude, colosseum.longitude = 48.85, 2.30
+        colosseum.save()
+        response = self.client.get('/api/landmarks/', {'bbox': '2,48,3,49'})
+        self.assertCountEqual(self.titles(response), ['Eiffel Tower', 'Louvre', 'Colosseum'])
+
+    def test_near_with_radius(self):
+        response = self.client.get('/api/landmarks/', {'near': '48.8566,2.3522', 'radius': 10})
+        self.assertEqual(self.titles(response), ['Louvre', 'Eiffel Tower'])
+        self.assertAlmostEqual(self.rows(response)[0]['distance_km'], 1.16, delta=0.05)
+
+    def test_nearest(self):
+        response = self.client.get('/api/landmarks/', {'near': '48.8,2.0', 'nearest': 2})
+        self.assertEqual(self.titles(response), ['Eiffel Tower', 'Louvre'])
+
+    def test_invalid_bbox(self):
+        response = self.client.get('/api/landmarks/', {'bbox': '1,2,3'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_scoped_to_user(self):
+        other = User.objects.create_user(email='other@example.com', username='other', password='pass')
+        self.create_landmark('Notre-Dame', 48.8530, 2.3499, user=other)
+        response = self.client.get('/api/landmarks/', {'near': '48.8566,2.3522', 'nearest': 5})
+        self.assertNotIn('Notre-Dame', self.titles(response))
+
+
+class FullTextSearchTests(LandmarkAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_landmark('Angkor Wat', description='Largest religious monument in the world.', category='RELIGIOUS')
+        self.create_landmark('Temple of Heaven', description='Imperial <complex> in Beijing.', category='RELIGIOUS')
+        self.create_landmark('Colosseum', description='An amphitheatre that hosted religious festivals.')
+
+    def test_prefix_match_ranked_by_title(self):
+        response = self.client.get('/api/landmarks/', {'search': 'temp'})
+        self.assertEqual(self.titles(response), ['Temple of Heaven'])
+        response = self.client.get('/api/landmarks/', {'search': 'relig'})
+        self.assertEqual(self.titles(response)[-1], 'Colosseum')
+
+    def test_snippet_is_escaped_and_highlighted(self):
+        response = self.client.get('/api/landmarks/', {'search': 'imperial'})
+        snippet = self.rows(response)[0]['search_snippet']
+        self.assertIn('<mark>Imperial</mark>', snippet)
+        self.assertIn('&lt;complex&gt;', snippet)
+
+    def test_index_follows_updates_and_deletes(self):
+        colosseum = Landmark.objects.get(title='Colosseum')
+        colosseum.title = 'Flavian Amphitheatre'
+        colosseum.save()
+        self.assertEqual(self.titles(self.client.get('/api/landmarks/', {'search': 'flavian'})), ['Flavian Amphitheatre'])
+        colosseum.delete()
+        self.assertEqual(self.titles(self.client.get('/api/landmarks/', {'search': 'flavian'})), [])
+
+    def test_operators_are_treated_as_text(self):
+        response = self.client.get('/api/landmarks/', {'search': 'wat" OR NEAR(*'})
+        self.assertEqual(response.status_code, 200)
+
+
+class PaginationTests(LandmarkAPITestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            self.create_landmark(f'Landmark {i}', 40 + i, 10)
+
+    def collect(self, params):
+        titles, url = [], '/api/landmarks/'
+        while url:
+            response = self.client.get(url, params)
+            titles.extend(self.titles(response))
+            url, params = response.json()['next'], None
+        return titles
+
+    def test_cursor_pages_newest_first(self):
+        self.assertEqual(self.collect({'page_size': 2}), [f'Landmark {i}' for i in reversed(range(5))])
+
+    def test_cursor_pages_follow_distance_ranking(self):
+        titles = self.collect({'page_size': 2, 'near': '40,10'})
+        self.assertEqual(titles, [f'Landmark {i}' for i in range(5)])
+
+    def test_cursor_pages_follow_search_ranking(self):
+        descriptions = {1: 'tower', 2: 'a tower among many other words', 3: 'tower tower', 4: 'tower and more'}
+        for landmark in Landmark.objects.filter(title__in=[f'Landmark {i}' for i in descriptions]):
+            landmark.description = descriptions[int(landmark.title.split()[-1])]
+            landmark.save()
+        titles = self.collect({'page_size': 2, 'search': 'tower'})
+        self.assertEqual(titles, ['Landmark 3', 'Landmark 1', 'Landmark 4', 'Landmark 2'])
+
+    def test_legacy_unpaginated_flag(self):
+        response = self.client.get('/api/landmarks/', {'paginate': 'false'})
+        self.assertIsInstance(response.json(), list)
+        self.assertEqual(len(response.json()), 5)
+
+    @override_settings(LANDMARK_LIST_PAGINATION=False)
+    def test_pagination_can_be_disabled_by_default(self):
+        self.assertIsInstance(self.client.get('/api/landmarks/').json(), list)
+        self.assertIsInstance(self.client.get('/api/landmarks/', {'paginate': 'true'}).json(), dict)
+
+
+class ConditionalGetTests(LandmarkAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.landmark = self.create_landmark('Petra', 30.3285, 35.4444)
+
+    def test_unchanged_list_is_not_modified(self):
+        response = self.client.get('/api/landmarks/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header('Last-Modified'))
+        response = self.client.get('/api/landmarks/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_write_changes_etag_and_bypasses_cache(self):
+        first = self.client.get('/api/landmarks/')
+        self.landmark.title = 'Petra, Jordan'
+        self.landmark.save()
+        second = self.client.get('/api/landmarks/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(first['ETag'], second['ETag'])
+        self.assertEqual(self.titles(second), ['Petra, Jordan'])
+
+    def test_cached_body_is_reused(self):
+        first = self.client.get(f'/api/landmarks/{self.landmark.pk}/')
+        Landmark.objects.filter(pk=self.landmark.pk).update(title='changed behind the cache')
+        second = self.client.get(f'/api/landmarks/{self.landmark.pk}/')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_etag_depends_on_query_and_user(self):
+        plain = self.client.get('/api/landmarks/')
+        filtered = self.client.get('/api/landmarks/', {'category': 'NATURAL'})
+        self.assertNotEqual(plain['ETag'], filtered['ETag'])
+        other = User.objects.create_user(email='other@example.com', username='other', password='pass')
+        self.client.force_authenticate(other)
+        response = self.client.get('/api/landmarks/', HTTP_IF_NONE_MATCH=plain['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.rows(response), [])
+
+    def test_reassigning_owner_invalidates_previous_owner(self):
+        first = self.client.get('/api/landmarks/')
+        other = User.objects.create_user(email='other@example.com', username='other', password='pass')
+        self.landmark.user = other
+        self.landmark.save()
+        response = self.client.get('/api/landmarks/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.rows(response), [])
+
+
+class ImageVariantTests(MediaTestMixin, LandmarkAPITestCase):
+    def test_upload_generates_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/landmarks/', {'title': 'Acropolis', 'cover_image': make_image()})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertIsNone(response.json()['cover_image_variants'])
+
+        detail = self.client.get(f"/api/landmarks/{response.json()['id']}/").json()
+        variants = detail['cover_image_variants']
+        self.assertEqual(sorted(variants, key=int), ['160', '480', '1080'])
+        self.assertTrue(variants['160']['webp'].startswith('http://testserver/media/landmarks/variants/'))
+        landmark = Landmark.objects.get()
+        with default_storage.open(landmark.cover_image_variants['480']['jpeg']) as f:
+            self.assertEqual(Image.open(f).size, (480, 320))
+
+    def test_replacing_image_replaces_variants(self):
+        landmark = self.create_landmark('Acropolis')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/landmarks/{landmark.pk}/upload_image/', {'image': make_image(size=(300, 200))})
+        self.assertEqual(response.status_code, 200)
+        landmark.refresh_from_db()
+        old = landmark.cover_image_variants
+        self.assertEqual(list(old), ['160'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/landmarks/{landmark.pk}/upload_image/', {'image': make_image(color=(0, 0, 0))})
+        landmark.refresh_from_db()
+        self.assertEqual(len(landmark.cover_image_variants), 3)
+        self.assertFalse(default_storage.exists(old['160']['webp']))
+
+    def test_backfill_command(self):
+        landmark = self.create_landmark('Acropolis')
+        Landmark.objects.filter(pk=landmark.pk).update(cover_image=default_storage.save('landmarks/a.jpg', make_image()))
+        call_command('generate_image_variants', workers=1, stdout=StringIO())
+        landmark.refresh_from_db()
+        self.assertEqual(len(landmark.cover_image_variants), 3)
+
+
+class MediaServingTests(MediaTestMixin, LandmarkAPITestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/landmarks/', {'title': 'Acropolis', 'cover_image': make_image()})
+        self.landmark = self.client.get(f"/api/landmarks/{response.json()['id']}/").json()
+        self.url = self.landmark['cover_image']
+        self.name = Landmark.objects.get().cover_image.name
+        with default_storage.open(self.name) as f:
+            self.data = f.read()
+        self.media_client = APIClient()  # image loaders don't authenticate
+
+    def fetch(self, url, **headers):
+        response = self.media_client.get(url, **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_signed_urls_serve_files_with_validators(self):
+        self.assertIn(f'?u={self.user.pk}&sig=', self.url)
+        response, body = self.fetch(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.data)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Content-Length'], str(len(self.data)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertEqual(self.fetch(self.url, HTTP_IF_NONE_MATCH=response['ETag'])[0].status_code, 304)
+        self.assertEqual(self.fetch(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])[0].status_code, 304)
+
+        variant, _ = self.fetch(self.landmark['cover_image_variants']['160']['webp'])
+        self.assertEqual(variant.status_code, 200)
+        self.assertEqual(variant['Content-Type'], 'image/webp')
+        self.assertIn('immutable', variant['Cache-Control'])
+        self.assertIn('max-age=31536000', variant['Cache-Control'])
+
+    def test_refreshing_expired_urls(self):
+        later = media.url_window_start() + media.url_max_age() + 1
+        with mock.patch('time.time', return_value=later):
+            response = self.client.get('/api/landmarks/media-urls/', {'ids': f"{self.landmark['id']},12345"})
+            self.assertEqual(response.status_code, 200, response.content)
+            body = response.json()
+            self.assertEqual([row['id'] for row in body['landmarks']], [self.landmark['id']])
+            fresh = body['landmarks'][0]
+            self.assertEqual(self.fetch(fresh['cover_image'])[0].status_code, 200)
+            self.assertEqual(self.fetch(fresh['cover_image_variants']['160']['webp'])[0].status_code, 200)
+            self.assertGreater(datetime.fromisoformat(body['expires_at'].replace('Z', '+00:00')).timestamp(), later)
+            # The same URLs re-signed, as batch replays do.
+            self.assertEqual(media.resign_url(self.url, self.user.pk), fresh['cover_image'])
+
+        stranger = User.objects.create_user(email='s@example.com', username='s')
+        self.client.force_authenticate(stranger)
+        self.assertEqual(self.client.get('/api/landmarks/media-urls/', {'ids': self.landmark['id']}).json()['landmarks'], [])
+        self.assertEqual(self.client.get('/api/landmarks/media-urls/', {'ids': '1,x'}).status_code, 400)
+
+    def test_unsigned_or_forged_urls_are_refused(self):
+        path = self.url.split('?')[0]
+        self.assertEqual(self.fetch(path)[0].status_code, 404)
+        self.assertEqual(self.fetch(f'{path}?u={self.user.pk}&sig=forged')[0].status_code, 404)
+        other = default_storage.save('landmarks/other.jpg', make_image())
+        self.assertEqual(self.fetch(f'/media/{other}?u={self.user.pk}&sig={media.sign(self.name, self.user.pk)}')[0].status_code, 404)
+        # Signed, but not a file of one of the signed owner's landmarks.
+        self.assertEqual(self.fetch(media.signed_url(other, self.user.pk))[0].status_code, 404)
+        stranger = User.objects.create_user(email='s@example.com', username='s')
+        self.assertEqual(self.fetch(self.url.replace(f'u={self.user.pk}', f'u={stranger.pk}'))[0].status_code, 404)
+        self.assertEqual(self.fetch(media.signed_url(self.name, stranger.pk))[0].status_code, 404)
+        self.assertEqual(self.fetch(media.signed_url('../db.sqlite3', self.user.pk))[0].status_code, 404)
+        self.assertEqual(self.media_client.post(self.url).status_code, 405)
+
+    def test_urls_expire(self):
+        variant = self.landmark['cover_image_variants']['160']['webp']
+        later = media.url_window_start() + media.url_max_age() + 1
+        with mock.patch('time.time', return_value=later):
+            self.assertEqual(self.fetch(self.url)[0].status_code, 404)
+            self.assertEqual(self.fetch(variant)[0].status_code, 404)
+            fresh = self.client.get(f"/api/landmarks/{self.landmark['id']}/").json()
+        self.assertNotEqual(fresh['cover_image'], self.url)
+        with mock.patch('time.time', return_value=later):
+            self.assertEqual(self.fetch(fresh['cover_image'])[0].status_code, 200)
+
+    def test_reassigning_or_deactivating_the_owner_revokes_urls(self):
+        variant = self.landmark['cover_image_variants']['160']['webp']
+        landmark = Landmark.objects.get()
+        other = User.objects.create_user(email='other@example.com', username='other')
+        landmark.user = other
+        landmark.save()
+        self.assertEqual(self.fetch(self.url)[0].status_code, 404)
+        self.assertEqual(self.fetch(variant)[0].status_code, 404)
+        self.assertEqual(self.fetch(media.signed_url(self.name, other.pk))[0].status_code, 200)
+        other.is_active = False
+        other.save()
+        self.assertEqual(self.fetch(media.signed_url(self.name, other.pk))[0].status_code, 404)
+
+    def test_ranges(self):
+        size = len(self.data)
+        response, body = self.fetch(self.url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.data[:10])
+        self.assertEqual(response['Content-Range'], f'bytes 0-9/{size}')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(self.fetch(self.url, HTTP_RANGE='bytes=-5')[1], self.data[-5:])
+        self.assertEqual(self.fetch(self.url, HTTP_RANGE=f'bytes={size - 3}-')[1], self.data[-3:])
+        self.assertEqual(self.fetch(self.url, HTTP_RANGE=f'bytes=10-{size * 2}')[1], self.data[10:])
+
+        unsatisfiable, _ = self.fetch(self.url, HTTP_RANGE=f'bytes={size}-')
+        self.assertEqual(unsatisfiable.status_code, 416)
+        self.assertEqual(unsatisfiable['Content-Range'], f'bytes */{size}')
+        for ignored in ('bytes=0-1,4-5', 'bytes=9-3', 'items=0-1'):
+            self.assertEqual(self.fetch(self.url, HTTP_RANGE=ignored)[0].status_code, 200, ignored)
+
+        etag = self.fetch(self.url)[0]['ETag']
+        self.assertEqual(self.fetch(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)[0].status_code, 206)
+        stale, body = self.fetch(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(body, self.data)
+
+    def test_proxy_delivery_modes(self):
+        with override_settings(LANDMARK_MEDIA_DELIVERY='x-accel'):
+            response, body = self.fetch(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.name}')
+        self.assertEqual(body, b'')
+        self.assertIn('ETag', response)
+        with override_settings(LANDMARK_MEDIA_DELIVERY='x-sendfile'):
+            response, _ = self.fetch(self.url)
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.media_root, self.name))
+
+
+calls = []
+
+
+@jobs.job(max_attempts=2, retry_delay=30)
+def record_call(value):
+    calls.append(value)
+    if value == 'fail':
+        raise ValueError('boom')
+    return {'value': value}
+
+
+class JobTests(LandmarkAPITestCase):
+    def setUp(self):
+        super().setUp()
+        calls.clear()
+
+    def test_delay_queues_and_worker_runs(self):
+        job = record_call.delay('a')
+        self.assertEqual((job.status, job.name, job.args), (Job.QUEUED, 'landmarks.tests.record_call', ['a']))
+        self.assertEqual(calls, [])
+        self.assertEqual(jobs.work(burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.result), (Job.SUCCEEDED, 1, {'value': 'a'}))
+        self.assertEqual(calls, ['a'])
+        self.assertEqual(jobs.work(burst=True), 0)
+
+    def test_failures_retry_with_backoff_then_fail(self):
+        job = record_call.delay('fail')
+        jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('ValueError: boom', job.error)
+        self.assertGreaterEqual(job.run_at, timezone.now() + timedelta(seconds=29))
+        # Not due yet.
+        self.assertEqual(jobs.work(burst=True), 0)
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(calls, ['fail', 'fail'])
+
+    def test_idempotency_key_returns_existing_job(self):
+        first = record_call.enqueue(('a',), idempotency_key='once')
+        second = record_call.enqueue(('b',), idempotency_key='once')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_idempotency_key_requeues_a_failed_job(self):
+        job = record_call.enqueue(('fail',), idempotency_key='variants')
+        Job.objects.filter(pk=job.pk).update(status=Job.FAILED, attempts=2, error='boom', finished_at=timezone.now())
+        again = record_call.enqueue(('a',), idempotency_key='variants')
+        self.assertEqual(again.pk, job.pk)
+        self.assertEqual((again.status, again.attempts, again.args, again.error), (Job.QUEUED, 0, ['a'], ''))
+        self.assertIsNone(again.finished_at)
+        self.assertEqual(jobs.work(burst=True), 1)
+        again.refresh_from_db()
+        self.assertEqual(again.status, Job.SUCCEEDED)
+
+    def test_claim_is_exclusive_and_stale_jobs_are_requeued(self):
+        job = record_call.delay('a')
+        self.assertEqual(jobs.claim('worker-1').pk, job.pk)
+        self.assertIsNone(jobs.claim('worker-2'))
+        self.assertEqual(jobs.requeue_stale(timeout=60), 0)
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(jobs.requeue_stale(timeout=60), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('worker-1', job.error)
+
+    def test_eager_mode_runs_on_commit(self):
+        with override_settings(LANDMARK_JOBS_EAGER=True), self.captureOnCommitCallbacks(execute=True):
+            job = record_call.delay('a')
+            self.assertEqual(calls, [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(calls, ['a'])
+
+    def test_prune_keeps_recent_and_unfinished_jobs(self):
+        old = record_call.delay('a')
+        jobs.work(burst=True)
+        Job.objects.filter(pk=old.pk).update(finished_at=timezone.now() - timedelta(days=30))
+        queued = record_call.delay('b')
+        self.assertEqual(jobs.prune_finished(days=7), 1)
+        self.assertEqual(list(Job.objects.values_list('pk', flat=True)), [queued.pk])
+
+    def test_status_api_lists_own_jobs(self):
+        mine = record_call.enqueue(('a',), user_id=self.user.pk)
+        other = User.objects.create_user(email='o@example.com', username='o')
+        record_call.enqueue(('b',), user_id=other.pk)
+        response = self.client.get('/api/jobs/')
+        self.assertEqual([job['id'] for job in response.json()['results']], [mine.pk])
+        detail = self.client.get(f'/api/jobs/{mine.pk}/').json()
+        self.assertEqual((detail['status'], detail['attempts']), ('queued', 0))
+        self.assertEqual(self.client.get('/api/jobs/', {'status': 'failed'}).json()['results'], [])
+        self.assertEqual(self.client.get(f'/api/jobs/{Job.objects.exclude(pk=mine.pk).get().pk}/').status_code, 404)
+
+    def test_upload_queues_variant_job_for_workers(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/landmarks/', {'title': 'Acropolis', 'cover_image': make_image()})
+            landmark = Landmark.objects.get(pk=response.json()['id'])
+            self.assertIsNone(landmark.cover_image_variants)
+            job = Job.objects.get(name='landmarks.images.process_cover_image')
+            self.assertEqual((job.args, job.user_id), ([landmark.pk, landmark.cover_image.name], self.user.pk))
+            # Saving again with the same image doesn't queue a second job.
+            images.schedule_variants(landmark.pk, landmark.cover_image.name, self.user.pk)
+            self.assertEqual(Job.objects.count(), 1)
+            call_command('run_workers', processes=1, burst=True, stdout=StringIO())
+            landmark.refresh_from_db()
+        self.assertEqual(len(landmark.cover_image_variants), 3)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result, landmark.cover_image_variants)
+
+
+class DuplicateImageTests(MediaTestMixin, LandmarkAPITestCase):
+    def upload(self, image, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/landmarks/', {'title': image.name, 'cover_image': image, **data})
+        return response
+
+    def test_hash_survives_resizing_and_recompression(self):
+        original = duplicates.hash_file(make_photo(1))
+        copy = duplicates.hash_file(make_photo(1, size=(600, 400), quality=50))
+        other = duplicates.hash_file(make_photo(2))
+        self.assertLessEqual(duplicates.hamming(original, copy), duplicates.DUPLICATE_DISTANCE)
+        self.assertGreater(duplicates.hamming(original, other), 16)
+
+    def test_band_lookup_matches_brute_force(self):
+        rng = random.Random(3)
+        base = rng.getrandbits(64)
+        hashes = {}
+        for i in range(60):
+            value = base
+            for bit in rng.sample(range(64), rng.randrange(0, 20)):
+                value ^= 1 << bit
+            landmark = self.create_landmark(f'L{i}')
+            LandmarkImageHash.objects.create(landmark=landmark, image_name=f'l{i}.jpg', **duplicates.hash_fields(value))
+            hashes[landmark.pk] = value
+        for distance in range(duplicates.MAX_DISTANCE + 1):
+            expected = sorted((duplicates.hamming(value, base), pk) for pk, value in hashes.items()
+                              if duplicates.hamming(value, base) <= distance)
+            self.assertEqual(duplicates.similar(self.user, base, distance), expected)
+
+    def test_upload_warns_about_duplicates_and_lists_similar_images(self):
+        first = self.upload(make_photo(1, name='a.jpg')).json()
+        self.assertNotIn('duplicate_images', first)
+        self.assertTrue(LandmarkImageHash.objects.filter(landmark_id=first['id']).exists())
+
+        second = self.upload(make_photo(1, size=(600, 400), quality=50, name='b.jpg'))
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual([match['id'] for match in second.json()['duplicate_images']], [first['id']])
+        self.assertNotIn('duplicate_images', self.upload(make_photo(2, name='c.jpg')).json())
+
+        rejected = self.upload(make_photo(1, quality=70, name='d.jpg'), reject_duplicates='true')
+        self.assertEqual(rejected.status_code, 400)
+        self.assertIn('cover_image', rejected.json()['error'])
+
+        similar = self.client.get(f"/api/landmarks/{first['id']}/similar/").json()
+        self.assertEqual([row['id'] for row in similar['results']], [second.json()['id']])
+        self.assertLessEqual(similar['results'][0]['image_distance'], duplicates.DUPLICATE_DISTANCE)
+        self.assertEqual(similar['results'][0]['title'], 'b.jpg')
+        self.assertEqual(self.client.get(f"/api/landmarks/{first['id']}/similar/", {'distance': 99}).status_code, 400)
+        self.assertEqual(self.client.get(f"/api/landmarks/{first['id']}/similar/", {'distance': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(f"/api/landmarks/{self.create_landmark('Bare').pk}/similar/").status_code, 409)
+
+    def test_other_users_images_are_not_matched(self):
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(email='o@example.com', username='o'))
+        with self.captureOnCommitCallbacks(execute=True):
+            other.post('/api/landmarks/', {'title': 'Theirs', 'cover_image': make_photo(1)})
+        self.assertNotIn('duplicate_images', self.upload(make_photo(1)).json())
+
+    def test_replacing_image_drops_stale_hash(self):
+        landmark_id = self.upload(make_photo(1)).json()['id']
+        self.client.post(f'/api/landmarks/{landmark_id}/upload_image/', {'image': make_photo(2)})
+        self.assertFalse(LandmarkImageHash.objects.filter(landmark_id=landmark_id).exists())
+
+    def test_hash_command_backfills_existing_media(self):
+        landmark = self.create_landmark('Acropolis')
+        name = default_storage.save('landmarks/a.jpg', make_photo(1))
+        Landmark.objects.filter(pk=landmark.pk).update(cover_image=name)
+        call_command('hash_images', workers=1, stdout=StringIO())
+        stored = LandmarkImageHash.objects.get(landmark=landmark)
+        self.assertEqual(duplicates.to_unsigned(stored.hash), duplicates.hash_stored(name))
+        self.assertEqual(stored.image_name, name)
+
+
+class DeltaSyncTests(LandmarkAPITestCase):
+    def sync(self, token=None, limit=2):
+        params = {'limit': limit}
+        if token:
+            params['since'] = token
+        response = self.client.get('/api/landmarks/changes/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def sync_all(self, token=None):
+        changed, deleted = [], []
+        while True:
+            page = self.sync(token)
+            changed += [row['title'] for row in page['changes']]
+            deleted += page['deleted']
+            token = page['next_token']
+            if not page['has_more']:
+                return changed, deleted, token
+
+    def test_generated_variants_are_synced(self):
+        landmark = self.create_landmark('Acropolis', cover_image='landmarks/acropolis.jpg')
+        _, _, token = self.sync_all()
+        variants = {'160': {'jpeg': 'landmarks/variants/acropolis.0123456789ab.160w.jpg'}}
+        with mock.patch.object(images, 'delete_variants'):
+            self.assertTrue(images.store_variants(landmark.pk, 'landmarks/acropolis.jpg', variants))
+        page = self.sync(token)
+        self.assertEqual([row['title'] for row in page['changes']], ['Acropolis'])
+        self.assertIsNotNone(page['changes'][0]['cover_image_variants'])
+        self.assertIn('media_expires_at', page)
+
+    def test_catches_up_in_chunks_and_resumes(self):
+        landmarks = [self.create_landmark(f'Landmark {i}') for i in range(5)]
+        changed, deleted, token = self.sync_all()
+        self.assertEqual(changed, [f'Landmark {i}' for i in range(5)])
+        self.assertEqual(self.sync_all(token)[:2], ([], []))
+
+        landmarks[1].title = 'Renamed'
+        landmarks[1].save()
+        removed_id = landmarks[3].pk
+        landmarks[3].delete()
+        self.create_landmark('New')
+        changed, deleted, token = self.sync_all(token)
+        self.assertEqual(changed, ['Renamed', 'New'])
+        self.assertEqual(deleted, [removed_id])
+
+    def test_reassigned_landmark_is_a_deletion_for_previous_owner(self):
+        landmark = self.create_landmark('Moving')
+        token = self.sync_all()[2]
+        landmark.user = User.objects.create_user(email='other@example.com', username='other', password='pass')
+        landmark.save()
+        self.assertEqual(self.sync_all(token)[:2], ([], [landmark.pk]))
+
+    def test_deleting_owner_does_not_log_tombstones(self):
+        self.create_landmark('Doomed')
+        self.user.delete()
+        self.assertFalse(Landmark.objects.exists())
+
+    def test_bad_and_expired_tokens(self):
+        self.assertEqual(self.client.get('/api/landmarks/changes/', {'since': 'garbage'}).status_code, 400)
+        token = self.sync()['next_token']
+        with override_settings(LANDMARK_TOMBSTONE_RETENTION_DAYS=-1):
+            self.assertEqual(self.client.get('/api/landmarks/changes/', {'since': token}).status_code, 410)
+
+
+class BulkExportImportTests(LandmarkAPITestCase):
+    def test_export_ndjson_and_csv(self):
+        self.create_landmark('Petra', 30.3285, 35.4444, country='Jordan')
+        self.create_landmark('Ålesund, "Norway"')
+        response = self.client.get('/api/landmarks/export/')
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['Petra', 'Ålesund, "Norway"'])
+        self.assertEqual(rows[0]['latitude'], '30.328500')
+
+        response = self.client.get('/api/landmarks/export/', {'type': 'csv'})
+        lines = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(lines[0][:3], ['id', 'title', 'description'])
+        self.assertEqual(lines[2][1], 'Ålesund, "Norway"')
+
+    def test_import_ndjson_reports_row_errors(self):
+        body = '\n'.join([
+            json.dumps({'title': 'Petra', 'latitude': '30.3285', 'longitude': '35.4444'}),
+            '{not json',
+            json.dumps({'title': 'x' * 300}),
+            '',
+            json.dumps({'title': 'Wadi Rum', 'country': 'Jordan'}),
+        ])
+        response = self.client.post('/api/landmarks/import/?batch_size=1', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200, response.content)
+        report = response.json()
+        self.assertEqual((report['created'], report['failed']), (2, 2))
+        self.assertEqual([error['line'] for error in report['errors']], [2, 3])
+        self.assertIn('title', report['errors'][1]['errors'])
+        self.assertEqual(
+            set(Landmark.objects.filter(user=self.user).values_list('title', flat=True)), {'Petra', 'Wadi Rum'}
+        )
+        # Bulk inserts still reach the search index and invalidate cached lists.
+        self.assertEqual(self.titles(self.client.get('/api/landmarks/', {'search': 'wadi'})), ['Wadi Rum'])
+
+    def test_import_csv_round_trip(self):
+        self.create_landmark('Petra', 30.3285, 35.4444, country='Jordan')
+        exported = b''.join(self.client.get('/api/landmarks/export/', {'type': 'csv'}).streaming_content)
+        Landmark.objects.all().delete()
+        response = self.client.post('/api/landmarks/import/', exported, content_type='text/csv')
+        self.assertEqual(response.json()['created'], 1)
+        landmark = Landmark.objects.get()
+        self.assertEqual((landmark.title, landmark.country, str(landmark.latitude)), ('Petra', 'Jordan', '30.328500'))
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as f:
+            f.write(json.dumps({'title': 'Petra'}) + '\n')
+        self.addCleanup(os.remove, f.name)
+        call_command('import_landmarks', f.name, self.user.email, stdout=StringIO())
+        self.assertTrue(Landmark.objects.filter(title='Petra', user=self.user).exists())
+
+
+class ImportImageTests(MediaTestMixin, LandmarkAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.mine = default_storage.save('landmarks/mine.jpg', make_image())
+        self.create_landmark('Acropolis', cover_image=self.mine)
+        self.victim = User.objects.create_user(email='victim@example.com', username='victim')
+        self.theirs = default_storage.save('landmarks/theirs.jpg', make_image())
+        self.create_landmark('Petra', cover_image=self.theirs, user=self.victim)
+
+    def test_only_own_cover_images_can_be_referenced(self):
+        body = '\n'.join(json.dumps(row) for row in [
+            {'title': 'Copy', 'cover_image': self.mine},
+            {'title': 'Stolen', 'cover_image': self.theirs},
+            {'title': 'Traversal', 'cover_image': '../db.sqlite3'},
+        ])
+        response = self.client.post('/api/landmarks/import/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200, response.content)
+        report = response.json()
+        self.assertEqual((report['created'], report['failed']), (1, 2))
+        self.assertEqual([error['line'] for error in report['errors']], [2, 3])
+        self.assertIn('cover_image', report['errors'][0]['errors'])
+        self.assertEqual(Landmark.objects.get(title='Copy').cover_image.name, self.mine)
+        self.assertFalse(Landmark.objects.filter(title='Stolen').exists())
+
+    def test_deleting_keeps_files_another_landmark_uses(self):
+        copy = self.create_landmark('Copy', cover_image=self.mine)
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk.delete_with_media(Landmark.objects.filter(pk=copy.pk))
+        self.assertTrue(default_storage.exists(self.mine))
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk.delete_with_media(Landmark.objects.filter(user=self.user))
+        self.assertFalse(default_storage.exists(self.mine))
+
+
+class BatchTests(MediaTestMixin, LandmarkAPITestCase):
+    def post_batch(self, operations, key=None, **files):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        if files:
+            return self.client.post('/api/landmarks/batch/', {'operations': json.dumps(operations), **files}, **headers)
+        return self.client.post('/api/landmarks/batch/', {'operations': operations}, format='json', **headers)
+
+    def test_applies_operations_in_order(self):
+        kept = self.create_landmark('Acropolis')
+        removed = self.create_landmark('Colosseum')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_batch([
+                {'op': 'create', 'ref': 'a', 'data': {'title': 'Petra'}},
+                {'op': 'create', 'data': {'title': 'Wadi Rum'}},
+                {'op': 'update', 'ref': 'a', 'data': {'country': 'Jordan'}},
+                {'op': 'update', 'id': kept.pk, 'data': {'title': 'Parthenon'}},
+                {'op': 'delete', 'id': removed.pk},
+            ])
+        self.assertEqual(response.status_code, 200, response.content)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], [201, 201, 200, 200, 204])
+        petra = Landmark.objects.get(title='Petra')
+        self.assertEqual((results[0]['id'], petra.country), (petra.pk, 'Jordan'))
+        self.assertEqual(results[2]['data']['country'], 'Jordan')
+        self.assertEqual(
+            set(Landmark.objects.values_list('title', flat=True)), {'Petra', 'Wadi Rum', 'Parthenon'}
+        )
+        # Aggregates and cached lists see the batch.
+        self.assertEqual(suggest.suggest(self.user.pk, 'wad')[0]['text'], 'Wadi Rum')
+        self.assertEqual(len(self.rows(self.client.get('/api/landmarks/'))), 3)
+
+    def test_failure_rolls_back_everything(self):
+        landmark = self.create_landmark('Acropolis')
+        response = self.post_batch([
+            {'op': 'create', 'data': {'title': 'Petra'}},
+            {'op': 'update', 'id': landmark.pk, 'data': {'title': 'x' * 300}},
+            {'op': 'delete', 'id': landmark.pk},
+        ])
+        self.assertEqual(response.status_code, 400)
+        body = response.json()
+        self.assertFalse(body['applied'])
+        self.assertEqual([result['status'] for result in body['results']], [424, 400, 424])
+        self.assertIn('title', body['results'][1]['errors'])
+        self.assertEqual(list(Landmark.objects.values_list('title', flat=True)), ['Acropolis'])
+
+    def test_failed_batches_leave_no_images_behind(self):
+        landmark = self.create_landmark('Acropolis')
+        response = self.post_batch([
+            {'op': 'create', 'data': {'title': 'Petra'}, 'image': 'first'},
+            {'op': 'update', 'id': landmark.pk, 'data': {}, 'image': 'second'},
+            {'op': 'delete', 'id': 12345},
+        ], first=make_image('petra.jpg'), second=make_image('acropolis.jpg'))
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'landmarks')), [])
+        self.assertFalse(Landmark.objects.get().cover_image)
+
+    def test_other_users_landmarks_are_not_found(self):
+        other = User.objects.create_user(email='other@example.com', username='other', password='pass')
+        landmark = self.create_landmark('Acropolis', user=other)
+        response = self.post_batch([{'op': 'delete', 'id': landmark.pk}])
+        self.assertEqual(response.json()['results'][0]['status'], 404)
+        self.assertTrue(Landmark.objects.filter(pk=landmark.pk).exists())
+
+    def test_rejects_malformed_batches(self):
+        self.assertEqual(self.post_batch([]).status_code, 400)
+        self.assertEqual(self.post_batch([{'op': 'upsert'}]).status_code, 400)
+        response = self.post_batch([{'op': 'create'}] * (batch.MAX_OPERATIONS + 1))
+        self.assertEqual(response.status_code, 400)
+
+    def test_images_as_multipart_parts(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_batch(
+                [{'op': 'create', 'data': {'title': 'Petra'}, 'image': 'photo'}], photo=make_image()
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        landmark = Landmark.objects.get()
+        self.assertTrue(default_storage.exists(landmark.cover_image.name))
+        self.assertEqual(len(landmark.cover_image_variants), 3)
+
+        response = self.post_batch([{'op': 'update', 'id': landmark.pk, 'data': {}, 'image': 'missing'}])
+        self.assertEqual(response.json()['results'][0]['errors'], {'image': ['No multipart part named missing']})
+
+    def test_idempotency_key_replays_the_response(self):
+        operations = [{'op': 'create', 'data': {'title': 'Petra'}}]
+        first = self.post_batch(operations, key='sync-1')
+        self.assertEqual(first.status_code, 200, first.content)
+        retry = self.post_batch(operations, key='sync-1')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Landmark.objects.count(), 1)
+
+        response = self.post_batch([{'op': 'create', 'data': {'title': 'Wadi Rum'}}], key='sync-1')
+        self.assertEqual(response.status_code, 422)
+
+    def test_reusing_a_key_for_another_image_of_the_same_size(self):
+        operations = [{'op': 'create', 'data': {'title': 'Petra'}, 'image': 'photo'}]
+        first = make_image()
+        other = SimpleUploadedFile('photo.jpg', bytes(reversed(first.read())), content_type='image/jpeg')
+        first.seek(0)
+        self.assertEqual(self.post_batch(operations, key='sync-4', photo=first).status_code, 200)
+        self.assertEqual(self.post_batch(operations, key='sync-4', photo=other).status_code, 422)
+
+    def test_replayed_image_urls_are_signed_afresh(self):
+        operations = [{'op': 'create', 'data': {'title': 'Petra'}, 'image': 'photo'}]
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.post_batch(operations, key='sync-3', photo=make_image())
+        self.assertEqual(first.status_code, 200, first.content)
+        later = media.url_window_start() + media.url_max_age() + 1
+        with mock.patch('time.time', return_value=later):
+            retry = self.post_batch(operations, key='sync-3', photo=make_image())
+            data = retry.json()['results'][0]['data']
+            self.assertNotEqual(data['cover_image'], first.json()['results'][0]['data']['cover_image'])
+            self.assertEqual(APIClient().get(data['cover_image']).status_code, 200)
+
+    def test_failed_batches_can_be_retried_with_the_same_key(self):
+        operations = [{'op': 'delete', 'id': 12345}]
+        self.assertEqual(self.post_batch(operations, key='sync-2').status_code, 400)
+        self.assertFalse(LandmarkBatch.objects.exists())
+        self.create_landmark('Acropolis', id=12345)
+        self.assertEqual(self.post_batch(operations, key='sync-2').status_code, 200)
+        self.assertFalse(Landmark.objects.exists())
+
+    def test_prune_command(self):
+        self.post_batch([{'op': 'create', 'data': {'title': 'Petra'}}], key='old')
+        LandmarkBatch.objects.update(created_at=timezone.now() - timedelta(days=30))
+        self.post_batch([{'op': 'create', 'data': {'title': 'Wadi Rum'}}], key='new')
+        call_command('prune_batches', stdout=StringIO())
+        self.assertEqual(list(LandmarkBatch.objects.values_list('idempotency_key', flat=True)), ['new'])
+
+
+class ResumableUploadTests(MediaTestMixin, LandmarkAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.landmark = self.create_landmark('Acropolis')
+        self.photo = make_photo(1).read()
+
+    def start(self, length=None, landmark=None):
+        metadata = ','.join(
+            f'{key} {base64.b64encode(str(value).encode()).decode()}'
+            for key, value in {'landmark': landmark or self.landmark.pk, 'filename': 'acropolis.jpg'}.items()
+        )
+        return self.client.post(
+            '/api/uploads/', HTTP_UPLOAD_LENGTH=str(length or len(self.photo)), HTTP_UPLOAD_METADATA=metadata
+        )
+
+    def send(self, location, offset, chunk, checksum=None):
+        headers = {'HTTP_UPLOAD_OFFSET': str(offset)}
+        if checksum:
+            headers['HTTP_UPLOAD_CHECKSUM'] = checksum
+        return self.client.patch(location, chunk, content_type=uploads.CONTENT_TYPE, **headers)
+
+    def test_upload_in_chunks_attaches_cover_image(self):
+        response = self.start()
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual((response['Upload-Offset'], response['Tus-Resumable']), ('0', '1.0.0'))
+        location = response['Location']
+
+        middle = len(self.photo) // 2
+        response = self.send(location, 0, self.photo[:middle])
+        self.assertEqual((response.status_code, response['Upload-Offset']), (204, str(middle)))
+        # The connection dropped; the client asks where to resume.
+        response = self.client.head(location)
+        self.assertEqual(response['Upload-Offset'], str(middle))
+        self.landmark.refresh_from_db()
+        self.assertFalse(self.landmark.cover_image)
+
+        digest = base64.b64encode(hashlib.sha1(self.photo[middle:]).digest()).decode()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.send(location, middle, self.photo[middle:], f'sha1 {digest}')
+        self.assertEqual((response.status_code, response['Upload-Offset']), (204, str(len(self.photo))))
+        self.landmark.refresh_from_db()
+        with default_storage.open(self.landmark.cover_image.name) as f:
+            self.assertEqual(f.read(), self.photo)
+        self.assertEqual(len(self.landmark.cover_image_variants), 3)
+        self.assertTrue(self.client.get(location).json()['complete'])
+        self.assertEqual(os.listdir(uploads.upload_dir()), [])
+
+    def test_wrong_offset_and_checksum_are_rejected(self):
+        location = self.start()['Location']
+        response = self.send(location, 10, self.photo[10:20])
+        self.assertEqual((response.status_code, response['Upload-Offset']), (409, '0'))
+
+        digest = base64.b64encode(hashlib.sha256(b'other').digest()).decode()
+        response = self.send(location, 0, self.photo[:100], f'sha256 {digest}')
+        self.assertEqual(response.status_code, 460)
+        self.assertEqual(self.client.head(location)['Upload-Offset'], '0')
+        self.assertEqual(os.path.getsize(uploads.partial_path(UploadSession.objects.get())), 0)
+
+        response = self.send(location, 0, self.photo + b'extra')
+        self.assertEqual(response.status_code, 413)
+        response = self.client.patch(location, self.photo, content_type='application/octet-stream', HTTP_UPLOAD_OFFSET='0')
+        self.assertEqual(response.status_code, 415)
+
+    def test_rejects_bad_sessions(self):
+        other = User.objects.create_user(email='other@example.com', username='other', password='pass')
+        self.assertEqual(self.start(landmark=self.create_landmark('Petra', user=other).pk).status_code, 404)
+        self.assertEqual(self.start(length=uploads.max_size() + 1).status_code, 413)
+        location = self.start()['Location']
+        other_client = APIClient()
+        other_client.force_authenticate(other)
+        self.assertEqual(other_client.head(location).status_code, 404)
+
+    def test_not_an_image(self):
+        location = self.start(length=10)['Location']
+        self.assertEqual(self.send(location, 0, b'0123456789').status_code, 422)
+        self.assertFalse(UploadSession.objects.exists())
+        self.landmark.refresh_from_db()
+        self.assertFalse(self.landmark.cover_image)
+
+    def test_expired_uploads_are_pruned(self):
+        location = self.start()['Location']
+        self.send(location, 0, self.photo[:100])
+        session = UploadSession.objects.get()
+        UploadSession.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self.send(location, 100, self.photo[100:]).status_code, 410)
+        jobs.work(burst=True)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(uploads.partial_path(session)))
+
+    def test_replacing_an_image_replaces_its_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/landmarks/{self.landmark.pk}/upload_image/', {'image': make_image(color=(0, 0, 0))})
+        self.landmark.refresh_from_db()
+        old = images.variant_names(self.landmark.cover_image_variants)
+        self.assertTrue(old)
+        # Variant jobs run eagerly, but only once the completing request's transaction commits.
+        with mock.patch.object(images, 'schedule_variants'), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.send(self.start()['Location'], 0, self.photo).status_code, 204)
+        self.landmark.refresh_from_db()
+        self.assertIsNone(self.landmark.cover_image_variants)
+        self.assertFalse(any(default_storage.exists(name) for name in old))
+
+    def test_orphan_removed_by_another_worker_is_skipped(self):
+        os.makedirs(uploads.upload_dir(), exist_ok=True)
+        orphan = os.path.join(uploads.upload_dir(), 'orphan.part')
+        open(orphan, 'wb').close()
+        getmtime = os.path.getmtime
+
+        def removed_meanwhile(path):
+            if path == orphan:
+                os.remove(path)
+            return getmtime(path)
+        with mock.patch('os.path.getmtime', side_effect=removed_meanwhile):
+            self.assertEqual(uploads.prune_uploads(now=timezone.now() + timedelta(days=2)), 0)
+
+    def test_completing_saves_only_the_cover_image(self):
+        location = self.start()['Location']
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.send(location, 0, self.photo).status_code, 204)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "landmarks_landmark"')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('"title"', updates[0])
+        self.assertIn('"cover_image"', updates[0])
+
+    def test_terminate(self):
+        location = self.start()['Location']
+        self.assertEqual(self.client.delete(location).status_code, 204)
+        self.assertEqual(self.client.head(location).status_code, 404)
+        self.assertEqual(os.listdir(uploads.upload_dir()), [])
+
+
+class LandmarkListPageTests(LandmarkAPITestCase):
+    def cards(self, response):
+        self.assertEqual(response.status_code, 200)
+        return re.findall(r'<h5 class="card-title">(.*?)</h5>', response.content.decode())
+
+    def load_more_url(self, response):
+        match = re.search(r'data-load-more="([^"]+)"', response.content.decode())
+        return match and html.unescape(match.group(1))
+
+    def test_pages_through_every_landmark(self):
+        for index in range(30):
+            self.create_landmark(f'Landmark {index:02}')
+        response = self.client.get('/')
+        first = self.cards(response)
+        self.assertEqual(first, [f'Landmark {index:02}' for index in range(29, 5, -1)])
+
+        response = self.client.get(self.load_more_url(response))
+        self.assertTemplateNotUsed(response, 'landmarks/landmark_list.html')
+        self.assertEqual(self.cards(response), [f'Landmark {index:02}' for index in range(5, -1, -1)])
+        self.assertIsNone(self.load_more_url(response))
+
+    def test_cards_are_cached_until_the_landmark_changes(self):
+        landmark = self.create_landmark('Acropolis')
+        self.assertEqual(self.cards(self.client.get('/')), ['Acropolis'])
+        with self.assertNumQueries(1):
+            self.client.get('/')
+
+        # A write that leaves updated_at alone isn't noticed...
+        Landmark.objects.filter(pk=landmark.pk).update(title='Stale')
+        self.assertEqual(self.cards(self.client.get('/')), ['Acropolis'])
+        # ...a save is.
+        landmark.refresh_from_db()
+        landmark.title = 'Parthenon'
+        landmark.save()
+        self.assertEqual(self.cards(self.client.get('/')), ['Parthenon'])
+
+    def test_cover_images_are_shown_only_to_their_owner(self):
+        variant = 'landmarks/variants/acropolis.0123456789ab.480w.jpg'
+        landmark = self.create_landmark('Acropolis', cover_image='landmarks/acropolis.jpg')
+        Landmark.objects.filter(pk=landmark.pk).update(cover_image_variants={
+            '160': {'jpeg': 'landmarks/variants/acropolis.0123456789ab.160w.jpg'}, '480': {'jpeg': variant},
+        })
+        body = self.client.get('/').content.decode()
+        self.assertIn('Acropolis', body)
+        self.assertNotIn('/media/', body)
+
+        self.client.force_login(self.user)
+        body = html.unescape(self.client.get('/').content.decode())
+        self.assertIn(f'src="{media.signed_url(variant, self.user.pk)}"', body)
+        stranger = User.objects.create_user(email='s@example.com', username='s')
+        self.client.force_login(stranger)
+        self.assertNotIn('/media/', self.client.get('/').content.decode())
+
+    def test_search_and_category_filters(self):
+        self.create_landmark('Petra', description='Rock-cut city', category='HISTORICAL')
+        self.create_landmark('Wadi Rum', description='Desert valley', category='NATURAL')
+        self.create_landmark('Dead Sea', category='NATURAL')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.cards(self.client.get('/', {'search': 'desert'})), ['Wadi Rum'])
+        # Filtered only: pages are in created order, so nothing is ranked or excerpted.
+        self.assertFalse([query for query in queries if 'bm25' in query['sql'] or 'snippet(' in query['sql']])
+        self.assertEqual(self.cards(self.client.get('/', {'category': 'NATURAL'})), ['Dead Sea', 'Wadi Rum'])
+
+    def test_filters_carry_over_to_the_next_page(self):
+        for index in range(26):
+            self.create_landmark(f'Natural {index}', category='NATURAL')
+            self.create_landmark(f'Other {index}', category='OTHER')
+        response = self.client.get('/', {'category': 'NATURAL'})
+        response = self.client.get(self.load_more_url(response))
+        self.assertEqual(self.cards(response), ['Natural 1', 'Natural 0'])
+
+    def test_bad_cursor(self):
+        self.assertEqual(self.client.get('/', {'after': 'bm90IGEgY3Vyc29y'}).status_code, 400)
+
+
+class LandmarkAdminTests(MediaTestMixin, LandmarkAPITestCase):
+    url = '/admin/landmarks/landmark/'
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser(email='admin@example.com', username='admin', password='pass')
+        self.client.force_login(self.admin)
+
+    def changelist(self, params=None):
+        response = self.client.get(self.url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def action(self, name, landmarks, **data):
+        return self.client.post(self.url, {
+            'action': name, 'index': 0, '_selected_action': [landmark.pk for landmark in landmarks], **data,
+        })
+
+    def test_changelist_skips_full_counts_and_distinct_scans(self):
+        self.create_landmark('Petra', country='Jordan')
+        self.create_landmark('Acropolis', country='Greece')
+        changelist = self.changelist().context['cl']
+        self.assertEqual(changelist.result_count, 2)
+        countries = [choice['display'] for choice in changelist.filter_specs[1].choices(changelist)]
+        self.assertEqual(countries, ['All', 'Greece', 'Jordan'])
+        with CaptureQueriesContext(connection) as captured:
+            self.changelist()
+        statements = ' '.join(query['sql'] for query in captured).upper()
+        self.assertNotIn('COUNT(', statements)
+        self.assertNotIn('DISTINCT', statements)
+
+    def test_filtered_counts_are_bounded(self):
+        for index in range(5):
+            self.create_landmark(f'Landmark {index}', category='NATURAL')
+        with override_settings(LANDMARK_ADMIN_COUNT_LIMIT=3):
+            response = self.changelist({'category': 'NATURAL'})
+            self.assertEqual(response.context['cl'].result_count, 3)
+            self.assertContains(response, '3+ landmarks')
+            self.assertContains(self.changelist({'q': 'landmark'}), '3+ results')
+        with override_settings(LANDMARK_ADMIN_COUNT_LIMIT=5):
+            response = self.changelist({'category': 'NATURAL'})
+        self.assertContains(response, '5 landmarks')
+        self.assertNotContains(response, '5+')
+
+    def test_search_uses_full_text_index(self):
+        self.create_landmark('Petra', description='Rock-cut city')
+        self.create_landmark('Wadi Rum', description='Desert valley')
+        with CaptureQueriesContext(connection) as captured:
+            response = self.changelist({'q': 'desert'})
+        self.assertEqual([landmark.title for landmark in response.context['cl'].result_list], ['Wadi Rum'])
+        self.assertIn('MATCH', ' '.join(query['sql'] for query in captured))
+
+    def test_reassign_owner_and_recategorize(self):
+        other = User.objects.create_user(email='other@example.com', username='other', password='pass')
+        petra = self.create_landmark('Petra', category='HISTORICAL')
+        rum = self.create_landmark('Wadi Rum')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.action('reassign_owner', [petra, rum], owner='OTHER@example.com')
+        self.assertEqual(set(Landmark.objects.values_list('user_id', flat=True)), {other.pk})
+        self.assertEqual(
+            set(LandmarkTombstone.objects.values_list('landmark_id', 'user_id')), {(petra.pk, self.user.pk), (rum.pk, self.user.pk)}
+        )
+        self.assertEqual(suggest.suggest(other.pk, 'pet')[0]['text'], 'Petra')
+
+        self.action('recategorize', [petra, rum], category='NATURAL')
+        self.assertEqual(set(Landmark.objects.values_list('category', flat=True)), {'NATURAL'})
+        self.assertEqual(bulk.recategorize(Landmark.objects.all(), 'OTHER', chunk_size=1), 2)
+
+        self.action('reassign_owner', [petra], owner='nobody@example.com')
+        self.assertEqual(Landmark.objects.get(pk=petra.pk).user_id, other.pk)
+
+    def test_delete_with_media(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/landmarks/', {'title': 'Acropolis', 'cover_image': make_image()})
+        landmark = Landmark.objects.get(pk=response.json()['id'])
+        kept = self.create_landmark('Petra')
+        files = [landmark.cover_image.name, *images.variant_names(landmark.cover_image_variants)]
+        self.assertTrue(all(default_storage.exists(name) for name in files))
+
+        response = self.action('delete_with_media', [landmark])
+        self.assertContains(response, 'Delete 1 landmark together with')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, {'action': 'delete_with_media', '_selected_action': [landmark.pk], 'post': 'yes'})
+        self.assertEqual(list(Landmark.objects.values_list('pk', flat=True)), [kept.pk])
+        self.assertFalse(any(default_storage.exists(name) for name in files))
+        self.assertFalse(LandmarkImageHash.objects.exists())
+        self.assertTrue(LandmarkTombstone.objects.filter(landmark_id=landmark.pk).exists())
+        self.assertEqual(self.titles(self.client.get('/api/landmarks/')), ['Petra'])
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b''):
+        self.status_code = status_code
+        self.content = content
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = responses
+        self.requested = []
+
+    def get(self, url, timeout=None):
+        self.requested.append(url)
+        outcome = self.responses[url].pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class PopulateLandmarksTests(MediaTestMixin, LandmarkAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.source = os.path.join(self.media_root, 'landmarks.jsonl')
+        with open(self.source, 'w') as f:
+            for i, url in enumerate(['http://img/ok', 'http://img/flaky', 'http://img/missing', None]):
+                f.write(json.dumps({'title': f'Landmark {i}', 'latitude': 10 + i, 'longitude': 20, 'image_url': url}) + '\n')
+            f.write('{broken\n')
+        self.jpeg = make_image().read()
+
+    def populate(self, responses):
+        session = FakeSession(responses)
+        with mock.patch.object(PopulateCommand, 'create_session', return_value=session), \
+                mock.patch.object(PopulateCommand, 'sleep') as sleep:
+            call_command('populate_landmarks', self.source, user=self.user.email, batch_size=2, stdout=StringIO())
+        return session, sleep
+
+    def test_downloads_with_backoff_and_resumes(self):
+        session, sleep = self.populate({
+            'http://img/ok': [FakeResponse(200, self.jpeg)],
+            'http://img/flaky': [requests.ConnectionError('reset'), FakeResponse(503), FakeResponse(200, self.jpeg)],
+            'http://img/missing': [FakeResponse(404)],
+        })
+        self.assertEqual(len(sleep.call_args_list), 2)
+        self.assertLess(sleep.call_args_list[0].args[0], sleep.call_args_list[1].args[0])
+        landmarks = {landmark.title: landmark for landmark in Landmark.objects.filter(user=self.user)}
+        self.assertEqual(len(landmarks), 4)
+        self.assertTrue(landmarks['Landmark 0'].cover_image)
+        self.assertTrue(landmarks['Landmark 1'].cover_image)
+        self.assertFalse(landmarks['Landmark 2'].cover_image)
+
+        # A second run only consults the checkpoint: no downloads, no duplicates.
+        session, _ = self.populate({})
+        self.assertEqual(session.requested, [])
+        self.assertEqual(Landmark.objects.count(), 4)
+
+    def test_rows_already_in_the_table_are_not_duplicated(self):
+        self.create_landmark('Landmark 0', 10, 20)
+        session, _ = self.populate({
+            'http://img/flaky': [FakeResponse(200, self.jpeg)],
+            'http://img/missing': [FakeResponse(404)],
+        })
+        self.assertNotIn('http://img/ok', session.requested)
+        self.assertEqual(Landmark.objects.filter(title='Landmark 0').count(), 1)
+        self.assertEqual(Landmark.objects.count(), 4)
+
+
+@override_settings(LANDMARK_METRICS_TOKEN='scrape-token')
+class MetricsTests(LandmarkAPITestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.registry.reset()
+        self.create_landmark('Petra')
+
+    def scrape(self):
+        return self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token').content.decode()
+
+    def test_records_requests_queries_and_serializer_time(self):
+        self.client.get('/api/landmarks/')
+        body = self.scrape()
+        self.assertIn('landmarks_http_requests_total{method="GET",status="200",view="landmark-list"} 1', body)
+        self.assertIn('landmarks_http_request_duration_seconds_count{view="landmark-list"} 1', body)
+        self.assertIn('landmarks_db_queries_per_request_bucket{view="landmark-list",le="+Inf"} 1', body)
+        self.assertIn('landmarks_serializer_duration_seconds_count{view="landmark-list"} 1', body)
+        self.assertIn('# TYPE landmarks_http_response_bytes histogram', body)
+        queries = [line for line in body.splitlines() if line.startswith('landmarks_db_queries_per_request_sum{view="landmark-list"}')]
+        self.assertGreater(float(queries[0].split()[-1]), 0)
+
+    def write_snapshot(self, directory, pid, count, instance='earlier'):
+        with open(os.path.join(directory, f'metrics-{pid}.json'), 'w') as f:
+            json.dump({'instance': instance, 'samples': [
+                ['landmarks_http_requests_total', [['method', 'GET'], ['status', 200], ['view', 'landmark-list']], count],
+            ]}, f)
+
+    def test_merges_snapshots_from_all_processes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.write_snapshot(directory, os.getppid(), 4)
+        with override_settings(LANDMARK_METRICS_DIR=directory):
+            self.client.get('/api/landmarks/')
+            body = self.scrape()
+        self.assertIn('landmarks_http_requests_total{method="GET",status="200",view="landmark-list"} 5', body)
+        self.assertTrue(os.path.exists(os.path.join(directory, f'metrics-{os.getppid()}.json')))
+
+    def test_dead_processes_are_folded_into_the_aggregate(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.write_snapshot(directory, 999999, 4)
+        with override_settings(LANDMARK_METRICS_DIR=directory):
+            self.scrape()
+            self.assertFalse(os.path.exists(os.path.join(directory, 'metrics-999999.json')))
+            self.write_snapshot(directory, 999999, 2)
+            self.client.get('/api/landmarks/')
+            body = self.scrape()
+        self.assertIn('landmarks_http_requests_total{method="GET",status="200",view="landmark-list"} 7', body)
+
+    def test_reused_pid_does_not_overwrite_counters(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        metrics.registry.claimed_pid = None
+        self.write_snapshot(directory, os.getpid(), 4)
+        with override_settings(LANDMARK_METRICS_DIR=directory):
+            self.client.get('/api/landmarks/')
+            body = self.scrape()
+        self.assertIn('landmarks_http_requests_total{method="GET",status="200",view="landmark-list"} 5', body)
+
+    @override_settings(LANDMARK_METRICS_TOKEN=None)
+    def test_requires_staff_or_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(LANDMARK_METRICS_TOKEN='scrape-token'):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        staff = User.objects.create_user(email='staff@example.com', username='staff', password='pass', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+class FastSerializerTests(MediaTestMixin, LandmarkAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_landmark('Eiffel Tower', 48.8584, 2.2945, category='HISTORICAL', country='France',
+                             description='Wrought-iron\u2028lattice "tower"\n\u00e9\x01 <b>')
+        self.create_landmark('Louvre', Decimal('48.86'), 2.3376, cover_image_variants={'160': {'jpeg': 'landmarks/variants/l.160w.jpg'}})
+        self.create_landmark('Nowhere', description='')
+        for i in range(5):
+            self.create_landmark(f'Tower {i}', 40 + i, -3.5 - i, category='OTHER')
+        Landmark.objects.filter(title='Louvre').update(cover_image='landmarks/louvre.jpg')
+        self.create_landmark('Someone else', 48.0, 2.0, user=User.objects.create_user(email='o@example.com', username='o'))
+
+    def fetch(self, path, params=None, fast=True):
+        get_response_cache().clear()
+        with override_settings(LANDMARK_FAST_SERIALIZER=fast):
+            response = self.client.get(path, params or {})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def assertSameBytes(self, path, params=None):
+        slow = self.fetch(path, params, fast=False)
+        fast = self.fetch(path, params)
+        self.assertEqual(fast.content, slow.content)
+        self.assertEqual(fast['Content-Type'], slow['Content-Type'])
+        return fast
+
+    def test_list_and_detail_match_serializer_output(self):
+        response = self.assertSameBytes('/api/landmarks/')
+        self.assertIn(b'\\u2028', response.content)
+        self.assertSameBytes('/api/landmarks/', {'paginate': 'false'})
+        first = self.assertSameBytes('/api/landmarks/', {'page_size': 3}).json()
+        self.assertSameBytes(first['next'])
+        for landmark in Landmark.objects.filter(user=self.user):
+            self.assertSameBytes(f'/api/landmarks/{landmark.pk}/')
+
+    def test_filters_distance_and_search_match_serializer_output(self):
+        self.assertSameBytes('/api/landmarks/', {'near': '48.85,2.29', 'page_size': 2})
+        self.assertSameBytes('/api/landmarks/', {'near': '48.85,2.29', 'nearest': 3})
+        self.assertSameBytes('/api/landmarks/', {'search': 'tower', 'page_size': 2})
+        self.assertSameBytes('/api/landmarks/', {'category': 'OTHER', 'bbox': '-10,35,10,50'})
+        with timezone.override('America/Lima'):
+            self.assertSameBytes('/api/landmarks/')
+
+    def test_missing_detail_is_404(self):
+        other = Landmark.objects.get(title='Someone else')
+        self.assertEqual(self.client.get(f'/api/landmarks/{other.pk}/').status_code, 404)
+        self.assertEqual(self.client.get('/api/landmarks/abc/').status_code, 404)
+
+    def test_list_query_count_does_not_grow_with_rows(self):
+        self.fetch('/api/landmarks/')
+        with CaptureQueriesContext(connection) as small:
+            self.fetch('/api/landmarks/')
+        for i in range(20):
+            self.create_landmark(f'Extra {i}')
+        with CaptureQueriesContext(connection) as large:
+            self.fetch('/api/landmarks/')
+        self.assertEqual(len(large), len(small))
+
+    def test_renderer_matches_json_renderer(self):
+        from rest_framework.renderers import JSONRenderer
+        data = {
+            'when': datetime(2024, 1, 2, 3, 4, 5, 6000, tzinfo=dt_timezone.utc), 'amount': Decimal('1.50'),
+            'lazy': gettext_lazy('Other'), 'big': 2 ** 70, 'text': 'a\u2029b\x1f\u00fc', 'nested': [{'x': None}],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+        self.assertEqual(FastJSONRenderer().render(data, 'application/json; indent=2'),
+                         JSONRenderer().render(data, 'application/json; indent=2'))
+
+
+class ResponseFormatTests(LandmarkAPITestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(12):
+            self.create_landmark(f'Tower {i}', 40 + i, -3.5, category='OTHER', country='Spain',
+                                 description='A long description of a tower. ' * 3)
+        self.create_landmark('Louvre', cover_image_variants={'160': {'jpeg': 'landmarks/variants/l.160w.jpg'}})
+
+    def test_columnar_lists_hold_the_same_values(self):
+        rows = self.client.get('/api/landmarks/', {'paginate': 'false'}).json()
+        response = self.client.get('/api/landmarks/', {'paginate': 'false'}, HTTP_ACCEPT=ColumnarJSONRenderer.media_type)
+        self.assertEqual(response['Content-Type'], ColumnarJSONRenderer.media_type)
+        data = response.json()
+        self.assertEqual(data['count'], len(rows))
+        self.assertEqual(data['columns']['title'], [row['title'] for row in rows])
+        self.assertEqual(data['columns']['user.email'], [self.user.email] * len(rows))
+        self.assertEqual(data['columns']['cover_image_variants.160'][0], rows[0]['cover_image_variants']['160'])
+        self.assertIsNone(data['columns']['cover_image_variants.160'][1])
+        self.assertNotIn('user', data['columns'])
+        self.assertLess(len(response.content), len(self.client.get('/api/landmarks/', {'paginate': 'false'}).content))
+
+        page = self.client.get('/api/landmarks/', {'page_size': 5, 'format': 'columnar'}).json()
+        self.assertEqual(page['results']['count'], 5)
+        self.assertIn('next', page)
+        landmark = Landmark.objects.filter(user=self.user).first()
+        detail = self.client.get(f'/api/landmarks/{landmark.pk}/', {'format': 'columnar'}).json()
+        self.assertEqual(detail['title'], landmark.title)
+
+    def test_to_columns_passes_other_lists_through(self):
+        self.assertEqual(to_columns([1, 2]), [1, 2])
+        self.assertEqual(to_columns([]), {'count': 0, 'columns': {}})
+        self.assertEqual(to_columns([{'a': 1}, {'a': 2, 'b': {'c': 3}}]), {
+            'count': 2, 'columns': {'a': [1, 2], 'b.c': [None, 3]},
+        })
+
+    @skipUnless(msgpack, 'msgpack is not installed')
+    def test_msgpack_matches_json(self):
+        rows = self.client.get('/api/landmarks/').json()
+        response = self.client.get('/api/landmarks/', HTTP_ACCEPT=MessagePackRenderer.media_type)
+        self.assertEqual(response['Content-Type'], MessagePackRenderer.media_type)
+        self.assertEqual(msgpack.unpackb(response.content), rows)
+
+    def test_cached_lists_are_compressed_once(self):
+        plain = self.client.get('/api/landmarks/')
+        self.assertNotIn('Content-Encoding', plain)
+        get_response_cache().clear()
+        with mock.patch.object(compression, 'compress', wraps=compression.compress) as compress:
+            first = self.client.get('/api/landmarks/', HTTP_ACCEPT_ENCODING='br;q=0.5, gzip')
+            second = self.client.get('/api/landmarks/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compress.call_count, 1)
+        for response in (first, second):
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(gzip.decompress(response.content), plain.content)
+            self.assertEqual(response['Content-Length'], str(len(response.content)))
+            self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(first['ETag'], f'W/{plain["ETag"]}')
+        self.assertEqual(self.client.get('/api/landmarks/', HTTP_ACCEPT_ENCODING='gzip',
+                                         HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        # Cached before compression was asked for: compressed on the first hit, then reused.
+        get_response_cache().clear()
+        self.client.get('/api/landmarks/', {'page_size': 20})
+        with mock.patch.object(compression, 'compress', wraps=compression.compress) as compress:
+            for _ in range(2):
+                response = self.client.get('/api/landmarks/', {'page_size': 20}, HTTP_ACCEPT_ENCODING='gzip')
+                self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(compress.call_count, 1)
+
+    def test_small_or_unwanted_bodies_stay_plain(self):
+        landmark = Landmark.objects.filter(user=self.user).first()
+        self.assertNotIn('Content-Encoding', self.client.get(f'/api/landmarks/{landmark.pk}/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertNotIn('Content-Encoding', self.client.get('/api/landmarks/', HTTP_ACCEPT_ENCODING='gzip;q=0, identity'))
+        with override_settings(LANDMARK_RESPONSE_COMPRESSION=False):
+            self.assertNotIn('Content-Encoding', self.client.get('/api/landmarks/', HTTP_ACCEPT_ENCODING='gzip'))
+
+    def test_accept_encoding_negotiation(self):
+        self.assertEqual(compression.accepted_encodings('gzip;q=0.8, br, *;q=0'), {'gzip': 0.8, 'br': 1.0, '*': 0.0})
+        request = mock.Mock(META={'HTTP_ACCEPT_ENCODING': 'deflate, *'})
+        self.assertEqual(compression.negotiate(request), compression.available_encodings()[0])
+        request.META['HTTP_ACCEPT_ENCODING'] = 'deflate'
+        self.assertIsNone(compression.negotiate(request))
+
+
+class ClusterTests(LandmarkAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.eiffel = self.create_landmark('Eiffel Tower', 48.8584, 2.2945, category='HISTORICAL')
+        self.louvre = self.create_landmark('Louvre', 48.8606, 2.3376, category='CULTURAL')
+        self.colosseum = self.create_landmark('Colosseum', 41.8902, 12.4922, category='HISTORICAL')
+        self.create_landmark('Nowhere')
+
+    def grid(self):
+        return sorted(
+            (cell.user_id, cell.level, cell.x, cell.y, cell.category, cell.count,
+             round(cell.sum_latitude, 6), round(cell.sum_longitude, 6))
+            for cell in LandmarkGridCell.objects.all()
+        )
+
+    def assertGridConsistent(self):
+        incremental = self.grid()
+        clusters.rebuild()
+        self.assertEqual(incremental, self.grid())
+
+    def test_grid_follows_saves_and_deletes(self):
+        self.assertEqual(LandmarkGridCell.objects.filter(level=0).get(category='HISTORICAL').count, 2)
+        self.assertGridConsistent()
+        self.eiffel.latitude, self.eiffel.longitude = 40.4168, -3.7038
+        self.eiffel.save()
+        self.louvre.category = 'OTHER'
+        self.louvre.save()
+        self.colosseum.delete()
+        nowhere = Landmark.objects.get(title='Nowhere')
+        nowhere.latitude, nowhere.longitude = -33.8568, 151.2153
+        nowhere.save()
+        self.assertGridConsistent()
+        other = User.objects.create_user(email='other@example.com', username='other', password='pass')
+        self.louvre.user = other
+        self.louvre.save()
+        self.assertGridConsistent()
+        self.assertEqual(LandmarkGridCell.objects.filter(user=other, level=0).get().count, 1)
+
+    def test_bulk_writes_update_grid(self):
+        report = bulk.import_rows([(1, {'title': 'Petra', 'latitude': '30.3285', 'longitude': '35.4444'}, None)], self.user)
+        self.assertEqual(report['created'], 1)
+        Landmark.objects.create(title='Orphan', latitude=10, longitude=10)
+        call_command('assign_landmarks', self.user.email, stdout=StringIO())
+        self.assertEqual(LandmarkGridCell.objects.filter(user=self.user, level=0).aggregate(n=Sum('count'))['n'], 5)
+        self.assertGridConsistent()
+
+    def test_world_view_merges_nearby_landmarks(self):
+        response = self.client.get('/api/landmarks/clusters/', {'zoom': 0})
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        self.assertEqual(data['level'], 2)
+        self.assertEqual(data['total'], 3)
+        [cluster] = data['clusters']
+        self.assertEqual(cluster['count'], 3)
+        self.assertEqual(cluster['categories'], {'HISTORICAL': 2, 'CULTURAL': 1})
+        self.assertAlmostEqual(cluster['latitude'], (48.8584 + 48.8606 + 41.8902) / 3, places=5)
+
+    def test_zooming_in_splits_clusters(self):
+        data = self.client.get('/api/landmarks/clusters/', {'zoom': 14, 'bbox': '2.2,48.8,2.4,48.9'}).json()
+        self.assertEqual(data['level'], 16)
+        self.assertEqual([cluster['count'] for cluster in data['clusters']], [1, 1])
+        data = self.client.get('/api/landmarks/clusters/', {'zoom': 14, 'bbox': '2.2,48.8,2.4,48.9', 'category': 'CULTURAL'}).json()
+        self.assertEqual(len(data['clusters']), 1)
+        self.assertEqual(data['clusters'][0]['latitude'], 48.8606)
+
+    def test_wide_view_at_high_zoom_uses_coarser_level(self):
+        data = self.client.get('/api/landmarks/clusters/', {'zoom': 14, 'bbox': '-10,35,20,55'}).json()
+        self.assertLess(data['level'], 16)
+        self.assertEqual(data['total'], 3)
+
+    def test_query_count_does_not_depend_on_landmarks(self):
+        with CaptureQueriesContext(connection) as few:
+            self.client.get('/api/landmarks/clusters/', {'zoom': 3})
+        synthetic.generate_landmarks(200, [self.user])
+        get_response_cache().clear()
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get('/api/landmarks/clusters/', {'zoom': 3})
+        self.assertEqual(response.json()['total'], 203)
+        self.assertEqual(len(few), len(many))
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/api/landmarks/clusters/').status_code, 400)
+        self.assertEqual(self.client.get('/api/landmarks/clusters/', {'zoom': 30}).status_code, 400)
+        self.assertEqual(self.client.get('/api/landmarks/clusters/', {'zoom': 3, 'bbox': '1,2,3'}).status_code, 400)
+
+
+class FacetTests(LandmarkAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.eiffel = self.create_landmark('Eiffel Tower', 48.8584, 2.2945, category='HISTORICAL', country='France')
+        self.create_landmark('Louvre', 48.8606, 2.3376, category='CULTURAL', country='France')
+        self.create_landmark('Colosseum', 41.8902, 12.4922, category='HISTORICAL', country='Italy')
+        self.create_landmark('Mystery')
+        Landmark.objects.filter(title='Colosseum').update(created_at=datetime(2023, 5, 17, tzinfo=dt_timezone.utc))
+        facets.rebuild([self.user.pk])
+        self.month = timezone.now().strftime('%Y-%m')
+
+    def stored(self):
+        return sorted(LandmarkFacetCount.objects.values_list('user_id', 'facet', 'value', 'count'))
+
+    def test_unfiltered_counts_come_from_the_materialized_table(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/landmarks/facets/')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertFalse(any('landmarks_landmark"' in query['sql'] for query in queries.captured_queries))
+        data = response.json()
+        self.assertEqual(data['count'], 4)
+        self.assertEqual(data['facets']['category'], [
+            {'value': 'HISTORICAL', 'count': 2}, {'value': None, 'count': 1}, {'value': 'CULTURAL', 'count': 1},
+        ])
+        self.assertEqual(data['facets']['country'][0], {'value': 'France', 'count': 2})
+        self.assertEqual(data['facets']['created_month'], [
+            {'value': self.month, 'count': 3}, {'value': '2023-05', 'count': 1},
+        ])
+
+    def test_filtered_counts_match_the_filtered_list(self):
+        data = self.client.get('/api/landmarks/facets/', {'country': 'France'}).json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['facets']['country'], [{'value': 'France', 'count': 2}])
+        data = self.client.get('/api/landmarks/facets/', {'search': 'colosseum'}).json()
+        self.assertEqual(data['facets']['created_month'], [{'value': '2023-05', 'count': 1}])
+        data = self.client.get('/api/landmarks/facets/', {'bbox': '0,40,10,50', 'category': 'HISTORICAL'}).json()
+        self.assertEqual(data['count'], 1)
+
+    def test_table_follows_writes(self):
+        self.eiffel.category = 'OTHER'
+        self.eiffel.save()
+        Landmark.objects.get(title='Mystery').delete()
+        bulk.import_rows([(1, {'title': 'Petra', 'country': 'Jordan', 'category': 'HISTORICAL'}, None)], self.user)
+        Landmark.objects.create(title='Orphan', country='Peru')
+        call_command('assign_landmarks', self.user.email, stdout=StringIO())
+        incremental = self.stored()
+        facets.rebuild()
+        self.assertEqual(incremental, self.stored())
+        data = self.client.get('/api/landmarks/facets/').json()
+        self.assertEqual(data['count'], 5)
+        self.assertIn({'value': 'Peru', 'count': 1}, data['facets']['country'])
+        self.assertEqual(data, self.client.get('/api/landmarks/facets/', {'title__icontains': ''}).json())
+
+
+class AuthCacheTests(LandmarkAPITestCase):
+    def setUp(self):
+        super().setUp()
+        user_cache.clear()
+        self.landmark = self.create_landmark('Eiffel Tower')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def user_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/landmarks/{self.landmark.pk}/')
+        return response.status_code, sum('FROM "landmarks_user"' in query['sql'] for query in queries.captured_queries)
+
+    def test_users_are_loaded_once_per_token(self):
+        metrics.registry.reset()
+        self.assertEqual(self.user_queries(), (200, 1))
+        self.assertEqual(self.user_queries(), (200, 0))
+        self.assertEqual((user_cache.hits, user_cache.misses), (1, 1))
+        self.assertIn('landmarks_auth_cache_total{result="hit"} 1', metrics.render_prometheus(metrics.collect()))
+        # Another token of the same user is another entry.
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.assertEqual(self.user_queries(), (200, 1))
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertEqual(self.user_queries()[0], 401)
+
+    def test_saving_or_deleting_the_user_invalidates(self):
+        self.user_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.user_queries()[0], 401)
+        self.user.is_active = True
+        self.user.save()
+        self.assertEqual(self.user_queries(), (200, 1))
+        self.user.delete()
+        self.assertEqual(self.user_queries()[0], 401)
+
+    def test_expiry_size_and_stale_loads(self):
+        with override_settings(LANDMARK_AUTH_CACHE_TTL=0):
+            self.user_queries()
+            self.assertEqual(self.user_queries(), (200, 1))
+        with override_settings(LANDMARK_AUTH_CACHE_SIZE=0):
+            self.user_queries()
+            self.assertEqual(self.user_queries(), (200, 1))
+        with override_settings(LANDMARK_AUTH_CACHE_SIZE=1):
+            user_cache.set(('x', 'a'), self.user, 0)
+            user_cache.set(('y', 'b'), self.user, 0)
+            self.assertEqual(list(user_cache.entries), [('y', 'b')])
+        # Loaded before an invalidation: not cached.
+        generation = user_cache.generation(str(self.user.pk))
+        user_cache.invalidate(self.user.pk)
+        user_cache.set((str(self.user.pk), 'c'), self.user, generation)
+        self.assertIsNone(user_cache.get((str(self.user.pk), 'c')))
+
+
+class SuggestTests(LandmarkAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.eiffel = self.create_landmark('Eiffel Tower', country='France')
+        self.create_landmark('Eiffel Tower', country='France')
+        self.create_landmark('Eiffel Bridge', country='Portugal')
+        self.create_landmark('São Paulo Cathedral', country='Brazil')
+        self.create_landmark('Palace of Versailles', country='France')
+        other = User.objects.create_user(email='other@example.com', username='other', password='pass')
+        self.create_landmark('Eiffel Replica', country='China', user=other)
+
+    def suggestions(self, query, **params):
+        response = self.client.get('/api/landmarks/suggest/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [(row['text'], row['field'], row['count']) for row in response.json()['suggestions']]
+
+    def test_prefix_typo_and_accent_matches(self):
+        self.assertEqual(self.suggestions('eif'), [('Eiffel Tower', 'title', 2), ('Eiffel Bridge', 'title', 1)])
+        self.assertEqual(self.suggestions('eifel tow')[0], ('Eiffel Tower', 'title', 2))
+        self.assertEqual(self.suggestions('sao pau'), [('São Paulo Cathedral', 'title', 1)])
+        self.assertEqual(self.suggestions('Fra'), [('France', 'country', 3)])
+        self.assertIn(('Palace of Versailles', 'title', 1), self.suggestions('versai'))
+        self.assertEqual(self.suggestions('eif', limit=1), [('Eiffel Tower', 'title', 2)])
+        self.assertEqual(self.suggestions('  '), [])
+        self.assertEqual(self.client.get('/api/landmarks/suggest/', {'q': 'eif', 'limit': 'x'}).status_code, 400)
+
+    def test_index_follows_writes_without_rebuilding(self):
+        self.suggestions('eif')
+        build = mock.patch.object(suggest, 'build_index', wraps=suggest.build_index).start()
+        self.addCleanup(mock.patch.stopall)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.eiffel.title = 'Tour Eiffel'
+            self.eiffel.save()
+            self.create_landmark('Eiffel Tower Replica', country='Japan')
+            Landmark.objects.get(title='Eiffel Bridge').delete()
+            bulk.import_rows([(1, {'title': 'Eiffelsberg', 'country': 'Germany'}, None)], self.user)
+        self.assertEqual(self.suggestions('eif'), [
+            ('Eiffel Tower', 'title', 1), ('Eiffel Tower Replica', 'title', 1), ('Eiffelsberg', 'title', 1),
+            ('Tour Eiffel', 'title', 1),
+        ])
+        self.assertEqual(self.suggestions('jap'), [('Japan', 'country', 1)])
+        self.assertEqual(self.suggestions('portu'), [])
+        build.assert_not_called()
+        with CaptureQueriesContext(connection) as queries:
+            self.suggestions('eif')
+        self.assertEqual(len(queries), 1)
+
+    def write_elsewhere(self):
+        # Another process's write: no signal here, but the collection version moves.
+        Landmark.objects.filter(title='Eiffel Bridge').update(title='Ponte Eiffel')
+        LandmarkCollectionVersion.objects.filter(user=self.user).update(version=F('version') + 1)
+
+    def test_writes_from_elsewhere_rebuild_the_index(self):
+        self.suggestions('eif')
+        self.write_elsewhere()
+        self.assertIn(('Ponte Eiffel', 'title', 1), self.suggestions('eif'))
+        self.assertNotIn(('Eiffel Bridge', 'title', 1), self.suggestions('eif'))
+
+    def test_own_write_after_one_from_elsewhere_still_rebuilds(self):
+        self.suggestions('eif')
+        self.write_elsewhere()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_landmark('Eiffel Tower Replica', country='Japan')
+        suggestions = self.suggestions('eif')
+        self.assertIn(('Ponte Eiffel', 'title', 1), suggestions)
+        self.assertIn(('Eiffel Tower Replica', 'title', 1), suggestions)
+        self.assertNotIn(('Eiffel Bridge', 'title', 1), suggestions)
+
+
+@override_settings(LANDMARK_READ_REPLICAS=['replica1'])
+class ReplicaRouterTests(SimpleTestCase):
+    def test_replicas_are_used_only_for_replica_reads(self):
+        router = routers.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Landmark))
+        with routers.replica_reads():
+            self.assertEqual(router.db_for_read(Landmark), 'replica1')
+        self.assertEqual(router.db_for_write(Landmark), 'default')
+        self.assertFalse(router.allow_migrate('replica1', 'landmarks'))
+        self.assertIsNone(router.allow_migrate('default', 'landmarks'))
+
+
+@override_settings(LANDMARK_READ_REPLICAS=['replica1'])
+class ReplicaRoutingTests(LandmarkAPITestCase):
+    def setUp(self):
+        super().setUp()
+        routers.pin_cache().clear()
+        self.addCleanup(routers.pin_cache().clear)
+        self.landmark = self.create_landmark('Petra', 30.3285, 35.4444)
+        self.reads = []
+
+        def record(router, model, **hints):
+            if model is Landmark:
+                self.reads.append(routers.reading_from_replica())
+            return None
+
+        patcher = mock.patch.object(routers.ReplicaRouter, 'db_for_read', autospec=True, side_effect=record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_go_to_replica_until_the_user_writes(self):
+        self.client.get('/api/landmarks/')
+        self.assertTrue(self.reads and all(self.reads))
+        self.reads.clear()
+        response = self.client.post('/api/landmarks/', {'title': 'Wadi Rum'})
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(any(self.reads))
+        self.client.get(f'/api/landmarks/{self.landmark.pk}/')
+        self.assertTrue(self.reads)
+        self.assertFalse(any(self.reads))
+        self.assertFalse(routers.reading_from_replica())
+
+        routers.pin_cache().delete(routers.pin_key(self.user.pk))
+        get_response_cache().clear()
+        self.reads.clear()
+        self.client.get(f'/api/landmarks/{self.landmark.pk}/')
+        self.assertTrue(self.reads and all(self.reads))
+
+    def test_failed_writes_do_not_pin(self):
+        self.assertEqual(self.client.patch('/api/landmarks/0/', {'title': 'Gone'}).status_code, 404)
+        self.assertFalse(routers.is_pinned(self.user.pk))
+
+
+class PooledSQLiteBackendTests(SimpleTestCase):
+    def setUp(self):
+        from backend.db.sqlite3.base import DatabaseWrapper, close_pools
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.addCleanup(close_pools)
+        settings_dict = dict(connection.settings_dict, NAME=os.path.join(directory, 'pool.sqlite3'),
+                             OPTIONS={'pool_size': 1, 'pragmas': {'cache_size': -1000}})
+        self.make_wrapper = lambda: DatabaseWrapper(settings_dict, alias='pooltest')
+
+    def test_pragmas_are_applied(self):
+        wrapper = self.make_wrapper()
+        with wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -1000)
+        wrapper.close()
+
+    def test_closed_connections_are_reused(self):
+        first, second = self.make_wrapper(), self.make_wrapper()
+        first.ensure_connection()
+        second.ensure_connection()
+        raw = first.connection
+        first.close()
+        second.close()  # the pool only keeps one idle connection
+        third = self.make_wrapper()
+        third.ensure_connection()
+        self.assertIs(third.connection, raw)
+        with third.cursor() as cursor:
+            cursor.execute('PRAGMA foreign_keys')
+            self.assertEqual(cursor.fetchone()[0], 1)
+        third.close()
+
+    def test_open_transactions_are_rolled_back_before_reuse(self):
+        wrapper = self.make_wrapper()
+        with wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (x INTEGER)')
+        wrapper.set_autocommit(False)
+        with wrapper.cursor() as cursor:
+            cursor.execute('INSERT INTO t VALUES (1)')
+        wrapper.close()
+        again = self.make_wrapper()
+        with again.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM t')
+            self.assertEqual(cursor.fetchone()[0], 0)
+        again.close()
+
+    def test_connections_closed_inside_atomic_are_not_pooled(self):
+        wrapper = self.make_wrapper()
+        wrapper.ensure_connection()
+        wrapper.set_autocommit(False)
+        wrapper.in_atomic_block = True
+        raw = wrapper.connection
+        wrapper.close()
+        self.assertEqual(wrapper.pool.idle, [])
+        with self.assertRaises(sqlite3.ProgrammingError):
+            raw.execute('SELECT 1')
+
+
+class AsyncViewTests(LandmarkAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_landmark('Eiffel Tower', 48.8584, 2.2945, category='HISTORICAL', country='France',
+                             description='Wrought-iron\u2028lattice tower')
+        for i in range(5):
+            self.create_landmark(f'Tower {i}', 40 + i, -3.5 - i, category='OTHER')
+        self.create_landmark('Nowhere')
+        self.other = self.create_landmark('Someone else', 48.0, 2.0, user=User.objects.create_user(email='o@example.com', username='o'))
+
+    def assertSameList(self, params=None):
+        expected = self.client.get('/api/landmarks/', {**(params or {}), 'paginate': 'false'})
+        response = self.client.get('/api/async/landmarks/', params or {})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response), expected.content)
+        self.assertEqual(response['Content-Type'], expected['Content-Type'])
+
+    def test_list_and_search_match_sync_viewset(self):
+        self.assertSameList()
+        self.assertSameList({'search': 'tower'})
+        self.assertSameList({'near': '48.85,2.29', 'nearest': 3})
+        self.assertSameList({'category': 'OTHER', 'bbox': '-10,35,10,50'})
+        self.assertSameList({'search': 'nothing-matches'})
+
+    def test_list_is_streamed_in_chunks(self):
+        with mock.patch.object(async_views, 'CHUNK_SIZE', 2):
+            response = self.client.get('/api/async/landmarks/')
+            chunks = list(response)
+        self.assertEqual(len(chunks), 6)
+        self.assertEqual(len(json.loads(b''.join(chunks))), 7)
+
+    def test_detail_matches_sync_viewset(self):
+        for landmark in Landmark.objects.filter(user=self.user):
+            response = self.client.get(f'/api/async/landmarks/{landmark.pk}/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, self.client.get(f'/api/landmarks/{landmark.pk}/').content)
+        response = self.client.get(f'/api/async/landmarks/{self.other.pk}/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'detail': 'Not found.'})
+
+    def test_errors_match_drf(self):
+        self.assertEqual(self.client.post('/api/async/landmarks/').status_code, 405)
+        self.assertEqual(self.client.get('/api/async/landmarks/', {'nearest': 0}).status_code, 400)
+        anonymous = APIClient().get('/api/async/landmarks/')
+        self.assertEqual(anonymous.status_code, 401)
+        self.assertEqual(anonymous.json(), APIClient().get('/api/landmarks/').json())
+        self.assertEqual(anonymous['WWW-Authenticate'], 'Bearer realm="api"')
+
+    async def test_async_client_with_jwt(self):
+        metrics.registry.reset()
+        client = AsyncClient()
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        response = await client.get('/api/async/landmarks/', {'search': 'eiffel'}, headers=headers)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual([row['title'] for row in json.loads(body)], ['Eiffel Tower'])
+        self.assertEqual(body.count(b'<mark>'), 1)
+        response = await client.get(f'/api/async/landmarks/{self.other.pk}/', headers=headers)
+        self.assertEqual(response.status_code, 404)
+        body = metrics.render_prometheus(metrics.collect())
+        self.assertIn('landmarks_http_requests_total{method="GET",status="200",view="async-landmark-list"} 1', body)
+
+
+class BenchmarkTests(TestCase):
+    def test_generated_dataset_is_reproducible(self):
+        users = synthetic.create_users(3)
+        self.assertEqual(synthetic.create_users(3), users)
+        synthetic.generate_landmarks(40, users, seed=7, batch_size=15)
+        first = list(Landmark.objects.order_by('id').values_list('title', 'latitude', 'user_id'))
+        Landmark.objects.all().delete()
+        synthetic.generate_landmarks(40, users, seed=7)
+        self.assertEqual(list(Landmark.objects.order_by('id').values_list('title', 'latitude', 'user_id')), first)
+
+    def test_percentile_uses_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmarks.percentile(values, 50), 50)
+        self.assertEqual(benchmarks.percentile(values, 99), 99)
+        self.assertEqual(benchmarks.percentile([5], 95), 5)
+
+    def test_api_suite_reports_every_scenario(self):
+        users = synthetic.create_users(2)
+        synthetic.generate_landmarks(30, users)
+        results = benchmarks.api_suite(users, requests=3, cold=True)
+        self.assertEqual(set(results), {'list', 'search', 'filter', 'bbox', 'clusters', 'facets', 'suggest', 'web_list', 'detail', 'create'})
+        for name, stats in results.items():
+            self.assertEqual(stats['requests'], 3)
+            self.assertGreater(stats['queries']['mean'], 0, name)
+            self.assertLessEqual(stats['latency_ms']['p50'], stats['latency_ms']['p99'])
+        self.assertEqual(results['detail']['statuses'], {'200': 3})
+        self.assertEqual(results['create']['statuses'], {'201': 3})
+
+    def test_formats_suite_compares_sizes_with_json(self):
+        users = synthetic.create_users(1)
+        synthetic.generate_landmarks(30, users)
+        results = benchmarks.formats_suite(users, requests=2)
+        self.assertEqual(results['json_identity']['size_vs_json'], 1)
+        self.assertLess(results['json_gzip']['size_vs_json'], 0.5)
+        self.assertLess(results['columnar_identity']['size_vs_json'], 1)
+        for stats in results.values():
+            self.assertEqual(stats['statuses'], {'200': 2})
+            self.assertIn('p50', stats['cached_cpu_ms'])
+
+    def test_auth_suite_saves_the_user_query(self):
+        users = synthetic.create_users(2)
+        synthetic.generate_landmarks(20, users)
+        results = benchmarks.auth_suite(users, requests=5)
+        for name in ('list', 'detail'):
+            self.assertEqual(results[f'{name}_cached']['statuses'], {'200': 5})
+            self.assertGreaterEqual(results[f'{name}_savings']['queries_per_request'], 0.8)
+            self.assertGreater(results[f'{name}_cached']['auth_cache_hit_rate'], 0.5)
+
+    def test_concurrency_suite_compares_sync_and_async_views(self):
+        users = synthetic.create_users(2)
+        synthetic.generate_landmarks(30, users)
+        # Like the test client: keep the test transaction's connection open between requests.
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+        results = benchmarks.concurrency_suite(users, requests=4, levels=(1, 3))
+        for name in ('list', 'search', 'detail'):
+            for mode in ('sync', 'async'):
+                stats = results[f'{name}_{mode}_c3']
+                self.assertEqual(stats['requests'], 4)
+                self.assertEqual(stats['statuses'], {'200': 4}, name)
+                self.assertLessEqual(stats['time_to_first_byte_ms']['p50'], stats['latency_ms']['max'])
+            self.assertEqual(results[f'{name}_sync_c1']['response_bytes_mean'], results[f'{name}_async_c1']['response_bytes_mean'])
+            self.assertIn('throughput', results[f'{name}_c3_speedup'])
@@ -0,0 +1,237 @@
+"""Resumable cover image uploads, following the tus 1.0 protocol (https://tus.io).
+
+    POST   /api/uploads/        Upload-Length, Upload-Metadata: landmark <b64>,filename <b64>
+    HEAD   /api/uploads/<id>/   -> Upload-Offset: bytes received so far
+    PATCH  /api/uploads/<id>/   Upload-Offset, Content-Type: application/offset+octet-stream,
+                                optional Upload-Checksum: sha1|sha256|md5 <b64 digest>
+    DELETE /api/uploads/<id>/   abandons the upload
+
+Chunks are streamed from the request straight into a partial file under
+``LANDMARK_UPLOAD_DIR`` and synced before the offset is recorded, so after a
+dropped connection the client asks for the offset and sends the rest. A chunk
+whose checksum doesn't match is discarded. Once the last byte arrives the file
+is checked to be an image, moved into media storage and saved as the
+landmark's cover image (variants etc. follow as for any other image change).
+
+Sessions expire ``LANDMARK_UPLOAD_EXPIRY`` after their last chunk; workers
+delete expired sessions and their partial files (see prune_uploads).
+"""
+import base64
+import binascii
+import hashlib
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image
+
+from .models import Landmark, UploadSession
+
+TUS_VERSION = '1.0.0'
+TUS_EXTENSIONS = 'creation,checksum,termination,expiration'
+CHECKSUM_ALGORITHMS = ('sha1', 'sha256', 'md5')
+CONTENT_TYPE = 'application/offset+octet-stream'
+READ_SIZE = 64 * 1024
+# A PATCH holding the lock longer than this is assumed to have died with its process.
+LOCK_TIMEOUT = timedelta(minutes=10)
+
+
+class UploadError(Exception):
+    """Refuse the request with ``status`` and ``message``."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def max_size():
+    return getattr(settings, 'LANDMARK_UPLOAD_MAX_SIZE', 50 * 1024 * 1024)
+
+
+def expiry():
+    return timedelta(hours=getattr(settings, 'LANDMARK_UPLOAD_EXPIRY_HOURS', 24))
+
+
+def upload_dir():
+    return getattr(settings, 'LANDMARK_UPLOAD_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'partial-uploads')
+
+
+def partial_path(session):
+    return os.path.join(upload_dir(), f'{session.pk}.part')
+
+
+def parse_metadata(header):
+    """``Upload-Metadata: key base64value,key2 base64value2`` as a dict of strings."""
+    metadata = {}
+    for pair in filter(None, (item.strip() for item in header.split(','))):
+        key, _, value = pair.partition(' ')
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode()
+        except (binascii.Error, UnicodeDecodeError):
+            raise UploadError(400, f'Upload-Metadata value of {key} is not base64')
+    return metadata
+
+
+def parse_checksum(header):
+    algorithm, _, digest = header.strip().partition(' ')
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise UploadError(400, f'Upload-Checksum algorithm must be one of {", ".join(CHECKSUM_ALGORITHMS)}')
+    try:
+        return algorithm, base64.b64decode(digest, validate=True)
+    except binascii.Error:
+        raise UploadError(400, 'Upload-Checksum digest is not base64')
+
+
+def create_session(user, length, metadata):
+    try:
+        length = int(length)
+    except (TypeError, ValueError):
+        raise UploadError(400, 'Upload-Length must be an integer')
+    if length <= 0:
+        raise UploadError(400, 'Upload-Length must be positive')
+    if length > max_size():
+        raise UploadError(413, f'Uploads are limited to {max_size()} bytes')
+    filename = os.path.basename(metadata.get('filename', '')) or 'upload'
+    try:
+        landmark = Landmark.objects.get(pk=int(metadata.get('landmark')), user=user)
+    except (TypeError, ValueError):
+        raise UploadError(400, 'Upload-Metadata needs the landmark id')
+    except Landmark.DoesNotExist:
+        raise UploadError(404, 'Landmark not found')
+
+    session = UploadSession.objects.create(
+        user=user, landmark=landmark, filename=filename[:255], length=length, expires_at=timezone.now() + expiry()
+    )
+    os.makedirs(upload_dir(), exist_ok=True)
+    open(partial_path(session), 'wb').close()
+    return session
+
+
+def lock(session, offset):
+    """Take the session's write lock if ``offset`` is where the upload stands; raises UploadError otherwise."""
+    now = timezone.now()
+    if session.expires_at <= now:
+        raise UploadError(410, 'Upload expired')
+    if session.completed_at is not None:
+        raise UploadError(409, 'Upload already complete')
+    claimed = UploadSession.objects.filter(
+        Q(locked_at__isnull=True) | Q(locked_at__lt=now - LOCK_TIMEOUT), pk=session.pk, offset=offset
+    ).update(locked_at=now)
+    if not claimed:
+        session.refresh_from_db()
+        if session.offset != offset:
+            raise UploadError(409, f'Upload-Offset is {session.offset}')
+        raise UploadError(423, 'Another request is writing to this upload')
+
+
+def append(session, offset, stream, checksum=None):
+    """Write the chunk in ``stream`` at ``offset``; returns the session with its new offset.
+
+    Without a checksum, whatever arrived before a dropped connection is kept
+    (tus semantics); with one, the chunk is kept only if it matches.
+    """
+    lock(session, offset)
+    path = partial_path(session)
+    received = offset
+    try:
+        with open(path, 'r+b') as f:
+            f.seek(offset)
+            digest = hashlib.new(checksum[0]) if checksum else None
+            remaining = session.length - offset
+            try:
+                while True:
+                    data = stream.read(READ_SIZE) if stream is not None else b''
+                    if not data:
+                        break
+                    if len(data) > remaining:
+                        raise UploadError(413, 'Chunk runs past Upload-Length')
+                    f.write(data)
+                    remaining -= len(data)
+                    if digest is not None:
+                        digest.update(data)
+            except OSError:
+                # Client went away mid-chunk.
+                if digest is not None:
+                    raise UploadError(400, 'Chunk incomplete')
+            except UploadError:
+                f.truncate(offset)
+                raise
+            if digest is not None and digest.digest() != checksum[1]:
+                f.truncate(offset)
+                raise UploadError(460, 'Checksum mismatch')
+            received = session.length - remaining
+            f.truncate(received)
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        UploadSession.objects.filter(pk=session.pk).update(
+            offset=received, locked_at=None, expires_at=timezone.now() + expiry()
+        )
+        session.refresh_from_db()
+    if session.offset == session.length:
+        complete(session)
+    return session
+
+
+class PartialFile(File):
+    # FileSystemStorage moves files that have a temporary path instead of copying them.
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def complete(session):
+    path = partial_path(session)
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except Exception:
+        discard(session)
+        raise UploadError(422, 'Upload is not a valid image')
+
+    landmark = Landmark.objects.get(pk=session.landmark_id)
+    with open(path, 'rb') as f:
+        landmark.cover_image.save(session.filename, PartialFile(f, name=session.filename), save=False)
+    # Only the image: a concurrent edit of the other fields must not be overwritten with what was loaded above.
+    # Saving still schedules variants like any other cover image change; the pre_save handler clears the
+    # old ones (deleted on commit), so that has to be written too.
+    landmark.save(update_fields=['cover_image', 'cover_image_variants', 'updated_at'])
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    session.completed_at = timezone.now()
+    session.save(update_fields=['completed_at'])
+
+
+def discard(session):
+    try:
+        os.remove(partial_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
+
+
+def prune_uploads(now=None):
+    """Delete expired sessions and partial files no session owns; returns the number of sessions deleted."""
+    now = now or timezone.now()
+    expired = list(UploadSession.objects.filter(expires_at__lt=now))
+    for session in expired:
+        discard(session)
+    directory = upload_dir()
+    if os.path.isdir(directory):
+        known = {f'{pk}.part' for pk in UploadSession.objects.values_list('pk', flat=True)}
+        cutoff = (now - expiry()).timestamp()
+        for name in os.listdir(directory):
+            if not name.endswith('.part') or name in known:
+                continue
+            path = os.path.join(directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                # Another worker's prune (or a completing upload) got there first.
+                pass
+    return len(expired)
@@ -1,12 +1,17 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import LandmarkViewSet, UserViewSet, RegisterUserView
+from . import async_views
+from .views import JobViewSet, LandmarkViewSet, UploadViewSet, UserViewSet, RegisterUserView
 
 router = DefaultRouter()
 router.register(r'landmarks', LandmarkViewSet)
 router.register(r'users', UserViewSet)
+router.register(r'jobs', JobViewSet, basename='job')
+router.register(r'uploads', UploadViewSet, basename='upload')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('users/', RegisterUserView.as_view(), name='register-user'),
+    path('async/landmarks/', async_views.landmark_list, name='async-landmark-list'),
+    path('async/landmarks/<int:pk>/', async_views.landmark_detail, name='async-landmark-detail'),
 ] 
\ No newline at end of file
@@ -1,11 +1,20 @@
 from django.shortcuts import render
-from rest_framework import viewsets, status, parsers, permissions
-from rest_framework.filters import SearchFilter
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
+from django.utils.http import http_date
+from rest_framework import viewsets, generics, status, parsers, permissions
 from rest_framework.response import Response
 from django_filters import rest_framework as filters
+from django.conf import settings
 from django.views.generic import ListView
-from .models import Landmark, User
-from .serializers import LandmarkSerializer, UserSerializer
+from rest_framework.renderers import BrowsableAPIRenderer
+from .models import Job, Landmark, LandmarkImageHash, UploadSession, User
+from .renderers import COMPACT_RENDERERS, FastJSONRenderer, MessagePackRenderer
+from .serializers import JobSerializer, LandmarkRowSerializer, LandmarkSerializer, UserSerializer, variant_urls
+from . import batch, bulk, clusters, duplicates, facets, media, search, spatial, suggest, sync, uploads
+from .caching import CachedReadMixin
+from .pagination import LandmarkCursorPagination, keyset_page
+from .routers import ReplicaReadMixin
 import logging
 from django.db.models import Q
 from rest_framework.decorators import action
@@ -17,14 +26,41 @@ logger = logging.getLogger(__name__)
 # Create your views here.
 
 class LandmarkFilter(filters.FilterSet):
+    # bbox=min_lon,min_lat,max_lon,max_lat (west,south,east,north)
+    bbox = spatial.CoordinateListFilter(method='filter_bbox', length=4)
+    # near=lat,lon orders by distance; radius (km) and nearest (N) narrow it down
+    near = spatial.CoordinateListFilter(method='filter_near', length=2)
+    radius = filters.NumberFilter(method='filter_noop', min_value=0)
+    nearest = filters.NumberFilter(method='filter_noop', min_value=1, max_value=1000)
+
     class Meta:
         model = Landmark
         fields = {
             'category': ['exact', 'icontains'],
+            'country': ['exact'],
             'title': ['exact', 'icontains'],
             'description': ['icontains'],
         }
 
+    def filter_noop(self, queryset, name, value):
+        return queryset
+
+    def filter_bbox(self, queryset, name, value):
+        return spatial.filter_bbox(queryset, *value)
+
+    def filter_near(self, queryset, name, value):
+        lat, lon = value
+        radius = self.form.cleaned_data.get('radius')
+        radius = float(radius) if radius is not None else None
+        count = self.form.cleaned_data.get('nearest')
+        if count is not None:
+            return spatial.nearest(queryset, lat, lon, int(count), radius_km=radius)
+        if radius is not None:
+            queryset = spatial.within_radius(queryset, lat, lon, radius)
+        else:
+            queryset = spatial.annotate_distance(queryset, lat, lon)
+        return queryset.order_by('distance', 'pk')
+
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -34,18 +70,111 @@ class UserViewSet(viewsets.ModelViewSet):
             return [AllowAny()]
         return [IsAuthenticated()]
 
-class LandmarkViewSet(viewsets.ModelViewSet):
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Status of the current user's background jobs, e.g. image variant generation."""
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+    filterset_fields = ['status', 'name']
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user).order_by('-created_at', '-id')
+
+class RegisterUserView(generics.CreateAPIView):
+    queryset = User.objects.all()
+    serializer_class = UserSerializer
+    permission_classes = [AllowAny]
+
+class UploadViewSet(viewsets.ViewSet):
+    """Resumable cover image uploads (tus 1.0); see landmarks.uploads."""
+    permission_classes = [IsAuthenticated]
+    # Chunks are read from the raw request stream, never through request.data.
+    parser_classes = ()
+
+    def get_session(self, pk):
+        try:
+            return UploadSession.objects.get(pk=pk, user=self.request.user)
+        except (UploadSession.DoesNotExist, ValueError, DjangoValidationError):
+            raise Http404
+
+    def tus_response(self, session=None, status_code=status.HTTP_204_NO_CONTENT, data=None):
+        response = Response(data, status=status_code)
+        response['Tus-Resumable'] = uploads.TUS_VERSION
+        response['Cache-Control'] = 'no-store'
+        if session is not None:
+            response['Upload-Offset'] = str(session.offset)
+            response['Upload-Length'] = str(session.length)
+            response['Upload-Expires'] = http_date(session.expires_at.timestamp())
+        return response
+
+    def error(self, e):
+        response = self.tus_response(status_code=e.status, data={'error': str(e)})
+        if e.status == 460:
+            response.reason_phrase = 'Checksum Mismatch'
+        return response
+
+    def options(self, request, *args, **kwargs):
+        response = self.tus_response()
+        response['Tus-Version'] = uploads.TUS_VERSION
+        response['Tus-Extension'] = uploads.TUS_EXTENSIONS
+        response['Tus-Max-Size'] = str(uploads.max_size())
+        response['Tus-Checksum-Algorithm'] = ','.join(uploads.CHECKSUM_ALGORITHMS)
+        return response
+
+    def create(self, request):
+        try:
+            metadata = uploads.parse_metadata(request.headers.get('Upload-Metadata', ''))
+            session = uploads.create_session(request.user, request.headers.get('Upload-Length'), metadata)
+        except uploads.UploadError as e:
+            return self.error(e)
+        response = self.tus_response(session, status.HTTP_201_CREATED, {
+            'id': str(session.pk), 'landmark': session.landmark_id, 'offset': session.offset, 'length': session.length,
+        })
+        response['Location'] = request.build_absolute_uri(f'{session.pk}/')
+        return response
+
+    def retrieve(self, request, pk=None):
+        session = self.get_session(pk)
+        return self.tus_response(session, status.HTTP_200_OK, {
+            'id': str(session.pk), 'landmark': session.landmark_id, 'offset': session.offset,
+            'length': session.length, 'complete': session.completed_at is not None,
+        })
+
+    def partial_update(self, request, pk=None):
+        session = self.get_session(pk)
+        if request.content_type.split(';')[0].strip() != uploads.CONTENT_TYPE:
+            return self.error(uploads.UploadError(415, f'Send chunks as {uploads.CONTENT_TYPE}'))
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return self.error(uploads.UploadError(400, 'Upload-Offset must be an integer'))
+        try:
+            checksum = request.headers.get('Upload-Checksum')
+            checksum = uploads.parse_checksum(checksum) if checksum else None
+            session = uploads.append(session, offset, request.stream, checksum)
+        except uploads.UploadError as e:
+            response = self.error(e)
+            if e.status == 409:
+                response['Upload-Offset'] = str(UploadSession.objects.get(pk=session.pk).offset)
+            return response
+        return self.tus_response(session)
+
+    def destroy(self, request, pk=None):
+        uploads.discard(self.get_session(pk))
+        return self.tus_response()
+
+class LandmarkViewSet(ReplicaReadMixin, CachedReadMixin, viewsets.ModelViewSet):
     queryset = Landmark.objects.all()
     serializer_class = LandmarkSerializer
-    filter_backends = [filters.DjangoFilterBackend, SearchFilter]
+    filter_backends = [filters.DjangoFilterBackend, search.FullTextSearchFilter]
     filterset_class = LandmarkFilter
     search_fields = ['title', 'description', 'category']
-    pagination_class = None  # Disable pagination for this endpoint
+    pagination_class = LandmarkCursorPagination
     parser_classes = (parsers.MultiPartParser, parsers.FormParser)
+    renderer_classes = (FastJSONRenderer, *COMPACT_RENDERERS, BrowsableAPIRenderer)
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Landmark.objects.filter(user=self.request.user)
+        return Landmark.objects.filter(user=self.request.user).select_related('user')
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -56,46 +185,12 @@ class LandmarkViewSet(viewsets.ModelViewSet):
         serializer.save(user=self.request.user)
 
     def create(self, request, *args, **kwargs):
+        # Image variants and other slow work run as background jobs (see landmarks.jobs);
+        # keep this path to validating and saving the row.
         try:
-            # Detailed request logging
-            logger.info("=== Request Debug Information ===")
-            logger.info(f"Request Method: {request.method}")
-            logger.info(f"Request Content-Type: {request.content_type}")
-            logger.info(f"Request Headers: {request.headers}")
-            logger.info(f"Request POST data: {request.POST}")
-            logger.info(f"Request data: {request.data}")
-            logger.info(f"Request FILES: {request.FILES}")
-            logger.info(f"Request FILES keys: {list(request.FILES.keys())}")
-            
-            if request.FILES:
-                for file_key in request.FILES:
-                    file = request.FILES[file_key]
-                    logger.info(f"File '{file_key}' details:")
-                    logger.info(f"  - Name: {file.name}")
-                    logger.info(f"  - Size: {file.size}")
-                    logger.info(f"  - Content Type: {file.content_type}")
-            else:
-                logger.warning("No files found in request.FILES")
-                if 'cover_image' in request.data:
-                    logger.info("Cover image found in request.data")
-                    logger.info(f"Cover image type: {type(request.data['cover_image'])}")
-                    logger.info(f"Cover image value: {request.data['cover_image']}")
-
-            # Create a mutable copy of the data
             data = request.data.copy()
-
-            # Handle image file
             if 'cover_image' in request.FILES:
-                logger.info("Cover image found in request.FILES")
                 data['cover_image'] = request.FILES['cover_image']
-                logger.info(f"Image file name: {request.FILES['cover_image'].name}")
-            elif 'cover_image' in request.data:
-                logger.info("Cover image found in request.data")
-                if hasattr(request.data['cover_image'], 'name'):
-                    data['cover_image'] = request.data['cover_image']
-                    logger.info(f"Image file name from data: {request.data['cover_image'].name}")
-            else:
-                logger.warning("No cover_image found in request")
 
             # Explicitly set empty coordinates to None
             if 'latitude' not in data or data['latitude'] in ['', None, '0.0']:
@@ -103,27 +198,16 @@ class LandmarkViewSet(viewsets.ModelViewSet):
             if 'longitude' not in data or data['longitude'] in ['', None, '0.0']:
                 data['longitude'] = None
 
-            # Create the serializer with the data
             serializer = self.get_serializer(data=data)
-            
-            # Log any validation errors
             if not serializer.is_valid():
-                logger.error(f"Validation errors: {serializer.errors}")
+                logger.info(f"Rejected landmark from user {request.user.pk}: {serializer.errors}")
                 return Response(
                     {'error': serializer.errors},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Save the landmark
-            landmark = self.perform_create(serializer)
-            logger.info(f"Landmark created successfully with id: {serializer.instance.id}")
-            
-            # Verify image after save
-            if serializer.instance.cover_image:
-                logger.info(f"Image saved successfully at: {serializer.instance.cover_image.path}")
-            else:
-                logger.warning("No image was saved with the landmark")
-
+            self.perform_create(serializer)
+            logger.info(f"Landmark {serializer.instance.id} created by user {request.user.pk}")
             return Response(
                 serializer.data,
                 status=status.HTTP_201_CREATED
@@ -141,32 +225,247 @@ class LandmarkViewSet(viewsets.ModelViewSet):
         if 'image' not in request.FILES:
             return Response({'error': 'No image provided'}, status=status.HTTP_400_BAD_REQUEST)
         
-        landmark.image = request.FILES['image']
+        landmark.cover_image = request.FILES['image']
         landmark.save()
         return Response({'message': 'Image uploaded successfully'}, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', sync.DEFAULT_LIMIT)), sync.MAX_LIMIT)
+            landmarks, deleted, next_token, has_more = sync.collect_changes(
+                request.user, request.query_params.get('since'), max(limit, 1)
+            )
+        except (ValueError, sync.InvalidToken) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except sync.ExpiredToken as e:
+            return Response({'error': str(e)}, status=status.HTTP_410_GONE)
+        return Response({
+            'changes': self.get_serializer(landmarks, many=True).data,
+            'deleted': deleted,
+            'next_token': next_token,
+            'has_more': has_more,
+            'media_expires_at': media.urls_expire_at(),
+        })
+
+    @action(detail=False, methods=['get'], url_path='media-urls')
+    def media_urls(self, request):
+        """Fresh image URLs for ``?ids=1,2,3``, for clients holding synced rows longer than the URLs live."""
+        try:
+            ids = [int(value) for value in request.query_params.get('ids', '').split(',') if value.strip()]
+        except ValueError:
+            return Response({'error': 'ids must be a comma separated list of landmark ids'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > sync.MAX_LIMIT:
+            return Response({'error': f'At most {sync.MAX_LIMIT} ids at a time'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = LandmarkRowSerializer(request)
+        rows = self.get_queryset().filter(pk__in=ids).order_by('pk').values('id', 'user_id', 'cover_image', 'cover_image_variants')
+        return Response({
+            'landmarks': [{
+                'id': row['id'],
+                'cover_image': serializer.file_url(row['cover_image'], row['user_id']),
+                'cover_image_variants': variant_urls(row['cover_image_variants'], row['user_id'], request),
+            } for row in rows],
+            'expires_at': media.urls_expire_at(),
+        })
+
+    @action(detail=False, methods=['get'])
+    def clusters(self, request):
+        form = clusters.ClusterQueryForm(request.query_params)
+        if not form.is_valid():
+            return Response({'error': form.errors}, status=status.HTTP_400_BAD_REQUEST)
+        params = form.cleaned_data
+        return self.cached_response(request, lambda: Response(
+            clusters.clusters(request.user, params['bbox'], params['zoom'], params['category'] or None)
+        ))
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        filter_params = set(LandmarkFilter.base_filters) | {search.FullTextSearchFilter.search_param}
+        if filter_params.isdisjoint(request.query_params):
+            return self.cached_response(request, lambda: Response(facets.stored_facets(request.user)))
+        return self.cached_response(request, lambda: Response(
+            facets.queryset_facets(self.filter_queryset(self.get_queryset()))
+        ))
+
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        """Typeahead: titles and countries of the user's landmarks matching ``q``, typos allowed."""
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', suggest.DEFAULT_LIMIT)), suggest.MAX_LIMIT)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'query': query, 'suggestions': suggest.suggest(request.user.pk, query, max(limit, 1))})
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """The user's other landmarks whose cover image is a near-copy of this one's."""
+        landmark = self.get_object()
+        try:
+            max_distance = int(request.query_params.get('distance', duplicates.DUPLICATE_DISTANCE))
+        except ValueError:
+            return Response({'error': 'distance must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 <= max_distance <= duplicates.MAX_DISTANCE:
+            return Response({'error': f'distance must be between 0 and {duplicates.MAX_DISTANCE}'}, status=status.HTTP_400_BAD_REQUEST)
+        value = LandmarkImageHash.objects.filter(landmark=landmark).values_list('hash', flat=True).first()
+        if value is None:
+            return Response({'error': 'The cover image has not been processed yet'}, status=status.HTTP_409_CONFLICT)
+
+        def build():
+            matches = duplicates.similar(request.user, value, max_distance, exclude=landmark.pk)
+            serializer = LandmarkRowSerializer(request)
+            rows = serializer.values(self.get_queryset().filter(pk__in=[match_pk for _, match_pk in matches]))
+            rows = {row['id']: row for row in rows}
+            results = [
+                {**serializer.to_representation(rows[match_pk]), 'image_distance': distance}
+                for distance, match_pk in matches if match_pk in rows
+            ]
+            return Response({'count': len(results), 'results': results})
+        return self.cached_response(request, build)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        export_type = request.query_params.get('type', 'ndjson')
+        if export_type not in ('ndjson', 'csv'):
+            return Response({'error': 'type must be ndjson or csv'}, status=status.HTTP_400_BAD_REQUEST)
+        rows = bulk.export_rows(self.filter_queryset(self.get_queryset()))
+        if export_type == 'csv':
+            response = StreamingHttpResponse(bulk.csv_lines(rows), content_type='text/csv; charset=utf-8')
+        else:
+            response = StreamingHttpResponse(bulk.ndjson_lines(rows), content_type='application/x-ndjson; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="landmarks.{export_type}"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_landmarks(self, request):
+        # Read the body line by line instead of through request.data so large
+        # uploads are never held in memory.
+        content_type = request.content_type.split(';')[0].strip()
+        if content_type == 'text/csv':
+            rows = bulk.parse_csv(request.stream or [])
+        elif content_type in ('application/x-ndjson', 'application/jsonl', 'application/json'):
+            rows = bulk.parse_ndjson(request.stream or [])
+        else:
+            return Response(
+                {'error': 'Send the body as application/x-ndjson or text/csv'},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            )
+        try:
+            batch_size = max(1, min(int(request.query_params.get('batch_size', bulk.DEFAULT_BATCH_SIZE)), 5000))
+        except ValueError:
+            return Response({'error': 'batch_size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        report = bulk.import_rows(rows, request.user, batch_size=batch_size)
+        return Response(report, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'],
+            parser_classes=(parsers.JSONParser, parsers.MultiPartParser, parsers.FormParser))
+    def batch(self, request):
+        try:
+            operations = batch.parse_operations(request.data)
+        except batch.BatchError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        idempotency_key = request.headers.get('Idempotency-Key', '').strip()
+        if len(idempotency_key) > 200:
+            return Response({'error': 'Idempotency-Key is at most 200 characters'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            status_code, body, replayed = batch.apply(operations, request.FILES, request, idempotency_key or None)
+        except batch.KeyReused:
+            return Response(
+                {'error': 'This Idempotency-Key was already used for a different batch'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        response = Response(body, status=status_code)
+        if replayed:
+            response['Idempotent-Replayed'] = 'true'
+        return response
+
+    def use_row_serializer(self):
+        # JSON and MessagePack reads skip model instances; the browsable API keeps the full serializer.
+        return getattr(settings, 'LANDMARK_FAST_SERIALIZER', True) and isinstance(
+            self.request.accepted_renderer, (FastJSONRenderer, MessagePackRenderer)
+        )
+
+    def fast_list(self, request):
+        serializer = LandmarkRowSerializer(request)
+        rows = serializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.many(page))
+        return Response(serializer.many(rows))
+
+    def fast_retrieve(self, request):
+        serializer = LandmarkRowSerializer(request)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = generics.get_object_or_404(
+            serializer.values(self.filter_queryset(self.get_queryset())),
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        self.check_object_permissions(request, row)
+        return Response(serializer.one(row))
+
     def list(self, request, *args, **kwargs):
         logger.info(f"Query params: {request.query_params}")
-        return super().list(request, *args, **kwargs)
+        if self.use_row_serializer():
+            return self.cached_response(request, lambda: self.fast_list(request))
+        return self.cached_response(request, lambda: super(LandmarkViewSet, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        if self.use_row_serializer():
+            return self.cached_response(request, lambda: self.fast_retrieve(request))
+        return self.cached_response(request, lambda: super(LandmarkViewSet, self).retrieve(request, *args, **kwargs))
 
 class LandmarkListView(ListView):
+    """Server-rendered landmark list, a page at a time.
+
+    Pages are keyset-paginated (no COUNT or OFFSET) and every card is a cached
+    template fragment keyed by the landmark's ``updated_at``, so rendering a
+    page costs one indexed query however large the table is. ``fragment=True``
+    renders just the cards and the next "load more" control, for the page's
+    lazy loading.
+    """
     model = Landmark
     template_name = 'landmarks/landmark_list.html'
+    fragment_template_name = 'landmarks/landmark_rows.html'
     context_object_name = 'landmarks'
+    page_size = 24
+    fragment = False
+
+    def get_template_names(self):
+        return [self.fragment_template_name if self.fragment else self.template_name]
 
     def get_queryset(self):
         queryset = Landmark.objects.all()
-        search = self.request.GET.get('search')
+        text = self.request.GET.get('search')
         category = self.request.GET.get('category')
 
-        if search:
-            queryset = queryset.filter(title__icontains=search)
+        if text:
+            if search.has_fts():
+                # Pages are in created order: no ranking or snippets to compute.
+                queryset = search.filter_matches(queryset, text)
+            else:
+                queryset = queryset.filter(title__icontains=text)
         if category:
             queryset = queryset.filter(category=category)
 
-        return queryset.order_by('-created_at')
+        return queryset
+
+    def get(self, request, *args, **kwargs):
+        try:
+            self.object_list, next_cursor = keyset_page(
+                self.get_queryset(), request.GET.get('after'), self.page_size
+            )
+        except ValueError:
+            return HttpResponseBadRequest('Invalid page cursor')
+        next_query = None
+        if next_cursor is not None:
+            params = request.GET.copy()
+            params['after'] = next_cursor
+            next_query = params.urlencode()
+        return self.render_to_response(self.get_context_data(next_query=next_query))
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['categories'] = Landmark.CATEGORY_CHOICES
+        context['fragment_cache'] = getattr(settings, 'LANDMARK_RESPONSE_CACHE', 'default')
+        context['fragment_cache_timeout'] = getattr(settings, 'LANDMARK_FRAGMENT_CACHE_TIMEOUT', 86400)
         return context